@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+自适应 RNP 对接：分轮运行并提前停止不可能进入前 K 名的 tRNA
+
+每个 RNP 的 nstruct 个 decoy 按轮次拆分为子任务（与 docking_scheduler.py init --split 相同的
+目录、标签和随机种子）。每一轮结束后：
+    1. 用 collect_scores.py 的 score_jd2 流程为新完成的子任务计算 score
+    2. 按 candidate_tRNAs_filter.py 的口径（每个 RNP 取 total_score 最小的 decoy，
+       再按 tRNA 在所有未排除的 aaRS 上取平均）计算每个 tRNA 的置信区间：
+           上界 = 当前各 RNP 最好 score 的平均（继续采样只会让最小值更小）
+           下界 = 各 RNP 的 (最好 score - z × decoy score 的稳健标准差) 的平均，
+                  已没有剩余 decoy 的 RNP 取最好 score
+    3. 前 K 名阈值取所有 tRNA 上界中的第 K 小值；下界仍高于阈值的 tRNA 已确定落在前 K 名之外，
+       其所有 RNP 不再安排后续轮次
+    4. 其余 tRNA 的 RNP 安排下一轮子任务
+
+全部轮次结束（或所有 tRNA 都已停止）后，合并每个 RNP 已完成的子任务为 default.out，
+输出 collect_scores.py 格式的 scores.csv 和 candidate_tRNAs_filter.py 格式的 tRNAs_score.csv。
+
+用法：
+    # 建立自适应对接任务（20 个 decoy 分 4 轮，保留前 20 名）
+    adaptive_docking.py init --input_dir work/rosetta/Bm_in_Bm --pdb_dir work/colabfold/Bm_aaRSs_output_pdb \\
+        --nstruct 20 --rounds 4 --top_k 20
+
+    # 本地运行全部轮次
+    adaptive_docking.py run --db work/rosetta/Bm_in_Bm/tasks.db --max_workers 32
+
+    # 在计算集群上：每轮用 docking_scheduler.py 提交，轮次结束后运行 step 安排下一轮
+    docking_scheduler.py run --db work/rosetta/Sf_in_Bm/tasks.db --backend slurm --max_workers 200 --submit
+    adaptive_docking.py step --db work/rosetta/Sf_in_Bm/tasks.db
+"""
+
+import os
+import json
+import argparse
+from dataclasses import dataclass, asdict
+import numpy as np
+import pandas as pd
+from docking_db import TaskDB, PENDING, RUNNING, DONE, FAILED
+from docking_scheduler import (
+    DEFAULT_NSTRUCT, BACKENDS, discover_tasks, split_task, pair_dir, merge_pair, update_cost_estimates,
+)
+from collect_scores import calculate_score, read_score_file, decoy_tags
+from candidate_tRNAs_filter import filter_candidate_trnas, load_blocked_proteins
+from score_matrix import split_sample_ids
+from logger_utils import setup_logger, get_logger
+
+CONFIG_SUFFIX = ".adaptive.json"
+
+# tRNA 状态
+ACTIVE = "active"
+STOPPED = "stopped"
+COMPLETE = "complete"
+
+# step 的结果
+WAITING = "waiting"
+SCHEDULED = "scheduled"
+FINISHED = "finished"
+
+# MAD 换算为正态分布标准差的系数
+MAD_SCALE = 1.4826
+
+
+@dataclass
+class AdaptiveConfig:
+    nstruct: int
+    rounds: int
+    top_k: int
+    z: float = 2.0
+    min_rounds: int = 1
+    block_list: str | None = None
+    out_dir: str | None = None
+
+    @staticmethod
+    def path(db_path):
+        return os.path.splitext(db_path)[0] + CONFIG_SUFFIX
+
+    def save(self, db_path):
+        with open(self.path(db_path), "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, db_path):
+        with open(cls.path(db_path), encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+
+def next_round_task(task, config):
+    """由某个 RNP 最近一轮的子任务生成下一轮的子任务"""
+    base = {
+        "rnp_id": task["pair_id"],
+        "pair_id": task["pair_id"],
+        "fasta": task["fasta"],
+        "secstruct": task["secstruct"],
+        "pdb": task["pdb"],
+        "sample_dir": pair_dir(task),
+        "log_file": os.path.join(os.path.dirname(task["log_file"]), f"{task['pair_id']}.log"),
+        "protein_length": task["protein_length"],
+        "rna_length": task["rna_length"],
+        "status": PENDING,
+    }
+    return split_task(base, config.nstruct, config.rounds)[task["part"]]
+
+
+def latest_parts(db):
+    """返回每个 RNP 最近一轮的子任务 {pair_id: task}"""
+    latest = {}
+    for task in db.tasks():
+        if task["part"] is not None and task["part"] >= latest.get(task["pair_id"], {"part": 0})["part"]:
+            latest[task["pair_id"]] = task
+    return latest
+
+
+def collect_decoy_scores(db, executor="thread", max_workers=None):
+    """
+    为已完成的子任务计算 score（已有 scores.sc 的跳过），返回所有 decoy 的 score
+
+    Returns:
+        pd.DataFrame: sample_id（即 pair_id）、part 和 scores.sc 中的各 score 项
+    """
+    logger = get_logger('adaptive_docking')
+    done = [task for task in db.tasks(DONE) if task["part"] is not None]
+    if not done:
+        return pd.DataFrame(columns=["sample_id", "part", "total_score"])
+
+    unscored = [task["sample_dir"] for task in done
+                if not os.path.exists(os.path.join(task["sample_dir"], "scores.sc"))]
+    if unscored:
+        root = os.path.commonpath(unscored)
+        calculate_score(root, [os.path.relpath(sample_dir, root) for sample_dir in unscored],
+                        executor=executor, max_workers=max_workers)
+
+    frames = []
+    for task in done:
+        score_path = os.path.join(task["sample_dir"], "scores.sc")
+        df = read_score_file(score_path) if os.path.exists(score_path) else None
+        if df is None:
+            logger.warning(f"{task['rnp_id']} 没有可用的 score，跳过")
+            continue
+        df["sample_id"] = task["pair_id"]
+        df["part"] = task["part"]
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["sample_id", "part", "total_score"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def robust_spread(scores):
+    """decoy score 的稳健标准差（MAD × 1.4826），不受个别严重碰撞的 decoy 影响"""
+    scores = np.asarray(scores, dtype=float)
+    if len(scores) < 2:
+        return np.nan
+    return MAD_SCALE * np.median(np.abs(scores - np.median(scores)))
+
+
+def trna_bounds(decoys, rounds_done, config, blocked_aaRSs=None):
+    """
+    计算每个 tRNA 平均 score 的置信区间
+
+    Args:
+        decoys (pd.DataFrame): collect_decoy_scores() 的返回值
+        rounds_done (dict): {pair_id: 已运行的轮数}
+        config (AdaptiveConfig): 自适应对接参数
+        blocked_aaRSs (set): 不参与统计的 aaRS ID
+
+    Returns:
+        pd.DataFrame: tRNA_id, mean_score（上界）, lower_bound, pairs, decoys
+    """
+    pairs = decoys.groupby("sample_id", observed=True)["total_score"].agg(
+        best="min", decoys="count", spread=robust_spread)
+    # 只有一个 decoy 或 decoy score 完全相同的 RNP 使用所有 RNP 的稳健标准差中位数
+    valid = pairs["spread"][pairs["spread"] > 0]
+    fallback = valid.median() if len(valid) else 0.0
+    pairs["spread"] = pairs["spread"].where(pairs["spread"] > 0, fallback)
+
+    remaining = np.array([rounds_done.get(pair_id, 0) < config.rounds for pair_id in pairs.index])
+    pairs["lower"] = np.where(remaining, pairs["best"] - config.z * pairs["spread"], pairs["best"])
+
+    ids = split_sample_ids(pairs.index.to_series())
+    pairs["aaRS_id"] = ids["aaRS_id"].to_numpy()
+    pairs["tRNA_id"] = ids["tRNA_id"].to_numpy()
+    if blocked_aaRSs:
+        pairs = pairs[~pairs["aaRS_id"].isin(blocked_aaRSs)]
+
+    stats = pairs.groupby("tRNA_id", observed=True).agg(
+        mean_score=("best", "mean"), lower_bound=("lower", "mean"),
+        pairs=("best", "count"), decoys=("decoys", "sum"))
+    stats = stats.reset_index()
+    stats["tRNA_id"] = stats["tRNA_id"].astype(object)
+    return stats.round(3).sort_values("mean_score")
+
+
+def top_k_threshold(stats, top_k):
+    """前 K 名阈值：第 K 小的上界（tRNA 不足 K 个时不停止任何 tRNA）"""
+    if len(stats) <= top_k:
+        return np.inf
+    return np.sort(stats["mean_score"].to_numpy())[top_k - 1]
+
+
+def step(db, config, executor="thread", max_workers=None):
+    """
+    当前轮次结束后，更新置信区间并安排下一轮子任务
+
+    Returns:
+        str: WAITING（当前轮次还有未完成的任务）、SCHEDULED（已安排下一轮）或 FINISHED（对接结束）
+    """
+    logger = get_logger('adaptive_docking')
+    counts = db.counts()
+    if counts[PENDING] or counts[RUNNING]:
+        logger.info(f"当前轮次尚未结束: {counts}")
+        return WAITING
+    if counts[FAILED]:
+        logger.warning(f"有 {counts[FAILED]} 个子任务失败，这些 RNP 在本轮的 decoy 不计入统计"
+                       f"（可用 docking_scheduler.py run --retry_failed 重试后再运行 step）")
+
+    latest = latest_parts(db)
+    rounds_done = {pair_id: task["part"] for pair_id, task in latest.items()}
+    current_round = max(rounds_done.values(), default=0)
+
+    blocked_aaRSs = load_blocked_proteins(config.block_list) or set()
+    decoys = collect_decoy_scores(db, executor, max_workers)
+    stats = trna_bounds(decoys, rounds_done, config, blocked_aaRSs)
+
+    # 每个 tRNA 的轮数取其 RNP 中的最大值：提前停止的 tRNA 的所有 RNP 都停在同一轮
+    pair_trnas = split_sample_ids(pd.Series(list(rounds_done)))["tRNA_id"].astype(object).to_numpy()
+    trna_rounds = pd.Series(list(rounds_done.values()), index=pair_trnas).groupby(level=0).max()
+    stats["rounds"] = stats["tRNA_id"].map(trna_rounds).astype(int)
+
+    threshold = top_k_threshold(stats, config.top_k)
+    running = (stats["rounds"] == current_round) & (current_round < config.rounds)
+    stop = running & (stats["rounds"] >= config.min_rounds) & (stats["lower_bound"] > threshold)
+    stats["status"] = np.select([stop, running, stats["rounds"] < current_round],
+                                [STOPPED, ACTIVE, STOPPED], default=COMPLETE)
+
+    out_dir = config.out_dir or os.path.join(os.path.dirname(os.path.abspath(db.path)), "adaptive")
+    os.makedirs(out_dir, exist_ok=True)
+    stats.to_csv(os.path.join(out_dir, "state.csv"), index=False)
+
+    n_stopped = int(stop.sum())
+    logger.info(f"第 {current_round}/{config.rounds} 轮结束: 前 {config.top_k} 名阈值 {threshold:.3f}，"
+                f"本轮停止 {n_stopped} 个 tRNA，继续 {int(running.sum()) - n_stopped} 个")
+
+    active_trnas = set(stats.loc[stats["status"] == ACTIVE, "tRNA_id"])
+    # 只有被排除的 aaRS 参与对接的 tRNA 没有统计量，继续运行
+    unscored = set(pair_trnas) - set(stats["tRNA_id"])
+    next_tasks = [next_round_task(task, config) for (pair_id, task), tRNA_id in zip(latest.items(), pair_trnas)
+                  if task["part"] == current_round < config.rounds
+                  and (tRNA_id in active_trnas or tRNA_id in unscored)]
+    if next_tasks:
+        added = db.add_tasks(next_tasks)
+        update_cost_estimates(db)
+        logger.info(f"已安排第 {current_round + 1} 轮的 {added} 个子任务")
+        return SCHEDULED
+
+    finalize(db, config, decoys, out_dir)
+    return FINISHED
+
+
+def finalize(db, config, decoys, out_dir):
+    """
+    合并子任务的 silent 文件，输出每个 RNP 最好的 decoy 和 tRNA 排名
+
+    scores.sc 是按子任务计算的，每个子任务的标签都从 S_000001 开始；
+    输出的 description 换成合并后 default.out 中对应 decoy 的标签。
+    """
+    logger = get_logger('adaptive_docking')
+    tag_maps = {}
+    for pair_id in db.pair_ids():
+        tag_map = {}
+        if merge_pair(db, pair_id, allow_partial=True, tag_map=tag_map):
+            tag_maps[pair_id] = tag_map
+
+    planned = len(db.pair_ids()) * config.nstruct
+    logger.info(f"对接结束: 运行 {len(decoys)} 个 decoy，完整运行需要 {planned} 个"
+                f"（节省 {1 - len(decoys) / planned:.1%}）" if planned else "对接结束")
+
+    scores_file = os.path.join(out_dir, "scores.csv")
+    best = decoys.loc[decoys.groupby("sample_id")["total_score"].idxmin()].reset_index(drop=True)
+    part_tags = decoy_tags(best["description"])
+    merged_tags = [tag_maps.get(pair_id, {}).get((part, tag)) for pair_id, part, tag
+                   in zip(best["sample_id"], best["part"], part_tags)]
+    unmapped = [pair_id for pair_id, tag in zip(best["sample_id"], merged_tags) if tag is None]
+    if unmapped:
+        logger.warning(f"{len(unmapped)} 个 RNP 的最佳 decoy 在合并后的 default.out 中找不到，保留子任务中的标签: "
+                       f"{', '.join(unmapped[:5])}")
+    best["description"] = [merged or original for merged, original in zip(merged_tags, best["description"])]
+    best = best.drop(columns=["part"])
+    best[["aaRS_id", "tRNA_id"]] = split_sample_ids(best["sample_id"])
+    best.to_csv(scores_file, index=False)
+    filter_candidate_trnas(scores_file, os.path.join(out_dir, "tRNAs_score.csv"), config.block_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='自适应 RNP 对接：分轮运行并提前停止不可能进入前 K 名的 tRNA')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = subparsers.add_parser('init', help='扫描输入目录，建立自适应对接任务并安排第一轮')
+    init_parser.add_argument('--input_dir', required=True, help='fasta_file_prepare.py 的输出目录')
+    init_parser.add_argument('--pdb_dir', help='aaRS PDB 文件目录，默认与输入目录相同')
+    init_parser.add_argument('--results_dir', help='结果目录，默认为 <input_dir>/results')
+    init_parser.add_argument('--db', help='任务数据库路径，默认为 <input_dir>/tasks.db')
+    init_parser.add_argument('--nstruct', type=int, default=DEFAULT_NSTRUCT, help='每个 RNP 最多运行的 decoy 数')
+    init_parser.add_argument('--rounds', type=int, default=5, help='decoy 分几轮运行，默认 5')
+    init_parser.add_argument('--top_k', type=int, default=20, help='需要保留的前 K 名 tRNA，默认 20')
+    init_parser.add_argument('--z', type=float, default=2.0, help='置信下界使用的标准差倍数，默认 2')
+    init_parser.add_argument('--min_rounds', type=int, default=1, help='至少运行多少轮后才允许停止，默认 1')
+    init_parser.add_argument('--block_list', help='不参与 tRNA 统计的蛋白 ID 文件')
+    init_parser.add_argument('--out_dir', help='状态和结果输出目录，默认为数据库同目录下的 adaptive')
+
+    for name, help_text in (('step', '当前轮次结束后安排下一轮（可配合 Slurm 后端使用）'),
+                            ('run', '在本地运行全部轮次')):
+        sub_parser = subparsers.add_parser(name, help=help_text)
+        sub_parser.add_argument('--db', required=True, help='任务数据库路径')
+        sub_parser.add_argument('--max_workers', type=int, default=os.cpu_count(), help='并发数，默认为 CPU 核数')
+        if name == 'run':
+            sub_parser.add_argument('--backend', choices=['local', 'fake'], default='local', help='运行后端')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+
+    if args.command == 'init':
+        if not 1 <= args.rounds <= args.nstruct:
+            parser.error('--rounds 必须在 1 到 --nstruct 之间')
+        db_path = args.db or os.path.join(args.input_dir, 'tasks.db')
+        config = AdaptiveConfig(args.nstruct, args.rounds, args.top_k, args.z, args.min_rounds,
+                                args.block_list, args.out_dir)
+        tasks = discover_tasks(args.input_dir, args.pdb_dir or args.input_dir,
+                               args.results_dir or os.path.join(args.input_dir, 'results'),
+                               nstruct=config.nstruct)
+        # 每个 RNP 都拆分为 rounds 个子任务（只有 1 轮时也拆分），轮次由子任务的 part 表示
+        tasks = [part for task in tasks for part in split_task(task, config.nstruct, config.rounds)]
+        db = TaskDB(db_path)
+        existing_pairs = db.pair_ids()
+        added = db.add_tasks([task for task in tasks if task["part"] == 1 and task["pair_id"] not in existing_pairs])
+        config.save(db_path)
+        logger.info(f"新增 {added} 个 RNP 的第 1 轮子任务，任务数据库: {db_path}")
+        logger.info(f"自适应参数: {asdict(config)}")
+        return
+
+    db = TaskDB(args.db)
+    config = AdaptiveConfig.load(args.db)
+
+    if args.command == 'step':
+        step(db, config, max_workers=args.max_workers)
+        return
+
+    backend = BACKENDS[args.backend](config.nstruct)
+    while True:
+        update_cost_estimates(db)
+        results = backend.run(db, args.max_workers)
+        logger.info(f"本轮运行完成: {results[DONE]} 个成功，{results[FAILED]} 个失败")
+        outcome = step(db, config, max_workers=args.max_workers)
+        if outcome == FINISHED:
+            break
+        if outcome == WAITING:
+            logger.warning("还有其他进程领取的任务在运行，等它们结束后再运行 step")
+            break
+
+
+if __name__ == '__main__':
+    main()
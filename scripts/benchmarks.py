@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+score 流程的性能基准测试
+
+用法：
+    benchmarks.py sample_ids --rows 1000000
+    benchmarks.py startup --budget 0.5
+    benchmarks.py fasta --records 200000
+    benchmarks.py streaming --rows 1000000 --chunksize 100000
+"""
+
+import io
+import os
+import sys
+import argparse
+import contextlib
+import statistics
+import subprocess
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from candidate_tRNAs_filter import filter_candidate_trnas, filter_candidate_trnas_streaming
+from fasta_io import read_fasta, write_fasta, fasta_id, FastaIndex
+from score_matrix import split_sample_ids
+
+
+def extract_trna_id(sample_id):
+    """
+    原逐行拆分方式：从 sample_id 中提取 tRNA 标识符（sample_ids 基准的对照）
+    例如：A0A8R1WPS3_tRNA-Asn-GTT-2 -> tRNA-Asn-GTT-2
+    sample_id 格式为：aaRs_ID_tRNA_ID，用下划线分割
+    """
+    parts = sample_id.split('_')
+    if len(parts) >= 2:
+        # 取从第二个下划线开始的所有部分，重新用下划线连接
+        # 这样可以处理 tRNA ID 中可能包含下划线的情况
+        trna_id = '_'.join(parts[1:])
+        return trna_id
+    else:
+        # 如果格式不符合预期，返回原始 sample_id
+        return sample_id
+
+
+def make_synthetic_scores(rows, n_aaRS=40, n_tRNA=500, seed=0):
+    """生成合成 scores 表：sample_id = <aaRS_ID>_<tRNA_ID>，每个配对有多个 decoy"""
+    rng = np.random.default_rng(seed)
+    aaRS_ids = np.array([f"A0A{i:07d}" for i in range(n_aaRS)], dtype=object)
+    tRNA_ids = np.array([f"tRNA-Asn-ATT-{i}" for i in range(n_tRNA)], dtype=object)
+    sample_ids = aaRS_ids[rng.integers(0, n_aaRS, rows)] + "_" + tRNA_ids[rng.integers(0, n_tRNA, rows)]
+    return pd.DataFrame({
+        "total_score": rng.normal(1000, 500, rows),
+        "sample_id": sample_ids,
+    })
+
+
+def _timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_sample_ids(rows, repeat, block_fraction=0.1):
+    """对比逐行 lambda 解析 + 字符串 groupby 与向量化拆分 + 分类 groupby"""
+    scores = make_synthetic_scores(rows)
+    blocked = set(scores["sample_id"].str.partition("_")[0].drop_duplicates()
+                  .sample(frac=block_fraction, random_state=0))
+    print(f"合成 scores 表: {rows} 行, {scores['sample_id'].nunique()} 个 sample_id, 排除 {len(blocked)} 个 aaRS")
+
+    def legacy():
+        df = scores.copy()
+        df["protein_id"] = df["sample_id"].apply(lambda x: x.split("_")[0])
+        df = df[~df["protein_id"].isin(blocked)].drop("protein_id", axis=1)
+        df["trna_id"] = df["sample_id"].apply(extract_trna_id)
+        return df, df.groupby("trna_id").agg({"total_score": ["mean", "std", "count", "min", "max"]})
+
+    def vectorized():
+        df = scores.copy()
+        df[["aaRS_id", "tRNA_id"]] = split_sample_ids(df["sample_id"])
+        df = df[~df["aaRS_id"].isin(blocked)]
+        return df, df.groupby("tRNA_id", observed=True).agg({"total_score": ["mean", "std", "count", "min", "max"]})
+
+    legacy_time, (legacy_df, legacy_stats) = _timeit(legacy, repeat)
+    vectorized_time, (vectorized_df, vectorized_stats) = _timeit(vectorized, repeat)
+
+    diff = (legacy_stats.sort_index().to_numpy() - vectorized_stats.sort_index().to_numpy())
+    assert np.nanmax(np.abs(diff)) < 1e-6, "两种方法的统计结果不一致"
+
+    legacy_mem = legacy_df[["trna_id"]].memory_usage(deep=True).sum() / 1024 ** 2
+    vectorized_mem = vectorized_df[["aaRS_id", "tRNA_id"]].memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"{'方法':<24}{'耗时 (秒)':>12}{'派生 ID 列内存 (MB)':>18}")
+    print(f"{'lambda + 字符串 groupby':<24}{legacy_time:>12.3f}{legacy_mem:>18.1f}")
+    print(f"{'向量化 + 分类 groupby':<24}{vectorized_time:>12.3f}{vectorized_mem:>18.1f}")
+    print(f"加速比: {legacy_time / vectorized_time:.1f}x")
+
+
+def benchmark_streaming(rows, chunksize, repeat, nan_fraction=0.05, block_fraction=0.1):
+    """对比 candidate_tRNAs_filter.py 的一次性读取与流式（--chunksize）统计，并检查两者结果一致"""
+    scores = make_synthetic_scores(rows)
+    rng = np.random.default_rng(1)
+    # 部分 score 缺失，另有一个 tRNA 的 score 全部缺失：两种方式的 count（有效 score 数）和统计量都应一致
+    scores.loc[rng.random(rows) < nan_fraction, "total_score"] = np.nan
+    scores.loc[scores["sample_id"].str.endswith("_tRNA-Asn-ATT-0"), "total_score"] = np.nan
+    blocked = scores["sample_id"].str.partition("_")[0].drop_duplicates().sample(frac=block_fraction, random_state=0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scores_file = os.path.join(tmp_dir, "scores.csv")
+        block_list = os.path.join(tmp_dir, "block_list.txt")
+        scores.to_csv(scores_file, index=False)
+        with open(block_list, "w") as f:
+            f.writelines(f"{aaRS_id}\n" for aaRS_id in blocked)
+        print(f"合成 scores 表: {rows} 行, score 缺失 {int(scores['total_score'].isna().sum())} 行, 排除 {len(blocked)} 个 aaRS")
+
+        def run(func, *args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return func(*args)
+
+        out_file = os.path.join(tmp_dir, "out", "tRNAs_score.csv")
+        in_memory_time, in_memory = _timeit(lambda: run(filter_candidate_trnas, scores_file, out_file, block_list), repeat)
+        streaming_time, streaming = _timeit(
+            lambda: run(filter_candidate_trnas_streaming, scores_file, out_file, block_list, chunksize), repeat)
+
+    in_memory = in_memory.assign(trna_id=in_memory["trna_id"].astype(str)).sort_values("trna_id", ignore_index=True)
+    streaming = streaming.assign(trna_id=streaming["trna_id"].astype(str)).sort_values("trna_id", ignore_index=True)
+    pd.testing.assert_frame_equal(in_memory, streaming, check_dtype=False, atol=1e-3)
+    print(f"{'方式':<24}{'耗时 (秒)':>12}")
+    print(f"{'一次性读取':<24}{in_memory_time:>12.3f}")
+    print(f"{f'流式（每块 {chunksize} 行）':<24}{streaming_time:>12.3f}")
+    print(f"两种方式的 {len(streaming)} 个 tRNA 统计结果一致（含 count 和 score 全部缺失的 tRNA）")
+
+
+def make_synthetic_library(path, records, seed=0):
+    """生成合成突变体库（2 行 FASTA，标题行格式与 design_mutant_library.py 相同）"""
+    rng = np.random.default_rng(seed)
+    bases = np.array(list("ACGT"))
+    seqs = ["".join(row) for row in bases[rng.integers(0, 4, (records, 76))]]
+    write_fasta(path, ((f"tRNA-Asn-ATT-{i // 9}_mutant{i % 9 + 1}  aa:Lys", seq) for i, seq in enumerate(seqs)))
+    return records
+
+
+def benchmark_fasta(records, repeat, lookups=1000):
+    """对比 Bio.SeqIO 与 fasta_io 读写 2 行 FASTA，以及 .fai 索引随机读取"""
+    from Bio import SeqIO
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        library = os.path.join(tmp_dir, "library.fasta")
+        make_synthetic_library(library, records)
+        print(f"合成突变体库: {records} 条记录, {os.path.getsize(library) / 1024 ** 2:.1f} MB")
+
+        def seqio_read():
+            return [(record.id, str(record.seq)) for record in SeqIO.parse(library, "fasta")]
+
+        def fasta_io_read():
+            return [(fasta_id(title), seq) for title, seq in read_fasta(library)]
+
+        seqio_read_time, seqio_records = _timeit(seqio_read, repeat)
+        fasta_io_read_time, fasta_io_records = _timeit(fasta_io_read, repeat)
+        assert seqio_records == fasta_io_records, "两种方法读取的记录不一致"
+
+        titles = [(title, seq) for title, seq in read_fasta(library)]
+        seqio_out = os.path.join(tmp_dir, "seqio.fasta")
+        fasta_io_out = os.path.join(tmp_dir, "fasta_io.fasta")
+
+        def seqio_write():
+            from Bio.Seq import Seq
+            from Bio.SeqRecord import SeqRecord
+            out = (SeqRecord(Seq(seq), id=fasta_id(title), description=title.split(" ", 1)[1]) for title, seq in titles)
+            return SeqIO.write(out, seqio_out, "fasta-2line")
+
+        seqio_write_time, _ = _timeit(seqio_write, repeat)
+        fasta_io_write_time, _ = _timeit(lambda: write_fasta(fasta_io_out, titles), repeat)
+        with open(seqio_out) as a, open(fasta_io_out) as b:
+            assert a.read() == b.read(), "两种方法写出的文件不一致"
+
+        rng = np.random.default_rng(1)
+        names = [seqio_records[i][0] for i in rng.integers(0, records, lookups)]
+        start = time.perf_counter()
+        with FastaIndex(library) as index:
+            index_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fetched = [index[name] for name in names]
+            lookup_time = time.perf_counter() - start
+        expected = dict(seqio_records)
+        assert fetched == [expected[name] for name in names], "索引读取的序列不一致"
+
+    print(f"{'操作':<24}{'Bio.SeqIO (秒)':>16}{'fasta_io (秒)':>16}{'加速比':>10}")
+    print(f"{'读取':<24}{seqio_read_time:>16.3f}{fasta_io_read_time:>16.3f}{seqio_read_time / fasta_io_read_time:>9.1f}x")
+    print(f"{'写入 fasta-2line':<24}{seqio_write_time:>16.3f}{fasta_io_write_time:>16.3f}{seqio_write_time / fasta_io_write_time:>9.1f}x")
+    print(f"建立 .fai 索引: {index_time:.3f} 秒，随机读取 {lookups} 条: {lookup_time * 1000:.1f} 毫秒")
+
+
+TRNA_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trna_cli.py")
+# trna --help 和轻量子命令的 --help 不应导入这些库
+HEAVY_MODULES = ("pandas", "numpy", "Bio", "matplotlib", "seaborn")
+STARTUP_COMMANDS = (
+    ("--help",),
+    ("name-map", "--help"),
+    ("pipeline", "--help"),
+    ("profile", "--help"),
+    ("plot-scores", "--help"),
+)
+
+
+def parse_importtime(stderr):
+    """
+    解析 python -X importtime 的输出
+
+    Returns:
+        list[tuple[str, int, int]]: (模块名, 缩进层级, 累计耗时微秒)
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def time_command(args, repeat):
+    """运行 trna_cli.py 子命令 repeat 次，返回耗时中位数（秒）和 -X importtime 中导入的重型库"""
+    command = [sys.executable, TRNA_CLI, *args]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    result = subprocess.run([sys.executable, "-X", "importtime", TRNA_CLI, *args],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imports = parse_importtime(result.stderr)
+    heavy = sorted({name.split(".")[0] for name, _, _ in imports if name.split(".")[0] in HEAVY_MODULES})
+    return statistics.median(times), heavy, imports
+
+
+def benchmark_startup(repeat, budget, top):
+    """测量 trna 命令行的启动时间，超出预算或导入了重型库时返回 False"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+    baseline = (time.perf_counter() - start) / repeat
+    print(f"Python 解释器空启动: {baseline:.3f} 秒，预算: {budget:.3f} 秒，每条命令运行 {repeat} 次取中位数")
+    print(f"{'命令':<32}{'耗时 (秒)':>12}  重型库")
+
+    ok = True
+    slowest = None
+    for args in STARTUP_COMMANDS:
+        elapsed, heavy, imports = time_command(args, repeat)
+        over = elapsed > budget
+        ok = ok and not over and not heavy
+        print(f"{'trna ' + ' '.join(args):<32}{elapsed:>12.3f}  {', '.join(heavy) or '-'}{'  超出预算' if over else ''}")
+        if slowest is None or elapsed > slowest[0]:
+            slowest = (elapsed, args, imports)
+
+    if top and slowest is not None:
+        elapsed, args, imports = slowest
+        print(f"\n最慢的命令 trna {' '.join(args)} 中累计耗时最多的顶层导入:")
+        for name, _, cumulative in sorted((i for i in imports if i[1] == 0), key=lambda i: -i[2])[:top]:
+            print(f"{cumulative / 1000:>10.1f} ms  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="score 流程的性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sample_ids_parser = subparsers.add_parser("sample_ids", help="sample_id 解析与分组")
+    sample_ids_parser.add_argument("--rows", type=int, default=1_000_000, help="合成表行数，默认 1000000")
+    sample_ids_parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次），默认 3")
+
+    fasta_parser = subparsers.add_parser("fasta", help="FASTA 读写：Bio.SeqIO 与 fasta_io 对比")
+    fasta_parser.add_argument("--records", type=int, default=200_000, help="合成突变体库记录数，默认 200000")
+    fasta_parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次），默认 3")
+
+    streaming_parser = subparsers.add_parser("streaming", help="候选 tRNA 统计：一次性读取与流式对比，并检查结果一致")
+    streaming_parser.add_argument("--rows", type=int, default=1_000_000, help="合成表行数，默认 1000000")
+    streaming_parser.add_argument("--chunksize", type=int, default=100_000, help="流式模式每块行数，默认 100000")
+    streaming_parser.add_argument("--repeat", type=int, default=1, help="重复次数（取最快一次），默认 1")
+
+    startup_parser = subparsers.add_parser("startup", help="trna 命令行启动时间")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="每条命令运行次数（取中位数），默认 5")
+    startup_parser.add_argument("--budget", type=float, default=0.5, help="启动时间预算（秒），默认 0.5")
+    startup_parser.add_argument("--top", type=int, default=10, help="列出最慢命令中耗时最多的顶层导入数，默认 10")
+    args = parser.parse_args()
+
+    if args.command == "sample_ids":
+        benchmark_sample_ids(args.rows, args.repeat)
+    elif args.command == "streaming":
+        benchmark_streaming(args.rows, args.chunksize, args.repeat)
+    elif args.command == "fasta":
+        benchmark_fasta(args.records, args.repeat)
+    elif args.command == "startup":
+        if not benchmark_startup(args.repeat, args.budget, args.top):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
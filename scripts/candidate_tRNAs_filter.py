@@ -8,27 +8,143 @@
 
 import os
 import argparse
+import numpy as np
 import pandas as pd
+from score_matrix import ScoreMatrix, read_block_list, split_sample_ids
+from profile_utils import add_profile_arguments, start_profiling
 
+# collect_scores.py 输出中的 ID 列按分类类型读取
+ID_DTYPES = {'sample_id': 'category', 'aaRS_id': 'category', 'tRNA_id': 'category'}
 
-def extract_trna_id(sample_id):
+
+def load_blocked_proteins(block_list):
+    """读取 block_list 中需要排除的蛋白 ID，读取失败时返回 None"""
+    blocked_proteins = set()
+    if block_list and os.path.exists(block_list):
+        try:
+            blocked_proteins = read_block_list(block_list)
+            print(f"从 {block_list} 读取到 {len(blocked_proteins)} 个需要排除的蛋白 ID")
+        except Exception as e:
+            print(f"读取 block_list 文件失败: {e}")
+            return None
+    elif block_list:
+        print(f"警告: block_list 文件不存在: {block_list}")
+    return blocked_proteins
+
+
+def parse_objectives(specs):
     """
-    从 sample_id 中提取 tRNA 标识符
-    例如：A0A8R1WPS3_tRNA-Asn-GTT-2 -> tRNA-Asn-GTT-2
-    sample_id 格式为：aaRs_ID_tRNA_ID，用下划线分割
+    解析多目标排序的 score 项和方向
+
+    Args:
+        specs (list[str]): 形如 "total_score:min"、"N_WC:max" 的列表，省略方向时默认 min
+
+    Returns:
+        list[tuple[str, str]]: [(score 项, 'min' 或 'max'), ...]
+    """
+    objectives = []
+    for spec in specs:
+        term, _, direction = spec.partition(':')
+        direction = direction or 'min'
+        if direction not in ('min', 'max'):
+            raise ValueError(f"无效的方向 '{direction}'（{spec}），只能为 min 或 max")
+        objectives.append((term, direction))
+    return objectives
+
+
+def pareto_fronts(values):
     """
-    parts = sample_id.split('_')
-    if len(parts) >= 2:
-        # 取从第二个下划线开始的所有部分，重新用下划线连接
-        # 这样可以处理 tRNA ID 中可能包含下划线的情况
-        trna_id = '_'.join(parts[1:])
-        return trna_id
-    else:
-        # 如果格式不符合预期，返回原始 sample_id
-        return sample_id
-
-
-def filter_candidate_trnas(scores_file, out_file, block_list=None):
+    非支配排序，返回每个点所在的 Pareto 前沿编号（从 1 开始）
+
+    采用按字典序排序 + 二分查找前沿的方法（ENS-BS）：排序后靠后的点不可能支配靠前的点，
+    且"被第 i 个前沿支配"对 i 单调，因此每个点只需二分查找第一个不支配它的前沿。
+    两个目标时每次判断为 O(1)，整体 O(n log n)；更多目标时只与候选前沿中的点做向量化比较，
+    不做全部两两比较。
+
+    Args:
+        values (np.ndarray): 形状 (n, k) 的目标值，全部按最小化处理
+
+    Returns:
+        np.ndarray: 长度 n 的前沿编号
+    """
+    values = np.asarray(values, dtype=float)
+    n, k = values.shape
+    order = np.lexsort(values.T[::-1])
+    ranks = np.zeros(n, dtype=int)
+    n_fronts = 0
+    front_mins = []   # 两目标时：每个前沿 (最小 f2, 首次取得该最小值的点的 f1)
+    fronts = []       # 其他情况：每个前沿的 [成员目标值缓冲区, 成员数]
+
+    def dominated_by(front, point):
+        if k == 2:
+            min_f2, f1_at_min = front_mins[front]
+            return min_f2 < point[1] or (min_f2 == point[1] and f1_at_min < point[0])
+        buffer, size = fronts[front]
+        members = buffer[:size]
+        return bool(np.any(np.all(members <= point, axis=1) & np.any(members < point, axis=1)))
+
+    for idx in order:
+        point = values[idx]
+        lo, hi = 0, n_fronts
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if dominated_by(mid, point):
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == n_fronts:
+            n_fronts += 1
+            front_mins.append((point[1], point[0]) if k == 2 else None)
+            fronts.append([np.empty((16, k)), 0] if k != 2 else None)
+        if k == 2:
+            if point[1] < front_mins[lo][0]:
+                front_mins[lo] = (point[1], point[0])
+        else:
+            buffer, size = fronts[lo]
+            if size == len(buffer):
+                buffer = np.concatenate([buffer, np.empty_like(buffer)])
+            buffer[size] = point
+            fronts[lo] = [buffer, size + 1]
+        ranks[idx] = lo + 1
+    return ranks
+
+
+def rank_trnas_pareto(term_means, objectives):
+    """
+    按多个 score 项的 tRNA 平均值做非支配排序
+
+    Args:
+        term_means (pd.DataFrame): 以 trna_id 为索引、各 score 项平均值为列的表
+        objectives (list[tuple[str, str]]): parse_objectives() 的返回值
+
+    Returns:
+        pd.DataFrame: trna_id, pareto_front, mean_<score 项>...
+    """
+    terms = [term for term, _ in objectives]
+    means = term_means[terms].dropna()
+    signs = np.array([1.0 if direction == 'min' else -1.0 for _, direction in objectives])
+    ranking = means.add_prefix('mean_').round(3)
+    ranking.insert(0, 'pareto_front', pareto_fronts(means.to_numpy(dtype=float) * signs))
+    ranking.index.name = 'trna_id'
+    return ranking.reset_index()
+
+
+def add_pareto_ranking(trna_stats, term_means, objectives):
+    """把 Pareto 前沿编号并入 tRNA 统计表，并按前沿、平均 score 排序"""
+    ranking = rank_trnas_pareto(term_means, objectives)
+    ranking = ranking.drop(columns=['mean_total_score'], errors='ignore')
+    trna_stats = trna_stats.merge(ranking, on='trna_id', how='left')
+    trna_stats['pareto_front'] = trna_stats['pareto_front'].astype('Int64')
+    trna_stats = trna_stats.sort_values(['pareto_front', 'mean_score'])
+
+    front_sizes = trna_stats['pareto_front'].value_counts().sort_index()
+    print(f"\n多目标排序（{', '.join(f'{t}:{d}' for t, d in objectives)}）: 共 {len(front_sizes)} 个 Pareto 前沿")
+    print(f"第1前沿包含 {front_sizes.iloc[0] if len(front_sizes) else 0} 个 tRNA:")
+    print(trna_stats[trna_stats['pareto_front'] == 1][['trna_id', 'mean_score']].to_string(index=False))
+    return trna_stats
+
+
+def filter_candidate_trnas(scores_file, out_file, block_list=None, objectives=None):
     """
     筛选候选 tRNA，计算每个 tRNA 与所有蛋白质对接的平均 score
     
@@ -36,66 +152,67 @@ def filter_candidate_trnas(scores_file, out_file, block_list=None):
         scores_file: 输入的 scores CSV 文件
         out_file: 输出的 tRNA scores CSV 文件
         block_list: 需要排除的蛋白 ID 列表文件路径
+        objectives: 可选，多目标排序的 [(score 项, 'min'/'max'), ...]，输出中增加 pareto_front 列
     """
     print(f"读取 scores 文件: {scores_file}")
 
     # 读取 scores 文件
     try:
-        df = pd.read_csv(scores_file)
+        df = pd.read_csv(scores_file, dtype=ID_DTYPES)
         print(f"成功读取 {len(df)} 条记录")
     except Exception as e:
         print(f"读取文件失败: {e}")
         return
 
     # 检查必要的列是否存在
-    required_columns = ['total_score', 'sample_id']
+    required_columns = ['total_score', 'sample_id'] + [term for term, _ in objectives or []]
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         print(f"缺少必要的列: {missing_columns}")
         return
     
     # 如果提供了 block_list，读取需要排除的蛋白 ID
-    blocked_proteins = set()
-    if block_list and os.path.exists(block_list):
-        try:
-            with open(block_list, 'r', encoding='utf-8') as f:
-                blocked_proteins = set(line.strip() for line in f if line.strip())
-            print(f"从 {block_list} 读取到 {len(blocked_proteins)} 个需要排除的蛋白 ID")
-        except Exception as e:
-            print(f"读取 block_list 文件失败: {e}")
-            return
-    elif block_list:
-        print(f"警告: block_list 文件不存在: {block_list}")
-    
+    blocked_proteins = load_blocked_proteins(block_list)
+    if blocked_proteins is None:
+        return
+
+    # 一次性向量化拆分 sample_id，得到分类类型的 aaRS_id / tRNA_id 列
+    if not {'aaRS_id', 'tRNA_id'}.issubset(df.columns):
+        df[['aaRS_id', 'tRNA_id']] = split_sample_ids(df['sample_id'])
+
     # 过滤掉被阻止的蛋白质样本
     if blocked_proteins:
         original_count = len(df)
-        # 提取每个 sample_id 的蛋白质 ID（第一个下划线前的部分）
-        df['protein_id'] = df['sample_id'].apply(lambda x: x.split('_')[0])
-        # 过滤掉在 block_list 中的蛋白质
-        df = df[~df['protein_id'].isin(blocked_proteins)]
+        df = df[~df['aaRS_id'].isin(blocked_proteins)]
         filtered_count = len(df)
         print(f"排除了 {original_count - filtered_count} 条记录，剩余 {filtered_count} 条记录")
-        # 删除临时列
-        df = df.drop('protein_id', axis=1)
 
-    # 提取 tRNA ID
-    df['trna_id'] = df['sample_id'].apply(extract_trna_id)
+    print(f"发现 {df['tRNA_id'].nunique()} 个不同的 tRNA")
 
-    print(f"发现 {df['trna_id'].nunique()} 个不同的 tRNA")
-
-    # 按 tRNA 分组，计算平均 score
-    trna_stats = df.groupby('trna_id').agg({
+    # 按 tRNA 分组，计算平均 score（只保留实际出现的分类）；count 为有效（非 NaN）score 的数量
+    trna_stats = df.groupby('tRNA_id', observed=True).agg({
         'total_score': ['mean', 'std', 'count', 'min', 'max']
     }).round(3)
 
     # 展平列名
     trna_stats.columns = ['mean_score', 'std_score', 'count', 'min_score', 'max_score']
-    trna_stats = trna_stats.reset_index()
+    trna_stats = trna_stats.rename_axis('trna_id').reset_index()
 
     # 按平均 score 排序（score 越低越好，所以升序排列）
     trna_stats = trna_stats.sort_values('mean_score')
 
+    if objectives:
+        terms = list(dict.fromkeys(term for term, _ in objectives))
+        term_means = df.groupby('tRNA_id', observed=True)[terms].mean()
+        term_means.index = term_means.index.astype(object).rename('trna_id')
+        trna_stats = add_pareto_ranking(trna_stats, term_means, objectives)
+
+    report_and_save(trna_stats, out_file)
+    return trna_stats
+
+
+def report_and_save(trna_stats, out_file):
+    """打印排名靠前/靠后的 tRNA 和统计信息，并保存结果"""
     print(f"\n前10个平均 score 最低（最好）的 tRNA:")
     print(trna_stats.head(10)[['trna_id', 'mean_score', 'count']].to_string(index=False))
 
@@ -117,23 +234,180 @@ def filter_candidate_trnas(scores_file, out_file, block_list=None):
     print(f"  最差平均 score: {trna_stats['mean_score'].max():.3f}")
     print(f"  平均 score 标准差: {trna_stats['mean_score'].std():.3f}")
 
+
+def filter_candidate_trnas_from_matrix(matrix_dir, out_file, block_list=None, objectives=None):
+    """
+    基于 score_matrix.py 生成的矩阵 bundle 筛选候选 tRNA
+
+    block_list 只是矩阵的行掩码，统计量是数组归约，不需要拆分 sample_id 字符串。
+    """
+    print(f"读取 score 矩阵: {matrix_dir}")
+    matrix = ScoreMatrix.load(matrix_dir)
+    print(f"矩阵包含 {len(matrix.aaRS_ids)} 个 aaRS × {len(matrix.tRNA_ids)} 个 tRNA")
+
+    blocked_proteins = load_blocked_proteins(block_list)
+    if blocked_proteins is None:
+        return
+
+    trna_stats = matrix.trna_stats('total_score', blocked_proteins)
+
+    if objectives:
+        terms = list(dict.fromkeys(term for term, _ in objectives))
+        mask = matrix.aaRS_mask(blocked_proteins)
+        with np.errstate(invalid='ignore'):
+            term_means = pd.DataFrame(
+                {term: np.nanmean(np.asarray(matrix.term(term)[mask]), axis=0) for term in terms},
+                index=pd.Index(matrix.tRNA_ids, name='trna_id'))
+        trna_stats = add_pareto_ranking(trna_stats, term_means, objectives)
+
+    report_and_save(trna_stats, out_file)
+    return trna_stats
+
+
+class RunningTrnaStats:
+    """
+    按 tRNA 累积的流式统计量
+
+    每个数据块先按 tRNA 分组得到块内的记录数和有效 score 的 count/mean/M2/min/max，
+    再用 Welford 算法的并行合并形式（Chan et al.）并入累计结果，
+    因此内存只与不同 tRNA 的数量有关，与记录条数无关。
+    与 filter_candidate_trnas 相同，count 和均值等统计量只用有效（非 NaN）的 score；
+    score 全部缺失的 tRNA 也会保留（count 为 0）。
+    """
+
+    def __init__(self):
+        self.state = pd.DataFrame(columns=['rows', 'count', 'mean', 'm2', 'min', 'max'], dtype=float)
+        self.rows = 0
+
+    def update(self, trna_ids, scores):
+        """合并一个数据块"""
+        grouped = scores.groupby(trna_ids, observed=True)
+        valid = grouped.count().astype(float)
+        chunk = pd.DataFrame({
+            'rows': grouped.size().astype(float),
+            'count': valid,
+            'mean': grouped.mean(),
+            'm2': grouped.var(ddof=0) * valid,
+            'min': grouped.min(),
+            'max': grouped.max(),
+        })
+        chunk = chunk[chunk['rows'] > 0]
+        chunk.index = chunk.index.astype(object)
+        self.rows += int(chunk['rows'].sum())
+
+        state = self.state.reindex(self.state.index.union(chunk.index))
+        chunk = chunk.reindex(state.index)
+        na = state['count'].fillna(0)
+        nb = chunk['count'].fillna(0)
+        n = na + nb
+        delta = chunk['mean'].fillna(0) - state['mean'].fillna(0)
+        # 全部 score 缺失的 tRNA 有效数为 0，均值等为 NaN（与 groupby 的结果一致）
+        n_safe = n.where(n > 0)
+        self.state = pd.DataFrame({
+            'rows': state['rows'].fillna(0) + chunk['rows'].fillna(0),
+            'count': n,
+            'mean': (na * state['mean'].fillna(0) + nb * chunk['mean'].fillna(0)) / n_safe,
+            'm2': state['m2'].fillna(0) + chunk['m2'].fillna(0) + (delta ** 2 * na * nb / n_safe).fillna(0),
+            'min': pd.concat([state['min'], chunk['min']], axis=1).min(axis=1),
+            'max': pd.concat([state['max'], chunk['max']], axis=1).max(axis=1),
+        })
+
+    def result(self):
+        """返回与 filter_candidate_trnas 相同列的统计表"""
+        count = self.state['count']
+        std = (self.state['m2'] / (count - 1)).where(count > 1) ** 0.5
+        trna_stats = pd.DataFrame({
+            'mean_score': self.state['mean'],
+            'std_score': std,
+            'count': self.state['count'].astype(int),
+            'min_score': self.state['min'],
+            'max_score': self.state['max'],
+        }).round(3)
+        trna_stats.index.name = 'trna_id'
+        return trna_stats.reset_index()
+
+
+def filter_candidate_trnas_streaming(scores_file, out_file, block_list=None, chunksize=1_000_000):
+    """
+    流式筛选候选 tRNA：分块读取 scores 文件并累积每个 tRNA 的统计量
+
+    适用于汇总了所有 decoy（而不仅是每个样本最优 decoy）的大型 scores 文件，
+    输出与 filter_candidate_trnas 相同。
+    """
+    print(f"分块读取 scores 文件: {scores_file}（每块 {chunksize} 行）")
+
+    blocked_proteins = load_blocked_proteins(block_list)
+    if blocked_proteins is None:
+        return
+
+    running = RunningTrnaStats()
+    excluded = 0
+    try:
+        reader = pd.read_csv(scores_file, usecols=['sample_id', 'total_score'],
+                             dtype={'sample_id': 'category'}, chunksize=chunksize)
+        for chunk in reader:
+            ids = split_sample_ids(chunk['sample_id'])
+            if blocked_proteins:
+                keep = ~ids['aaRS_id'].isin(blocked_proteins)
+                excluded += int((~keep).sum())
+                chunk, ids = chunk[keep], ids[keep]
+            running.update(ids['tRNA_id'], chunk['total_score'])
+    except ValueError as e:
+        print(f"读取文件失败（缺少必要的列 total_score / sample_id?）: {e}")
+        return
+
+    print(f"成功读取 {running.rows + excluded} 条记录")
+    if blocked_proteins:
+        print(f"排除了 {excluded} 条记录，剩余 {running.rows} 条记录")
+
+    trna_stats = running.result()
+    print(f"发现 {len(trna_stats)} 个不同的 tRNA")
+
+    # 按平均 score 排序（score 越低越好，所以升序排列）
+    trna_stats = trna_stats.sort_values('mean_score')
+
+    report_and_save(trna_stats, out_file)
     return trna_stats
 
 
 def main():
     parser = argparse.ArgumentParser(description='筛选候选 tRNA，基于与 aaRs 对接的平均 score')
-    parser.add_argument('--scores_file', type=str, required=True, help='输入的 scores CSV 文件')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('--scores_file', type=str, help='输入的 scores CSV 文件')
+    input_group.add_argument('--score_matrix', type=str, help='score_matrix.py 生成的矩阵 bundle 目录')
     parser.add_argument('--out_file', type=str, required=True, help='输出的 tRNA scores CSV 文件')
     parser.add_argument('--block_list', type=str, help='包含需要排除的蛋白 ID 的文件路径')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='流式模式：按此行数分块读取 scores 文件，内存只与 tRNA 数量相关')
+    parser.add_argument('--pareto_terms', nargs='+', default=None,
+                        help='多目标排序：score 项及方向，例如 total_score:min fa_rep:min N_WC:max hbond_sc:min，'
+                             '输出中增加每个 tRNA 的 pareto_front 列')
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, __file__)
+
+    objectives = parse_objectives(args.pareto_terms) if args.pareto_terms else None
 
     # 检查输入文件是否存在
-    if not os.path.exists(args.scores_file):
-        print(f"错误: 输入文件不存在: {args.scores_file}")
+    input_path = args.scores_file or args.score_matrix
+    if not os.path.exists(input_path):
+        print(f"错误: 输入文件不存在: {input_path}")
+        return
+
+    if args.score_matrix:
+        filter_candidate_trnas_from_matrix(args.score_matrix, args.out_file, args.block_list, objectives)
+        return
+
+    if args.chunksize and objectives:
+        print("错误: 流式模式（--chunksize）不支持多目标排序（--pareto_terms）")
+        return
+
+    if args.chunksize:
+        filter_candidate_trnas_streaming(args.scores_file, args.out_file, args.block_list, args.chunksize)
         return
 
     # 筛选候选 tRNA
-    filter_candidate_trnas(args.scores_file, args.out_file, args.block_list)
+    filter_candidate_trnas(args.scores_file, args.out_file, args.block_list, objectives)
 
 
 if __name__ == '__main__':
@@ -6,11 +6,21 @@
 """
 
 import os
+import re
 import argparse
 import pandas as pd
 import subprocess
 import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from functools import partial
+from executor_utils import (
+    EXECUTORS, STATUS_COMPLETED, STATUS_SKIPPED, STATUS_FAILED, STATUS_TIMEOUT,
+    default_max_workers, run_tasks, summarize_results, write_summary_json,
+)
+from score_matrix import ScoreMatrix, split_sample_ids
+from shard_utils import add_shard_argument, select_shard, shard_path
+from logger_utils import stage
+from profile_utils import add_profile_arguments, start_profiling
 
 
 def read_task_list(input_dir):
@@ -22,59 +32,78 @@ def read_task_list(input_dir):
             sample_ids.append(sample_id)
     return sample_ids
 
-def run_score_jd2_for_sample(input_dir, sample_id):
-    """为单个样本运行score_jd2命令"""
+def run_score_jd2_for_sample(input_dir, sample_id, timeout=None):
+    """为单个样本运行score_jd2命令，返回 (sample_id, 状态, 消息)，消息由主进程打印"""
     sample_dir = input_dir + "/" + sample_id
-    score_jd2_cmd = "score_jd2 -in:file:silent default.out -out:file:scorefile scores.sc"
+    score_path = sample_dir + "/scores.sc"
+    score_jd2_cmd = ["score_jd2", "-in:file:silent", "default.out", "-out:file:scorefile", "scores.sc"]
 
-    if os.path.exists(sample_dir + "/scores.sc"):
-        print(f"{sample_id} 的 score 已存在，跳过")
-        return sample_id, "skipped"
+    if os.path.exists(score_path):
+        return sample_id, STATUS_SKIPPED, f"{sample_id} 的 score 已存在，跳过"
 
     try:
-        subprocess.run(score_jd2_cmd, shell=True, check=True, cwd=sample_dir)
-        print(f"{sample_id} 的 score 计算完成")
-        return sample_id, "completed"
-    except subprocess.CalledProcessError as e:
-        print(f"{sample_id} 的 score 计算失败: {e}")
-        return sample_id, "failed"
-
-def calculate_score(input_dir, sample_ids, max_workers=75):
-    """使用多线程并行计算score"""
-    print(f"开始使用 {max_workers} 个线程并行计算 {len(sample_ids)} 个样本的 score...")
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_sample = {executor.submit(run_score_jd2_for_sample, input_dir, sample_id): sample_id
-                           for sample_id in sample_ids}
-
-        # 收集结果
-        completed_count = 0
-        skipped_count = 0
-        failed_count = 0
-
-        for future in as_completed(future_to_sample):
-            sample_id = future_to_sample[future]
-            try:
-                sample_id, status = future.result()
-                if status == "completed":
-                    completed_count += 1
-                elif status == "skipped":
-                    skipped_count += 1
-                elif status == "failed":
-                    failed_count += 1
-            except Exception as exc:
-                print(f"{sample_id} 产生异常: {exc}")
-                failed_count += 1
+        subprocess.run(score_jd2_cmd, check=True, cwd=sample_dir, timeout=timeout)
+        return sample_id, STATUS_COMPLETED, f"{sample_id} 的 score 计算完成"
+    except subprocess.TimeoutExpired:
+        message = f"{sample_id} 的 score 计算超时（{timeout} 秒）"
+        status = STATUS_TIMEOUT
+    except (subprocess.CalledProcessError, OSError) as e:
+        message = f"{sample_id} 的 score 计算失败: {e}"
+        status = STATUS_FAILED
+
+    # 删除不完整的 scores.sc，避免下次运行时被误判为已完成而跳过
+    if os.path.exists(score_path):
+        os.remove(score_path)
+    return sample_id, status, message
+
+def calculate_score(input_dir, sample_ids, executor="thread", max_workers=None, timeout=None,
+                    summary_file=None):
+    """使用可配置的执行器并行计算score，返回汇总信息"""
+    if max_workers is None:
+        max_workers = default_max_workers()
+    print(f"开始使用 {max_workers} 个{'线程' if executor == 'thread' else '进程'}并行计算 {len(sample_ids)} 个样本的 score...")
+
+    start = time.perf_counter()
+    results = run_tasks(partial(run_score_jd2_for_sample, input_dir), sample_ids,
+                        executor=executor, max_workers=max_workers, timeout=timeout,
+                        description="score_jd2")
+    summary = summarize_results(results, time.perf_counter() - start)
 
     print(f"\n任务完成统计:")
-    print(f"  完成: {completed_count}")
-    print(f"  跳过: {skipped_count}")
-    print(f"  失败: {failed_count}")
-    print(f"  总计: {len(sample_ids)}")
-
-def sum_scores(input_dir, sample_ids):
-    # 汇总 score 到输出文件
+    print(f"  完成: {summary['completed']}")
+    print(f"  跳过: {summary['skipped']}")
+    print(f"  失败: {summary['failed']} (其中超时: {summary['timeout']})")
+    print(f"  总计: {summary['total']}")
+    print(f"  耗时 p50/p90/max: {summary['wall_time_seconds']['p50']}/"
+          f"{summary['wall_time_seconds']['p90']}/{summary['wall_time_seconds']['max']} 秒")
+
+    if summary_file:
+        write_summary_json(summary, summary_file)
+        print(f"  汇总报告: {summary_file}")
+    return summary
+
+def read_score_file(score_path):
+    """读取 scores.sc 中的所有 decoy；SCORE 行不足（没有 decoy）时返回 None"""
+    with open(score_path) as f:
+        lines = [line for line in f if line.startswith('SCORE:')]
+    if len(lines) < 2:
+        return None
+    df = pd.read_csv(io.StringIO(''.join(lines)), sep=r'\s+', engine='python')
+
+    # 删除第一列 "SCORE:"
+    if "SCORE:" in df.columns:
+        df.drop(columns=["SCORE:"], inplace=True)
+    return df
+
+# score_jd2 在输出的 description 末尾加上 _0001 等 4 位编号
+SCORE_JD2_SUFFIX = re.compile(r"_\d{4}$")
+
+def decoy_tags(descriptions):
+    """去掉 scores.sc 中 description 的 score_jd2 编号（S_000001_0001 -> S_000001），与 silent 文件和 PDB 文件名中的标签一致"""
+    return descriptions.astype(str).str.replace(SCORE_JD2_SUFFIX, "", regex=True)
+
+def sum_scores(input_dir, sample_ids, all_decoys=False):
+    # 汇总 score 到输出文件；默认每个样本只保留 total_score 最小的 decoy，all_decoys=True 时保留全部
     all_scores = []
     for sample_id in sample_ids:
         sample_dir = os.path.join(input_dir, sample_id)
@@ -82,20 +111,19 @@ def sum_scores(input_dir, sample_ids):
         if not os.path.exists(score_path):
             print(f"{sample_id} 的 score 不存在，跳过")
             continue
-        with open(score_path) as f:
-            lines = [line for line in f if line.startswith('SCORE:')]
-        if len(lines) < 2:
-            print(f"{sample_id} 的 scores.sc 文件内容不足，跳过")
-            continue
         try:
-            df = pd.read_csv(io.StringIO(''.join(lines)), sep=r'\s+', engine='python')
+            df = read_score_file(score_path)
+            if df is None:
+                print(f"{sample_id} 的 scores.sc 文件内容不足，跳过")
+                continue
 
-            # 删除第一列 "SCORE:"
-            if "SCORE:" in df.columns:
-                df.drop(columns=["SCORE:"], inplace=True)
+            if all_decoys:
+                df["sample_id"] = sample_id
+                all_scores.append(df)
+                continue
 
             # 选 total_score 最小的一行
-            best_row = df.loc[df['total_score'].idxmin()].to_frame().T  # 转回 DataFrame
+            best_row = df.loc[[df['total_score'].idxmin()]]  # 用列表索引保持 DataFrame 和各列的数值类型
             best_row["sample_id"] = sample_id
             all_scores.append(best_row)
         except Exception as e:
@@ -104,23 +132,64 @@ def sum_scores(input_dir, sample_ids):
     if not all_scores:
         return pd.DataFrame()
     scores = pd.concat(all_scores, ignore_index=True)
+    # 一次性向量化拆分 sample_id，输出分类类型的 aaRS_id / tRNA_id 列
+    scores[['aaRS_id', 'tRNA_id']] = split_sample_ids(scores['sample_id'])
     return scores
 
 def main():
     parser = argparse.ArgumentParser(description='收集 Rosetta RNA-蛋白质复合物结构预测的 score')
     parser.add_argument('--input_dir', type=str, required=True, help='输入目录')
     parser.add_argument('--out_file', type=str, required=True, help='输出文件')
+    parser.add_argument('--executor', choices=list(EXECUTORS), default='thread',
+                        help='执行器类型：thread 或 process，默认 thread')
+    parser.add_argument('--max_workers', type=int, default=None,
+                        help='并发数，默认根据可用 CPU 核数和内存自动推导')
+    parser.add_argument('--mem_per_task', type=float, default=1.0,
+                        help='推导默认并发数时每个 score_jd2 任务预计占用的内存（GB），默认 1')
+    parser.add_argument('--timeout', type=float, default=None, help='单个样本的超时时间（秒），默认不限制')
+    parser.add_argument('--summary_file', type=str, default=None,
+                        help='任务汇总 JSON 文件，默认为 <out_file>.summary.json')
+    parser.add_argument('--all_decoys', action='store_true',
+                        help='保留每个样本的所有 decoy，而不仅是 total_score 最小的一个')
+    parser.add_argument('--matrix_dir', type=str, default=None,
+                        help='可选：同时保存 aaRS × tRNA score 矩阵 bundle 的目录（见 score_matrix.py）')
+    add_shard_argument(parser, 'sample_id')
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, __file__)
+
+    max_workers = args.max_workers or default_max_workers(args.mem_per_task)
+    # 分片运行时输出文件名带 .shard<k>of<N>，用 shard_utils.py merge scores 合并
+    out_file = shard_path(args.out_file, args.shard)
+    summary_file = args.summary_file or os.path.splitext(out_file)[0] + '.summary.json'
 
     # 读取输入文件夹下面的文件名, 识别 sample_id
-    sample_ids = read_task_list(args.input_dir)
+    with stage("读取任务列表", "collect_scores"):
+        sample_ids = read_task_list(args.input_dir)
+        if args.shard:
+            total = len(sample_ids)
+            sample_ids = select_shard(sample_ids, args.shard)
+            print(f"分片 {args.shard[0]}/{args.shard[1]}: 处理 {len(sample_ids)}/{total} 个样本")
 
     # 利用 score_jd2 计算 score
-    calculate_score(args.input_dir, sample_ids)
+    with stage("计算 score", "collect_scores"):
+        calculate_score(args.input_dir, sample_ids, executor=args.executor, max_workers=max_workers,
+                        timeout=args.timeout, summary_file=summary_file)
 
     # 汇总 score 到输出文件
-    scores = sum_scores(args.input_dir, sample_ids)
-    scores.to_csv(args.out_file, index=False)
+    with stage("汇总 score", "collect_scores"):
+        scores = sum_scores(args.input_dir, sample_ids, args.all_decoys)
+        scores.to_csv(out_file, index=False)
+
+    # 保存可 mmap 加载的 score 矩阵（矩阵每个配对只有一个值，因此仅用于最优 decoy 模式）
+    if args.matrix_dir and args.shard:
+        print("警告: 分片模式下不生成 score 矩阵，请在 shard_utils.py merge scores 时用 --matrix_dir 生成")
+    elif args.matrix_dir and args.all_decoys:
+        print("警告: --all_decoys 模式下不生成 score 矩阵")
+    elif args.matrix_dir and not scores.empty:
+        with stage("保存 score 矩阵", "collect_scores"):
+            ScoreMatrix.from_scores(scores).save(args.matrix_dir)
+        print(f"score 矩阵已保存到: {args.matrix_dir}")
 
 if __name__ == '__main__':
     main()
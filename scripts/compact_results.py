@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+对接结果压缩归档
+
+在 collect_scores.py 之后运行：每个 RNP 只保留 total_score（没有 scores.sc 时为 default.out 的 score）最好的 top_n 个 decoy，
+写入一个方向（结果目录）共用的 ZIP 归档（ZIP_DEFLATED 压缩，ZIP 中央目录即索引，可按成员随机读取），
+然后把原始 silent 文件压缩为 .gz 或删除，减少共享文件系统上的空间和文件数。
+
+归档结构（每个 RNP 一个目录）：
+    <RNP>/<tag>.silent     单个 decoy 的 silent 文件（含原文件头，可直接用 Rosetta 工具读取）
+    <RNP>/<tag>.pdb        已提取的该 decoy 的 PDB（extract_lowscore_decoys.py 的 default.out.N.pdb 或 <tag>.pdb，
+                           由 silent_files.extracted_pdb_tags 确定对应的标签）
+    <RNP>/scores.csv       保留的 decoy 的 score 表
+    <RNP>/manifest.json    各成员的 sha256，用于校验
+
+新的 RNP 写入临时归档（归档已存在时先复制一份），重新打开逐个成员校验 sha256，全部一致才用 os.replace 替换旧归档，
+再处理原始文件；运行中断或校验失败时旧归档不受影响。已归档的 RNP 再次运行时跳过，因此可以分批、重复运行。
+每次只在内存中保留一个 RNP 的成员；单个 RNP 选择 decoy 或读取文件失败时记录并跳过，不影响其余 RNP。
+只有写入归档并通过校验的 PDB 才会被删除，无法确定标签或未被选中的 PDB 保持不动。
+
+用法：
+    # 每个 RNP 保留前 5 个 decoy，其余 silent 文件压缩为 default.out.gz
+    compact_results.py compact --results_dir work/rosetta/Sf_in_Bm/results --top_n 5 --rest gzip
+
+    # 校验归档
+    compact_results.py verify --archive work/rosetta/Sf_in_Bm/results/decoys.zip
+
+    # 取出某个 decoy
+    compact_results.py extract --archive work/rosetta/Sf_in_Bm/results/decoys.zip \\
+        --rnp_id A0A8R1WPS3_tRNA-Asn-GTT-2 --tag S_000003 --out S_000003.silent
+
+在 Python 中流式读取：
+    from compact_results import DecoyArchive
+
+    with DecoyArchive("decoys.zip") as archive:
+        scores = archive.scores()
+        for rnp_id, tag, text in archive.iter_decoys():
+            ...
+"""
+
+import io
+import os
+import json
+import gzip
+import shutil
+import hashlib
+import zipfile
+import argparse
+import pandas as pd
+from collect_scores import read_score_file, decoy_tags
+from silent_files import iter_decoys, extracted_pdb_tags
+from logger_utils import setup_logger, get_logger
+
+ARCHIVE_NAME = "decoys.zip"
+SCORES_MEMBER = "scores.csv"
+MANIFEST_MEMBER = "manifest.json"
+REST_MODES = ("gzip", "delete", "keep")
+# scores.sc 为 score_jd2 的 total_score；rna_denovo 的 default.out 只有 score
+SCORE_COLUMNS = ("total_score", "score")
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class DecoyArchive:
+    """只读访问压缩归档，按成员随机读取，不需要解压整个文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def rnp_ids(self):
+        """归档中的 RNP ID"""
+        return sorted({name.split("/", 1)[0] for name in self.zip.namelist() if "/" in name})
+
+    def manifest(self, rnp_id):
+        return json.loads(self.zip.read(f"{rnp_id}/{MANIFEST_MEMBER}"))
+
+    def tags(self, rnp_id):
+        """某个 RNP 保留的 decoy 标签（按 total_score 从好到差）"""
+        return self.manifest(rnp_id)["tags"]
+
+    def scores(self, rnp_id=None):
+        """读取嵌入的 score 表，默认合并所有 RNP"""
+        rnp_ids = [rnp_id] if rnp_id else self.rnp_ids()
+        frames = [pd.read_csv(self.zip.open(f"{rnp}/{SCORES_MEMBER}")) for rnp in rnp_ids]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def read(self, rnp_id, tag, suffix=".silent"):
+        """读取一个 decoy 的 silent 文件（或 suffix=".pdb" 读取 PDB）"""
+        return self.zip.read(f"{rnp_id}/{tag}{suffix}").decode()
+
+    def open(self, rnp_id, tag, suffix=".silent"):
+        """以文本流方式打开一个 decoy，逐行读取时只解压需要的部分"""
+        return io.TextIOWrapper(self.zip.open(f"{rnp_id}/{tag}{suffix}"))
+
+    def iter_decoys(self, rnp_ids=None):
+        """
+        依次产出 (rnp_id, tag, silent 文本)
+
+        Args:
+            rnp_ids (list[str]): 只读取这些 RNP，默认全部
+        """
+        for rnp_id in rnp_ids or self.rnp_ids():
+            for tag in self.tags(rnp_id):
+                yield rnp_id, tag, self.read(rnp_id, tag)
+
+    def verify(self, rnp_ids=None):
+        """
+        按 manifest 校验成员的 sha256
+
+        Args:
+            rnp_ids (list[str]): 只校验这些 RNP，默认全部
+
+        Returns:
+            list[str]: 校验失败或缺失的成员
+        """
+        bad = []
+        names = set(self.zip.namelist())
+        for rnp_id in rnp_ids or self.rnp_ids():
+            for member, digest in self.manifest(rnp_id)["sha256"].items():
+                if member not in names or sha256(self.zip.read(member)) != digest:
+                    bad.append(member)
+        return bad
+
+
+def score_column(scores):
+    """用于排序的 score 列，没有时返回 None"""
+    return next((column for column in SCORE_COLUMNS if column in scores.columns), None)
+
+
+def silent_tags(silent_file):
+    """silent 文件中所有 decoy 的标签"""
+    return {tag for _, tag, _ in iter_decoys(silent_file) if tag is not None}
+
+
+def select_top_decoys(sample_dir, top_n, tags):
+    """
+    选出 silent 文件中 score 最好的 top_n 个 decoy
+
+    优先使用 collect_scores.py 生成的 scores.sc：description 去掉 score_jd2 的 _0001 编号后与 silent 标签匹配，
+    只保留 default.out 中存在的 decoy（同一标签打分多次时取最后一次）。scores.sc 不存在或没有匹配的行时，
+    直接读取 default.out 中的 SCORE 行（rna_denovo 输出的是 score 列，没有 total_score）。
+
+    Args:
+        tags (set[str]): default.out 中的 decoy 标签
+
+    Returns:
+        pd.DataFrame: 保留的 decoy 的 score 行（description 列为 decoy 标签）；没有可用的 score 时返回 None
+    """
+    for name in ("scores.sc", "default.out"):
+        path = os.path.join(sample_dir, name)
+        if not os.path.exists(path):
+            continue
+        scores = read_score_file(path)
+        if scores is None or "description" not in scores.columns or score_column(scores) is None:
+            continue
+        scores["description"] = decoy_tags(scores["description"])
+        scores = scores[scores["description"].isin(tags)].drop_duplicates("description", keep="last")
+        if not scores.empty:
+            return scores.nsmallest(top_n, score_column(scores)).reset_index(drop=True)
+    return None
+
+
+def plan_pair(sample_dir, top_n):
+    """
+    选出一个 RNP 需要归档的 decoy，不读取 decoy 内容
+
+    Returns:
+        pd.DataFrame | None: 保留的 decoy 的 score 行；没有可归档的 decoy 时返回 None
+    """
+    silent_file = os.path.join(sample_dir, "default.out")
+    if not os.path.exists(silent_file):
+        return None
+    return select_top_decoys(sample_dir, top_n, silent_tags(silent_file))
+
+
+def read_pair(sample_dir, rnp_id, top):
+    """
+    读取一个 RNP 需要写入归档的成员
+
+    Returns:
+        tuple[dict, list[str]]: ({成员名: 内容字节}, 写入归档的 PDB 文件路径)
+    """
+    tags = [str(tag) for tag in top["description"]]
+    wanted = set(tags)
+    members, archived_pdbs = {}, []
+
+    header = []
+    for decoy_header, tag, lines in iter_decoys(os.path.join(sample_dir, "default.out")):
+        if tag is None:
+            header = decoy_header
+        elif tag in wanted:
+            members[f"{rnp_id}/{tag}.silent"] = "".join(header + lines).encode()
+
+    # 已提取的 PDB：default.out.N.pdb 按 score 项 / 排名找回标签，找不到的不归档
+    pdb_tags = extracted_pdb_tags(sample_dir)
+    unmatched = [os.path.basename(pdb) for pdb, tag in pdb_tags.items() if tag is None]
+    if unmatched:
+        get_logger('compact_results').warning(f"{rnp_id}: 无法确定 {', '.join(unmatched)} 对应的 decoy，不归档也不删除")
+    for pdb, tag in pdb_tags.items():
+        name = f"{rnp_id}/{tag}.pdb"
+        if tag in wanted and name not in members:
+            with open(pdb, "rb") as f:
+                members[name] = f.read()
+            archived_pdbs.append(pdb)
+
+    top.insert(0, "sample_id", rnp_id)
+    members[f"{rnp_id}/{SCORES_MEMBER}"] = top.to_csv(index=False).encode()
+    manifest = {"tags": tags, "sha256": {name: sha256(data) for name, data in members.items()}}
+    members[f"{rnp_id}/{MANIFEST_MEMBER}"] = json.dumps(manifest, ensure_ascii=False, indent=2).encode()
+    return members, archived_pdbs
+
+
+def gzip_file(path):
+    """把文件压缩为 <path>.gz 后删除原文件"""
+    with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+
+
+def clean_pair(sample_dir, archived_pdbs, rest):
+    """
+    处理已归档的 RNP 的原始文件
+
+    Args:
+        archived_pdbs (list[str]): 已写入归档并通过校验的 PDB，删除；其余 PDB 不处理
+        rest (str): default.out 的处理方式：gzip（压缩）、delete（删除）或 keep（保留，此时 PDB 也保留）
+    """
+    if rest == "keep":
+        return
+    for pdb in archived_pdbs:
+        os.remove(pdb)
+    silent_file = os.path.join(sample_dir, "default.out")
+    if os.path.exists(silent_file):
+        gzip_file(silent_file) if rest == "gzip" else os.remove(silent_file)
+
+
+def compact(results_dir, archive_path=None, top_n=5, rest="gzip", compresslevel=6, dry_run=False):
+    """
+    把结果目录中每个 RNP 最好的 top_n 个 decoy 写入归档并校验，然后处理原始文件
+
+    Returns:
+        dict: {archived, skipped, bytes_before, bytes_after}
+    """
+    logger = get_logger('compact_results')
+    archive_path = archive_path or os.path.join(results_dir, ARCHIVE_NAME)
+    existing = set()
+    if os.path.exists(archive_path):
+        with DecoyArchive(archive_path) as archive:
+            existing = set(archive.rnp_ids())
+
+    rnp_ids = sorted(entry for entry in os.listdir(results_dir)
+                     if os.path.isdir(os.path.join(results_dir, entry)) and entry not in existing)
+    stats = {"archived": 0, "skipped": len(existing), "bytes_before": 0, "bytes_after": 0}
+    # 逐个 RNP 选择 decoy，失败的记录并跳过
+    plans = {}
+    for rnp_id in rnp_ids:
+        try:
+            top = plan_pair(os.path.join(results_dir, rnp_id), top_n)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"{rnp_id} 选择 decoy 失败，跳过: {e}")
+            continue
+        if top is None:
+            logger.warning(f"{rnp_id} 没有可归档的 decoy，跳过")
+            continue
+        plans[rnp_id] = top
+    if dry_run:
+        logger.info(f"将归档 {len(plans)}/{len(rnp_ids)} 个 RNP（已归档 {len(existing)} 个），每个保留 {top_n} 个 decoy")
+        return stats
+    if not plans:
+        return stats
+
+    # 写入临时归档（已有归档时先复制一份再追加），校验通过后再替换，中断时旧归档不受影响
+    tmp_path = f"{archive_path}.tmp{os.getpid()}"
+    archived = {}
+    try:
+        append = os.path.exists(archive_path)
+        if append:
+            shutil.copyfile(archive_path, tmp_path)
+        with zipfile.ZipFile(tmp_path, "a" if append else "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+            for rnp_id, top in plans.items():
+                try:
+                    members, archived_pdbs = read_pair(os.path.join(results_dir, rnp_id), rnp_id, top)
+                except (OSError, ValueError) as e:
+                    logger.error(f"{rnp_id} 读取失败，跳过: {e}")
+                    continue
+                for name, data in members.items():
+                    zf.writestr(name, data)
+                archived[rnp_id] = archived_pdbs
+
+        # 重新打开归档校验本次写入的成员，全部一致才替换旧归档并处理原始文件
+        with DecoyArchive(tmp_path) as archive:
+            bad = archive.verify(list(archived))
+        if bad:
+            raise RuntimeError(f"归档校验失败（{len(bad)} 个成员），原始文件未改动: {', '.join(bad[:5])}")
+        os.replace(tmp_path, archive_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"归档校验通过: {archive_path}（本次 {len(archived)} 个 RNP）")
+
+    for rnp_id, archived_pdbs in archived.items():
+        sample_dir = os.path.join(results_dir, rnp_id)
+        stats["bytes_before"] += dir_size(sample_dir)
+        clean_pair(sample_dir, archived_pdbs, rest)
+        stats["bytes_after"] += dir_size(sample_dir)
+    stats["archived"] = len(archived)
+    return stats
+
+
+def dir_size(path):
+    """目录（不含子目录）中文件的总大小"""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对接结果压缩归档')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help='归档每个 RNP 最好的 decoy 并处理原始文件')
+    compact_parser.add_argument('--results_dir', required=True, help='结果目录（每个 RNP 一个子目录）')
+    compact_parser.add_argument('--archive', help=f'归档路径，默认为 <results_dir>/{ARCHIVE_NAME}')
+    compact_parser.add_argument('--top_n', type=int, default=5, help='每个 RNP 保留的 decoy 数，默认 5')
+    compact_parser.add_argument('--rest', choices=REST_MODES, default='gzip',
+                                help='归档后原始 silent 文件的处理方式（已归档的 PDB 随之删除），默认 gzip')
+    compact_parser.add_argument('--compresslevel', type=int, default=6, help='压缩级别 0-9，默认 6')
+    compact_parser.add_argument('--dry_run', action='store_true', help='只统计需要归档的 RNP')
+
+    verify_parser = subparsers.add_parser('verify', help='校验归档')
+    verify_parser.add_argument('--archive', required=True, help='归档路径')
+
+    extract_parser = subparsers.add_parser('extract', help='从归档中取出 decoy')
+    extract_parser.add_argument('--archive', required=True, help='归档路径')
+    extract_parser.add_argument('--rnp_id', required=True, help='RNP ID')
+    extract_parser.add_argument('--tag', help='decoy 标签，默认取出该 RNP 保留的所有 decoy')
+    extract_parser.add_argument('--out', required=True, help='输出文件（一个 decoy）或目录（多个 decoy）')
+    extract_parser.add_argument('--pdb', action='store_true', help='取出 PDB 而不是 silent 文件')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+
+    if args.command == 'compact':
+        stats = compact(args.results_dir, args.archive, args.top_n, args.rest, args.compresslevel, args.dry_run)
+        if not args.dry_run:
+            logger.info(f"本次归档 {stats['archived']} 个 RNP（之前已归档 {stats['skipped']} 个），"
+                        f"结果目录大小 {stats['bytes_before'] / 1024 ** 2:.1f} MB -> "
+                        f"{stats['bytes_after'] / 1024 ** 2:.1f} MB")
+        return
+
+    with DecoyArchive(args.archive) as archive:
+        if args.command == 'verify':
+            bad = archive.verify()
+            if bad:
+                logger.error(f"校验失败的成员: {', '.join(bad)}")
+                raise SystemExit(1)
+            logger.info(f"校验通过: {len(archive.rnp_ids())} 个 RNP")
+            return
+
+        suffix = ".pdb" if args.pdb else ".silent"
+        if args.tag:
+            with open(args.out, "w") as f:
+                f.write(archive.read(args.rnp_id, args.tag, suffix))
+            logger.info(f"已取出 {args.rnp_id} {args.tag} 到 {args.out}")
+            return
+        os.makedirs(args.out, exist_ok=True)
+        for tag in archive.tags(args.rnp_id):
+            with open(os.path.join(args.out, f"{tag}{suffix}"), "w") as f:
+                f.write(archive.read(args.rnp_id, tag, suffix))
+        logger.info(f"已取出 {args.rnp_id} 的 {len(archive.tags(args.rnp_id))} 个 decoy 到 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
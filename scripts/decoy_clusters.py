@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按 RNA 坐标 RMSD 对每个 RNP 的 decoy 聚类，选出代表结构
+
+collect_scores.py 默认每个 RNP 只取 total_score 最小的一个 decoy，单个 decoy 的 score 噪声较大。
+这里读取每个 RNP 已提取的 decoy PDB 中的 RNA 重原子坐标，批量计算两两叠合后的 RMSD，
+再按半径聚类：每次取半径内邻居最多的 decoy 作为聚类中心，中心和它的邻居组成一个聚类，
+从剩余 decoy 中重复此过程。最大聚类的大小（占 decoy 的比例）反映对接收敛程度，
+最大聚类中 total_score 最好的 decoy 作为该 RNP 的代表结构。
+
+两两 RMSD 用向量化的 Kabsch 算法计算：所有 decoy 先平移到质心，
+一次矩阵乘法得到全部 3×3 协方差矩阵，再批量求奇异值，由奇异值直接得到最优叠合后的 RMSD，不需要逐个原子或逐对循环。
+
+用法：
+    decoy_clusters.py --results_dir work/rosetta/Sf_in_Bm/results --out_file work/rosetta/Sf_in_Bm/results/clusters.csv
+"""
+
+import os
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from collect_scores import read_score_file, decoy_tags
+from executor_utils import default_max_workers
+from interface_contacts import load_pdb, find_decoy_pdbs
+from silent_files import extracted_pdb_tags
+from logger_utils import setup_logger, get_logger
+
+DEFAULT_RADIUS = 2.0
+
+
+def rna_coordinates(paths):
+    """
+    读取一组 decoy 的 RNA 重原子坐标，只保留所有 decoy 共有的原子，并按相同顺序排列
+
+    Returns:
+        np.ndarray: (n_decoys, n_atoms, 3)
+    """
+    keys, coords = [], []
+    for path in paths:
+        atoms = load_pdb(path)
+        atoms = atoms.subset(atoms.is_rna)
+        keys.append(np.char.add(np.char.add(atoms.res_seq.astype(str), ":"), atoms.atom_names))
+        coords.append(atoms.coords)
+    if not keys:
+        return np.zeros((0, 0, 3))
+    # 共有原子的键（排序、去重），再按它取出每个 decoy 中对应原子的坐标
+    common = keys[0]
+    for decoy_keys in keys[1:]:
+        common = np.intersect1d(common, decoy_keys)
+    return np.stack([decoy_coords[np.intersect1d(common, decoy_keys, return_indices=True)[2]]
+                     for decoy_keys, decoy_coords in zip(keys, coords)]).reshape(len(keys), len(common), 3)
+
+
+def pairwise_rmsd(coords):
+    """
+    向量化 Kabsch：计算所有 decoy 两两最优叠合后的 RMSD
+
+    Args:
+        coords (np.ndarray): (n_decoys, n_atoms, 3)
+
+    Returns:
+        np.ndarray: (n_decoys, n_decoys) 对称 RMSD 矩阵
+    """
+    n, m = coords.shape[:2]
+    if n == 0 or m == 0:
+        return np.zeros((n, n))
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    norms = (centered ** 2).sum(axis=(1, 2))
+    # 所有 decoy 对的协方差矩阵 (n, n, 3, 3)：一次 (3n × m) @ (m × 3n) 矩阵乘法
+    flat = centered.transpose(0, 2, 1).reshape(n * 3, m)
+    covariance = (flat @ flat.T).reshape(n, 3, n, 3).transpose(0, 2, 1, 3)
+    # 奇异值为 CᵀC 特征值的平方根（从小到大排列）
+    s = np.sqrt(np.clip(np.linalg.eigvalsh(np.swapaxes(covariance, -1, -2) @ covariance), 0, None))
+    # 行列式为负时最优变换是反射，把最小奇异值取负得到最优旋转
+    s[..., 0] *= np.where(np.linalg.det(covariance) < 0, -1, 1)
+    msd = (norms[:, None] + norms[None, :] - 2 * s.sum(axis=-1)) / m
+    rmsd = np.sqrt(np.clip(msd, 0, None))
+    np.fill_diagonal(rmsd, 0)
+    return (rmsd + rmsd.T) / 2
+
+
+def radius_clusters(rmsd, radius):
+    """
+    半径聚类：每次取半径内邻居最多的 decoy 作为中心（邻居数相同时取序号小的）
+
+    Returns:
+        np.ndarray: 每个 decoy 的聚类编号，0 为最大的聚类
+    """
+    n = len(rmsd)
+    labels = np.full(n, -1)
+    neighbors = rmsd <= radius
+    cluster = 0
+    while (labels < 0).any():
+        remaining = labels < 0
+        counts = (neighbors & remaining[None, :]).sum(axis=1)
+        counts[~remaining] = -1
+        center = int(np.argmax(counts))
+        labels[neighbors[center] & remaining] = cluster
+        cluster += 1
+    return labels
+
+
+def decoy_scores(sample_dir, paths):
+    """
+    从 scores.sc 中取出各 decoy PDB 的标签和 total_score，匹配不到为 NaN
+
+    PDB 对应的标签由 silent_files.extracted_pdb_tags 确定：extract_lowscore_decoys.py 提取的 default.out.N.pdb
+    按 PDB 末尾的 score 项或排名找回标签（无法确定时为 None），其余 PDB 的文件名即标签。
+    description 去掉 score_jd2 的 _0001 编号后与标签匹配（S_000001_1_0001 -> S_000001_1），同一标签打分多次时取最后一次。
+
+    Returns:
+        tuple[list, np.ndarray]: (各 PDB 的标签, total_score)
+    """
+    pdb_tags = extracted_pdb_tags(sample_dir)
+    tags = [pdb_tags.get(path, os.path.basename(path)[:-len(".pdb")]) for path in paths]
+    score_path = os.path.join(sample_dir, "scores.sc")
+    scores = read_score_file(score_path) if os.path.exists(score_path) else None
+    if scores is None or "description" not in scores.columns or "total_score" not in scores.columns:
+        return tags, np.full(len(paths), np.nan)
+    by_tag = scores.set_index(decoy_tags(scores["description"]))["total_score"]
+    by_tag = by_tag[~by_tag.index.duplicated(keep="last")]
+    return tags, by_tag.reindex(tags).to_numpy(dtype=float)
+
+
+def cluster_pair(job):
+    """
+    进程池任务：聚类一个 RNP 的 decoy
+
+    Returns:
+        tuple[dict, pd.DataFrame]: (该 RNP 的汇总, 每个 decoy 的聚类编号和 score)
+    """
+    sample_id, decoys, paths, radius = job
+    coords = rna_coordinates(paths)
+    labels = radius_clusters(pairwise_rmsd(coords), radius)
+    tags, scores = decoy_scores(os.path.dirname(paths[0]), paths)
+    members = pd.DataFrame({"sample_id": sample_id, "decoy": decoys, "tag": tags, "cluster": labels,
+                            "total_score": scores})
+
+    largest = members[members["cluster"] == 0]
+    # score 缺失时按文件名顺序取第一个
+    representative = largest.sort_values("total_score", na_position="last", kind="stable").iloc[0]
+    best = members.sort_values("total_score", na_position="last", kind="stable").iloc[0]
+    summary = {
+        "sample_id": sample_id,
+        "n_decoys": len(members),
+        "n_atoms": coords.shape[1],
+        "n_clusters": int(labels.max()) + 1,
+        "largest_cluster_size": len(largest),
+        "largest_cluster_fraction": len(largest) / len(members),
+        "representative": representative["decoy"],
+        "representative_score": representative["total_score"],
+        "best_decoy": best["decoy"],
+        "best_score": best["total_score"],
+    }
+    return summary, members
+
+
+def cluster_decoys(results_dir, radius=DEFAULT_RADIUS, max_workers=None):
+    """
+    用进程池聚类结果目录中每个 RNP 的 decoy
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: (每个 RNP 一行的汇总, 每个 decoy 一行的聚类结果)
+    """
+    logger = get_logger('decoy_clusters')
+    by_sample = defaultdict(list)
+    for sample_id, decoy, pdb in find_decoy_pdbs(results_dir):
+        by_sample[sample_id].append((decoy, pdb))
+    logger.info(f"找到 {len(by_sample)} 个 RNP，共 {sum(len(v) for v in by_sample.values())} 个 decoy PDB")
+
+    jobs = [(sample_id, [decoy for decoy, _ in items], [pdb for _, pdb in items], radius)
+            for sample_id, items in sorted(by_sample.items())]
+    summaries, members = [], []
+    if jobs:
+        max_workers = max_workers or default_max_workers()
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for summary, pair_members in pool.map(cluster_pair, jobs):
+                summaries.append(summary)
+                members.append(pair_members)
+    if not summaries:
+        return pd.DataFrame(), pd.DataFrame()
+    return pd.DataFrame(summaries), pd.concat(members, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按 RNA 坐标 RMSD 对每个 RNP 的 decoy 聚类，选出代表结构')
+    parser.add_argument('--results_dir', required=True, help='结果目录（每个 RNP 一个子目录，包含提取的 decoy PDB 和 scores.sc）')
+    parser.add_argument('--out_file', required=True, help='每个 RNP 一行的汇总 CSV')
+    parser.add_argument('--members_file', help='每个 decoy 一行的聚类结果 CSV（可选）')
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS, help=f'聚类半径（Å），默认 {DEFAULT_RADIUS}')
+    parser.add_argument('--max_workers', type=int, help='进程数，默认根据可用 CPU 核数和内存自动推导')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+    summary, members = cluster_decoys(args.results_dir, args.radius, args.max_workers)
+    if summary.empty:
+        logger.warning("没有找到 decoy PDB")
+        return
+
+    out_dir = os.path.dirname(args.out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    summary.to_csv(args.out_file, index=False)
+    logger.info(f"聚类汇总已保存到: {args.out_file}")
+    if args.members_file:
+        members.to_csv(args.members_file, index=False)
+        logger.info(f"decoy 聚类结果已保存到: {args.members_file}")
+    logger.info(f"最大聚类占比中位数: {summary['largest_cluster_fraction'].median():.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,12 +10,13 @@ python design_mutant_library.py --input_ID <tRNA ID> --input_ID_map <tRNA ID 映
 
 import os
 import argparse
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 from dataclasses import dataclass, field
+from fasta_io import FastaWriter
 from generate_trna_name_map import parse_trnascan_output
-from logger_utils import setup_logger, get_logger
+from logger_utils import setup_logger, get_logger, lazy, stage
+from profile_utils import add_profile_arguments, start_profiling
+from shard_utils import add_shard_argument, select_shard, shard_path
+from trna_structure import find_anticodon
 
 @dataclass
 class tRNARecord:
@@ -26,6 +27,8 @@ class tRNARecord:
     amino_acid_type: str
     structure: str
     mutants: list[str] = field(default_factory=list)
+    # 反密码子第一个碱基在 seq 中的位置（从 0 开始），由 locate_anticodons 根据 Str: 行确定
+    anticodon_start: int | None = None
 
 def parse_arguments():
     '''
@@ -36,11 +39,13 @@ def parse_arguments():
     parser.add_argument('--input_ID_map', required=True, help='输入 tRNA ID 映射文件')
     parser.add_argument('--input_structure', required=True, help='输入 tRNA 结构文件')
     parser.add_argument('--out_file', required=True, help='输出FASTA文件路径')
+    add_shard_argument(parser, 'tRNA ID')
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 def read_tRNA_id(input_IDs_file, input_ID_map):
     logger = get_logger('design_mutant_library')
-    logger.info(f"开始读取tRNA ID，候选文件: {input_IDs_file}，映射文件: {input_ID_map}")
+    logger.info("开始读取tRNA ID，候选文件: %s，映射文件: %s", input_IDs_file, input_ID_map)
 
     tRNA_ids = []
     tRNA_ids_dict = {}
@@ -53,9 +58,9 @@ def read_tRNA_id(input_IDs_file, input_ID_map):
             if line.startswith('tRNA'):
                 tRNA_id = line.split(',')[0]  # 支持逗号分隔格式
                 tRNA_ids.append(tRNA_id)
-                logger.debug(f"找到候选tRNA: {tRNA_id}")
+                logger.debug("找到候选tRNA: %s", tRNA_id)
 
-    logger.info(f"共读取到 {len(tRNA_ids)} 个候选tRNA ID")
+    logger.info("共读取到 %d 个候选tRNA ID", len(tRNA_ids))
 
     # 读取映射文件并进行匹配
     logger.info("读取映射文件并进行ID匹配...")
@@ -70,35 +75,35 @@ def read_tRNA_id(input_IDs_file, input_ID_map):
                     target_pattern = tRNA_id + "-1"
                     if str(target_pattern) == str(gtrnadb_id):
                         tRNA_ids_dict[tRNA_id] = trnascan_id
-                        logger.debug(f"ID匹配成功: {tRNA_id} -> {trnascan_id}")
+                        logger.debug("ID匹配成功: %s -> %s", tRNA_id, trnascan_id)
                         break
 
-    logger.info(f"ID映射完成: {len(tRNA_ids_dict)}/{len(tRNA_ids)} 个tRNA找到了映射")
+    logger.info("ID映射完成: %d/%d 个tRNA找到了映射", len(tRNA_ids_dict), len(tRNA_ids))
 
     # 记录未找到映射的tRNA
     missing_ids = [tid for tid in tRNA_ids if tid not in tRNA_ids_dict]
     if missing_ids:
-        logger.warning(f"以下 {len(missing_ids)} 个tRNA未找到映射:")
+        logger.warning("以下 %d 个tRNA未找到映射:", len(missing_ids))
         for mid in missing_ids:
-            logger.warning(f"  未映射: {mid}")
+            logger.warning("  未映射: %s", mid)
 
     return tRNA_ids_dict
 
 def tRNA_prepare(input_IDs_file, input_ID_map, input_structure) -> list[tRNARecord]:
     logger = get_logger('design_mutant_library')
-    logger.info(f"开始准备tRNA数据，结构文件: {input_structure}")
+    logger.info("开始准备tRNA数据，结构文件: %s", input_structure)
 
     tRNA_ids_dict = read_tRNA_id(input_IDs_file, input_ID_map)
 
     logger.info("解析tRNAscan-SE结构文件...")
     trnas = parse_trnascan_output(input_structure)
-    logger.info(f"从结构文件中解析到 {len(trnas)} 个tRNA条目")
+    logger.info("从结构文件中解析到 %d 个tRNA条目", len(trnas))
 
     tRNA_records = []
     found_count = 0
 
     for tRNA_id, trna_name in tRNA_ids_dict.items():
-        logger.debug(f"查找tRNA {tRNA_id} (tRNAscan ID: {trna_name})的结构信息")
+        logger.debug("查找tRNA %s (tRNAscan ID: %s)的结构信息", tRNA_id, trna_name)
 
         structure_found = False
         for trna in trnas:
@@ -106,20 +111,20 @@ def tRNA_prepare(input_IDs_file, input_ID_map, input_structure) -> list[tRNAReco
                 tRNA_records.append(tRNARecord(trna_name, tRNA_id, trna['sequence'], trna['anticodon'], trna['aa_type'], trna['structure'], []))
                 found_count += 1
                 structure_found = True
-                logger.info(f"找到结构: {tRNA_id} -> 反密码子: {trna['anticodon']}, 氨基酸: {trna['aa_type']}, 序列长度: {len(trna['sequence'])}")
+                logger.info("找到结构: %s -> 反密码子: %s, 氨基酸: %s, 序列长度: %d", tRNA_id, trna['anticodon'], trna['aa_type'], len(trna['sequence']))
                 break
 
         if not structure_found:
-            logger.warning(f"未找到tRNA {tRNA_id} (tRNAscan ID: {trna_name})的结构信息")
+            logger.warning("未找到tRNA %s (tRNAscan ID: %s)的结构信息", tRNA_id, trna_name)
 
-    logger.info(f"tRNA数据准备完成: {found_count}/{len(tRNA_ids_dict)} 个tRNA找到了完整信息")
+    logger.info("tRNA数据准备完成: %d/%d 个tRNA找到了完整信息", found_count, len(tRNA_ids_dict))
 
     # 记录未找到结构的tRNA
     missing_structures = [tid for tid in tRNA_ids_dict.keys() if tid not in [tr.tRNA_id for tr in tRNA_records]]
     if missing_structures:
-        logger.warning(f"以下 {len(missing_structures)} 个tRNA未找到结构信息:")
+        logger.warning("以下 %d 个tRNA未找到结构信息:", len(missing_structures))
         for mid in missing_structures:
-            logger.warning(f"  缺失结构: {mid}")
+            logger.warning("  缺失结构: %s", mid)
 
     return tRNA_records
 
@@ -181,7 +186,7 @@ def get_amino_acid_from_anticodon(anticodon):
 def generate_alternative_anticodons(original_anticodon, original_aa):
     """生成不同氨基酸的反密码子突变体"""
     logger = get_logger('design_mutant_library')
-    logger.debug(f"为反密码子 {original_anticodon} (氨基酸: {original_aa}) 生成突变体")
+    logger.debug("为反密码子 %s (氨基酸: %s) 生成突变体", original_anticodon, original_aa)
 
     bases = ['A', 'U', 'G', 'C']
     alternatives = []
@@ -199,186 +204,174 @@ def generate_alternative_anticodons(original_anticodon, original_aa):
                 # 只保留编码不同氨基酸的突变体
                 if mutant_aa != original_aa and mutant_aa != 'X':
                     alternatives.append((mutant_anticodon, mutant_aa))
-                    logger.debug(f"  单碱基突变: 位置{i+1} {original_anticodon[i]}->{base}: {mutant_anticodon} -> {mutant_aa}")
+                    logger.debug("  单碱基突变: 位置%d %s->%s: %s -> %s", i + 1, original_anticodon[i], base, mutant_anticodon, mutant_aa)
 
-    logger.debug(f"单碱基突变找到 {len(alternatives)} 个候选")
+    logger.debug("单碱基突变找到 %d 个候选", len(alternatives))
     return alternatives
 
-def mutate_anticodon_in_sequence(sequence, structure, original_anticodon, new_anticodon):
-    """根据二级结构符号精确定位并替换tRNA序列中的反密码子"""
+def locate_anticodon(tRNA_record):
+    """
+    根据 Str: 行的二级结构定位反密码子，并核对序列中该位置的碱基
+
+    Returns:
+        tuple[int | None, str | None]: (反密码子起点, 无法定位的原因)
+    """
+    sequence = tRNA_record.seq.upper()
+    structure = tRNA_record.structure.strip()
+    anticodon = tRNA_record.anticodon.upper().replace('U', 'T')
+
+    if not structure:
+        return None, "结构符号为空"
+    if len(structure) != len(sequence):
+        return None, f"结构符号长度 {len(structure)} 与序列长度 {len(sequence)} 不一致"
+    start = find_anticodon(sequence, structure, anticodon)
+    if start is None:
+        return None, "结构中找不到反密码子环"
+    actual = sequence[start:start + 3].replace('U', 'T')
+    if actual != anticodon:
+        return None, f"结构定位的位置 {start + 1}-{start + 3} 为 '{actual}'，与反密码子 '{anticodon}' 不一致"
+    return start, None
+
+def locate_anticodons(tRNA_records):
+    """
+    为每个 tRNA 预先定位反密码子（每个亲本只计算一次），结果保存在 anticodon_start 中
+
+    Returns:
+        list[tuple[tRNARecord, str]]: 无法定位反密码子的 tRNA 及原因
+    """
     logger = get_logger('design_mutant_library')
-    logger.debug(f"根据结构符号替换反密码子: {original_anticodon} -> {new_anticodon}")
-
-    # structure参数已经是纯净的结构符号字符串
-    structure_str = structure.strip()
-
-    if not structure_str:
-        logger.warning("结构符号为空")
-        return fallback_simple_replace(sequence, original_anticodon, new_anticodon, logger)
-
-    logger.debug(f"结构符号: {structure_str}")
-
-    # 使用结构符号定位反密码子
-    start_pos, end_pos = find_anticodon_position_by_structure(structure_str)
-
-    if start_pos is None or end_pos is None:
-        logger.warning("无法通过结构符号定位反密码子")
-        return fallback_simple_replace(sequence, original_anticodon, new_anticodon, logger)
-
-    # 验证序列中指定位置的反密码子
-    original_anticodon_dna = original_anticodon.replace('U', 'T')
-    actual_anticodon = sequence[start_pos:end_pos]
-
-    if actual_anticodon != original_anticodon_dna:
-        logger.warning(f"结构定位的位置 {start_pos}-{end_pos-1} 反密码子 '{actual_anticodon}' 与预期 '{original_anticodon_dna}' 不匹配")
-        return fallback_simple_replace(sequence, original_anticodon, new_anticodon, logger)
-
-    # 精确替换指定位置的反密码子
-    new_anticodon_dna = new_anticodon.replace('U', 'T')
-    mutated_sequence = sequence[:start_pos] + new_anticodon_dna + sequence[end_pos:]
+    unlocated = []
+    for tRNA_record in tRNA_records:
+        tRNA_record.anticodon_start, reason = locate_anticodon(tRNA_record)
+        if reason:
+            unlocated.append((tRNA_record, reason))
+        else:
+            logger.info("%s 反密码子位于 %d-%d: ...%s...", tRNA_record.tRNA_id, tRNA_record.anticodon_start + 1,
+                        tRNA_record.anticodon_start + 3,
+                        lazy(sequence_window, tRNA_record.seq, tRNA_record.anticodon_start, tRNA_record.anticodon_start + 3))
+    return unlocated
+
+def splice_anticodon(sequence, start, new_anticodon):
+    """把 start 处的 3 个碱基替换为新的反密码子（DNA 字母）"""
+    return sequence[:start] + new_anticodon.replace('U', 'T') + sequence[start + 3:]
+
+def sequence_window(sequence, start_pos, end_pos, flank=5):
+    """反密码子两侧各 flank 个碱基的序列片段（用于日志）"""
+    return sequence[max(0, start_pos - flank):end_pos + flank]
 
-    logger.info(f"成功在位置 {start_pos}-{end_pos-1} 替换反密码子: {actual_anticodon} -> {new_anticodon_dna}")
-    logger.debug(f"原序列片段: ...{sequence[max(0,start_pos-5):end_pos+5]}...")
-    logger.debug(f"新序列片段: ...{mutated_sequence[max(0,start_pos-5):end_pos+5]}...")
+def generate_mutant_library(tRNA_records, out_file):
+    """生成tRNA突变体库（tRNA 记录需已由 locate_anticodons 定位反密码子）"""
+    logger = get_logger('design_mutant_library')
+    logger.info("开始为 %d 个tRNA生成突变体...", len(tRNA_records))
 
-    return mutated_sequence
+    n_original = 0
+    n_mutant = 0
 
-def find_anticodon_position_by_structure(structure_str):
-    """根据tRNA二级结构符号定位反密码子位置"""
+    # 边生成边写入 2 行 FASTA，标题行与原来 SeqIO fasta-2line 的输出一致
+    with FastaWriter(out_file) as writer:
+        for tRNA_record in tRNA_records:
+            logger.info("处理 %s (%s)...", tRNA_record.tRNA_id, tRNA_record.amino_acid_type)
 
-    logger = get_logger('design_mutant_library')
+            # 清理反密码子格式
+            original_anticodon = tRNA_record.anticodon.upper().replace('T', 'U')
+            original_aa = tRNA_record.amino_acid_type
 
-    # 查找 "<.>" 的位置
-    stem_loop_index = structure_str.find("<.>")
-    logger.debug(f"找到 <.> 中的“<”的位置: {stem_loop_index}")
-    # 计算反密码子起始位置：找到 "<.>" 后第一个 "." 的位置，然后加2
-    i = stem_loop_index + 2
-    while i < len(structure_str) and structure_str[i] == ">":
-        i += 1
-    anticodon_start = i + 3
-    anticodon_end = anticodon_start + 3
-    logger.debug(f"找到反密码子起始位置: {anticodon_start}, 反密码子结束位置: {anticodon_end}")
-    return anticodon_start, anticodon_end
-
-def fallback_simple_replace(sequence, original_anticodon, new_anticodon, logger):
-    """简单替换序列中的反密码子（不使用结构符号）"""
-    original_anticodon_dna = original_anticodon.replace('U', 'T')
-    new_anticodon_dna = new_anticodon.replace('U', 'T')
-
-    if original_anticodon_dna in sequence:
-        mutated_sequence = sequence.replace(original_anticodon_dna, new_anticodon_dna)
-        logger.debug(f"成功替换反密码子")
-        return mutated_sequence
-
-    logger.warning(f"无法在序列中找到反密码子 {original_anticodon}")
-    return sequence
+            logger.debug("原始反密码子: %s -> %s", original_anticodon, original_aa)
 
-def generate_mutant_library(tRNA_records, out_file):
-    """生成tRNA突变体库"""
-    logger = get_logger('design_mutant_library')
-    logger.info(f"开始为 {len(tRNA_records)} 个tRNA生成突变体...")
+            # 添加原始tRNA序列
+            writer.write(f"{tRNA_record.tRNA_id}_original aa:{original_aa}", tRNA_record.seq)
+            n_original += 1
 
-    output_records = []
+            # 生成突变体
+            mutant_anticodons = generate_alternative_anticodons(original_anticodon, original_aa)
 
-    for tRNA_record in tRNA_records:
-        logger.info(f"处理 {tRNA_record.tRNA_id} ({tRNA_record.amino_acid_type})...")
+            logger.info("为 %s 生成了 %d 个突变体", tRNA_record.tRNA_id, len(mutant_anticodons))
+            if len(mutant_anticodons) == 0:
+                logger.warning("未能为 %s 生成任何突变体", tRNA_record.tRNA_id)
+                continue
 
-        # 清理反密码子格式
-        original_anticodon = tRNA_record.anticodon.upper().replace('T', 'U')
-        original_aa = tRNA_record.amino_acid_type
+            for i, (mutant_anticodon, mutant_aa) in enumerate(mutant_anticodons, 1):
+                logger.info("  突变体%d: %s -> %s", i, mutant_anticodon, mutant_aa)
 
-        logger.debug(f"原始反密码子: {original_anticodon} -> {original_aa}")
+                # 在预先定位的位置替换反密码子
+                mutated_sequence = splice_anticodon(tRNA_record.seq, tRNA_record.anticodon_start, mutant_anticodon)
 
-        # 添加原始tRNA序列
-        original_record = SeqRecord(
-            Seq(tRNA_record.seq),
-            id=f"{tRNA_record.tRNA_id}_original",
-            description=f"aa:{original_aa}"
-        )
-        output_records.append(original_record)
+                # 写入突变体记录
+                mutant_id = f"{tRNA_record.tRNA_id}_mutant{i}"
+                writer.write(f"{mutant_id}  aa:{mutant_aa}", mutated_sequence)
+                n_mutant += 1
+                logger.debug("创建突变体记录: %s, 序列长度: %d", mutant_id, len(mutated_sequence))
 
-        # 生成突变体
-        mutant_anticodons = generate_alternative_anticodons(original_anticodon, original_aa)
-
-        logger.info(f"为 {tRNA_record.tRNA_id} 生成了 {len(mutant_anticodons)} 个突变体")
-        if len(mutant_anticodons) == 0:
-            logger.warning(f"未能为 {tRNA_record.tRNA_id} 生成任何突变体")
-            continue
-
-        for i, (mutant_anticodon, mutant_aa) in enumerate(mutant_anticodons, 1):
-            logger.info(f"  突变体{i}: {mutant_anticodon} -> {mutant_aa}")
-
-            # 在序列中替换反密码子
-            mutated_sequence = mutate_anticodon_in_sequence(
-                tRNA_record.seq,
-                tRNA_record.structure,
-                original_anticodon,
-                mutant_anticodon
-            )
-
-            # 创建突变体记录
-            mutant_record = SeqRecord(
-                Seq(mutated_sequence),
-                id=f"{tRNA_record.tRNA_id}_mutant{i}",
-                description=f" aa:{mutant_aa}"
-            )
-            output_records.append(mutant_record)
-            logger.debug(f"创建突变体记录: {mutant_record.id}, 序列长度: {len(mutated_sequence)}")
-
-    # 写入FASTA文件
-    logger.info(f"将 {len(output_records)} 个序列写入 {out_file}...")
-    try:
-        SeqIO.write(output_records, out_file, "fasta-2line")
-        logger.info(f"突变体库生成完成！输出文件: {out_file}")
-        logger.info(f"总计生成: {len([r for r in output_records if 'original' in r.id])} 个原始tRNA + {len([r for r in output_records if 'mutant' in r.id])} 个突变体")
-    except Exception as e:
-        logger.error(f"写入FASTA文件失败: {e}")
-        raise
+    logger.info("突变体库生成完成！输出文件: %s", out_file)
+    logger.info("总计生成: %d 个原始tRNA + %d 个突变体", n_original, n_mutant)
 
 def main():
     # 初始化日志系统
-    logger = setup_logger(__file__)
+    logger = setup_logger(__file__, queue=True)
     logger.info("="*60)
     logger.info("tRNA突变体设计脚本开始运行")
     logger.info("="*60)
 
     try:
         args = parse_arguments()
-        logger.info(f"命令行参数:")
-        logger.info(f"  候选tRNA文件: {args.input_IDs_file}")
-        logger.info(f"  ID映射文件: {args.input_ID_map}")
-        logger.info(f"  结构文件: {args.input_structure}")
-        logger.info(f"  输出文件: {args.out_file}")
+        start_profiling(args, __file__)
+        logger.info("命令行参数:")
+        logger.info("  候选tRNA文件: %s", args.input_IDs_file)
+        logger.info("  ID映射文件: %s", args.input_ID_map)
+        logger.info("  结构文件: %s", args.input_structure)
+        # 分片运行时输出文件名带 .shard<k>of<N>，用 shard_utils.py merge library 合并
+        out_file = shard_path(args.out_file, args.shard)
+        logger.info("  输出文件: %s", out_file)
 
         # 检查输入文件是否存在
         for file_path, file_desc in [(args.input_IDs_file, "候选tRNA文件"),
                                      (args.input_ID_map, "ID映射文件"),
                                      (args.input_structure, "结构文件")]:
             if not os.path.exists(file_path):
-                logger.error(f"{file_desc}不存在: {file_path}")
+                logger.error("%s不存在: %s", file_desc, file_path)
                 raise FileNotFoundError(f"{file_desc}不存在: {file_path}")
-            logger.info(f"{file_desc}存在: {file_path}")
+            logger.info("%s存在: %s", file_desc, file_path)
 
         # 获取 tRNA ID 对应的序列和二级结构
         logger.info("\n步骤1: 准备tRNA数据")
-        tRNA_records = tRNA_prepare(args.input_IDs_file, args.input_ID_map, args.input_structure)
-
-        if not tRNA_records:
+        with stage("步骤1: 准备tRNA数据", logger):
+            tRNA_records = tRNA_prepare(args.input_IDs_file, args.input_ID_map, args.input_structure)
+            if args.shard:
+                total = len(tRNA_records)
+                tRNA_records = select_shard(tRNA_records, args.shard, key=lambda record: record.tRNA_id)
+                logger.info("分片 %d/%d: 处理 %d/%d 个tRNA", args.shard[0], args.shard[1], len(tRNA_records), total)
+
+        # 写出突变体库之前，先为每个亲本 tRNA 定位反密码子并报告无法定位的 tRNA
+        logger.info("\n步骤2: 定位反密码子")
+        with stage("步骤2: 定位反密码子", logger):
+            unlocated = locate_anticodons(tRNA_records)
+            if unlocated:
+                logger.error("以下 %d 个tRNA无法根据结构定位反密码子，不生成突变体:", len(unlocated))
+                for tRNA_record, reason in unlocated:
+                    logger.error("  %s (%s): %s", tRNA_record.tRNA_id, tRNA_record.tRNA_name, reason)
+                tRNA_records = [record for record in tRNA_records if record.anticodon_start is not None]
+            logger.info("反密码子定位完成: %d/%d 个tRNA", len(tRNA_records), len(tRNA_records) + len(unlocated))
+
+        if not tRNA_records and args.shard:
+            # 空分片也写出（空的）输出文件，合并时才能确认所有分片都已完成
+            logger.warning("该分片没有分配到tRNA，输出空文件")
+        elif not tRNA_records:
             logger.error("未找到任何有效的tRNA记录")
             return
 
-        logger.info(f"成功准备了 {len(tRNA_records)} 个tRNA记录")
+        logger.info("成功准备了 %d 个tRNA记录", len(tRNA_records))
 
         # 生成突变体
-        logger.info("\n步骤2: 生成突变体库")
-        generate_mutant_library(tRNA_records, args.out_file)
+        logger.info("\n步骤3: 生成突变体库")
+        with stage("步骤3: 生成突变体库", logger):
+            generate_mutant_library(tRNA_records, out_file)
 
         logger.info("\n" + "="*60)
         logger.info("tRNA突变体设计脚本运行完成")
         logger.info("="*60)
 
     except Exception as e:
-        logger.error(f"脚本运行出错: {e}")
+        logger.error("脚本运行出错: %s", e)
         logger.exception("详细错误信息:")
         raise
 
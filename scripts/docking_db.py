@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RNP 对接任务数据库
+
+用 SQLite 记录每个 tRNA-aaRS 复合物（RNP）预测任务的状态，供 docking_scheduler.py 使用。
+每次运行（包括失败和重试）的运行时间、CPU 时间、峰值内存、序列长度和 decoy 数另外记录在 runs 表中。
+任务只在 init 时扫描一次文件系统写入数据库，之后的续跑、失败重试和节流都只查询数据库。
+
+一个 RNP 的 decoy 可以拆分为多个子任务（part），各自使用不同的随机种子，
+同一 RNP 的子任务共享 pair_id；未拆分的任务 pair_id 与 rnp_id 相同，part 为空。
+
+任务状态：
+    pending  等待运行
+    running  正在运行（已被某个进程领取）
+    done     运行成功
+    failed   运行失败
+
+使用方法：
+    from docking_db import TaskDB
+
+    db = TaskDB("work/rosetta/Sf_in_Bm/tasks.db")
+    task = db.claim_next()
+    ...
+    db.finish(task["id"], return_code, wall_time)
+"""
+
+import socket
+import sqlite3
+from datetime import datetime
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATUSES = (PENDING, RUNNING, DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rnp_id TEXT NOT NULL UNIQUE,
+    fasta TEXT NOT NULL,
+    secstruct TEXT NOT NULL,
+    pdb TEXT NOT NULL,
+    sample_dir TEXT NOT NULL,
+    log_file TEXT NOT NULL,
+    protein_length INTEGER,
+    rna_length INTEGER,
+    est_cost REAL,
+    pair_id TEXT,
+    part INTEGER,
+    n_parts INTEGER,
+    nstruct INTEGER,
+    seed INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    return_code INTEGER,
+    wall_time REAL,
+    host TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER NOT NULL REFERENCES tasks(id),
+    rnp_id TEXT NOT NULL,
+    attempt INTEGER,
+    host TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    return_code INTEGER,
+    wall_time REAL,
+    user_time REAL,
+    system_time REAL,
+    max_rss_kb INTEGER,
+    protein_length INTEGER,
+    rna_length INTEGER,
+    nstruct INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_runs_task ON runs(task_id);
+"""
+
+# pair_id 的索引在补充列之后创建
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tasks_pair ON tasks(pair_id);
+"""
+
+# 旧版本数据库中可能缺少的列：列名 -> 类型
+MIGRATIONS = {
+    "protein_length": "INTEGER",
+    "rna_length": "INTEGER",
+    "est_cost": "REAL",
+    "pair_id": "TEXT",
+    "part": "INTEGER",
+    "n_parts": "INTEGER",
+    "nstruct": "INTEGER",
+    "seed": "INTEGER",
+}
+
+# add_tasks 中可省略的字段及其默认值
+OPTIONAL_FIELDS = {
+    "status": PENDING,
+    "protein_length": None,
+    "rna_length": None,
+    "part": None,
+    "n_parts": None,
+    "nstruct": None,
+    "seed": None,
+}
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class TaskDB:
+    """RNP 对接任务数据库"""
+
+    def __init__(self, path, timeout=120):
+        """
+        Args:
+            path (str): SQLite 数据库文件路径
+            timeout (float): 数据库被其他进程锁定时的等待时间（秒），Slurm 数组任务并发更新时需要
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """为旧版本数据库补充新增的列"""
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+        for column, column_type in MIGRATIONS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+        self.conn.execute("UPDATE tasks SET pair_id = rnp_id WHERE pair_id IS NULL")
+        self.conn.executescript(INDEXES)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        """立即获取写锁的事务，保证多个进程领取任务时不会重复"""
+        return _ImmediateTransaction(self.conn)
+
+    def add_tasks(self, tasks):
+        """
+        添加任务，已存在的 rnp_id 保持不变
+
+        Args:
+            tasks (list[dict]): 含 rnp_id, fasta, secstruct, pdb, sample_dir, log_file，
+                可选 status, protein_length, rna_length, pair_id, part, n_parts, nstruct, seed
+
+        Returns:
+            int: 新增的任务数
+        """
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks "
+                "(rnp_id, fasta, secstruct, pdb, sample_dir, log_file, protein_length, rna_length, "
+                "pair_id, part, n_parts, nstruct, seed, status) "
+                "VALUES (:rnp_id, :fasta, :secstruct, :pdb, :sample_dir, :log_file, :protein_length, :rna_length, "
+                ":pair_id, :part, :n_parts, :nstruct, :seed, :status)",
+                [{**OPTIONAL_FIELDS, "pair_id": task["rnp_id"], **task} for task in tasks],
+            )
+            return self.conn.total_changes - before
+
+    def claim_next(self, limit=1, task_ids=None):
+        """
+        领取若干个 pending 任务并标记为 running
+
+        按估计耗时从大到小领取（最长任务优先），没有估计值的任务排在最后。
+
+        Args:
+            limit (int): 最多领取的任务数
+            task_ids (list[int]): 只从这些任务中领取（例如 Slurm 打包作业中分给当前数组元素的任务）
+
+        Returns:
+            list[sqlite3.Row]: 领取到的任务
+        """
+        query, params = "SELECT * FROM tasks WHERE status = ?", [PENDING]
+        if task_ids is not None:
+            query += f" AND id IN ({','.join('?' * len(task_ids))})"
+            params += list(task_ids)
+        with self._transaction():
+            rows = self.conn.execute(query + " ORDER BY est_cost DESC, id LIMIT ?", (*params, limit)).fetchall()
+            self._mark_running([row["id"] for row in rows])
+        return [self.get(row["id"]) for row in rows]
+
+    def _mark_running(self, task_ids):
+        self.conn.executemany(
+            "UPDATE tasks SET status = ?, attempts = attempts + 1, host = ?, started_at = ?, "
+            "finished_at = NULL, return_code = NULL, wall_time = NULL WHERE id = ?",
+            [(RUNNING, socket.gethostname(), _now(), task_id) for task_id in task_ids],
+        )
+
+    def finish(self, task_id, return_code, wall_time, usage=None, nstruct=None):
+        """
+        记录任务结束：返回码为 0 时标记为 done，否则为 failed；同时在 runs 表中记录本次运行
+
+        Args:
+            usage (dict): 资源使用 {user_time, system_time, max_rss_kb}
+            nstruct (int): 本次运行的 decoy 数
+        """
+        status = DONE if return_code == 0 else FAILED
+        usage = usage or {}
+        finished_at = _now()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, return_code = ?, wall_time = ?, finished_at = ? WHERE id = ?",
+                (status, return_code, wall_time, finished_at, task_id),
+            )
+            self.conn.execute(
+                "INSERT INTO runs (task_id, rnp_id, attempt, host, started_at, finished_at, return_code, wall_time, "
+                "user_time, system_time, max_rss_kb, protein_length, rna_length, nstruct) "
+                "SELECT id, rnp_id, attempts, host, started_at, ?, ?, ?, ?, ?, ?, protein_length, rna_length, "
+                "COALESCE(nstruct, ?) FROM tasks WHERE id = ?",
+                (finished_at, return_code, wall_time, usage.get("user_time"), usage.get("system_time"),
+                 usage.get("max_rss_kb"), nstruct, task_id),
+            )
+        return status
+
+    def runs(self, successful_only=False):
+        """按结束时间顺序返回运行记录"""
+        query = "SELECT * FROM runs"
+        if successful_only:
+            query += " WHERE return_code = 0"
+        return self.conn.execute(query + " ORDER BY finished_at, id").fetchall()
+
+    def release(self, task_ids):
+        """把被中断的 running 任务放回 pending（不计入尝试次数）"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE tasks SET status = ?, attempts = MAX(attempts - 1, 0), started_at = NULL "
+                "WHERE id = ? AND status = ?",
+                [(PENDING, task_id, RUNNING) for task_id in task_ids],
+            )
+
+    def reset(self, statuses, max_attempts=None):
+        """
+        把指定状态的任务重置为 pending
+
+        Args:
+            statuses (tuple[str]): 需要重置的状态，例如 ("failed",) 或 ("running",)
+            max_attempts (int): 只重置尝试次数小于该值的任务
+
+        Returns:
+            int: 重置的任务数
+        """
+        query = f"UPDATE tasks SET status = ? WHERE status IN ({','.join('?' * len(statuses))})"
+        params = [PENDING, *statuses]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        with self._transaction():
+            return self.conn.execute(query, params).rowcount
+
+    def set_lengths(self, lengths):
+        """记录任务的序列长度：{task_id: (protein_length, rna_length)}"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE tasks SET protein_length = ?, rna_length = ? WHERE id = ?",
+                [(protein_length, rna_length, task_id) for task_id, (protein_length, rna_length) in lengths.items()],
+            )
+
+    def set_est_costs(self, costs):
+        """记录任务的估计耗时：{task_id: est_cost}"""
+        with self._transaction():
+            self.conn.executemany("UPDATE tasks SET est_cost = ? WHERE id = ?",
+                                  [(cost, task_id) for task_id, cost in costs.items()])
+
+    def history(self):
+        """返回已完成任务的 [(RNP 序列总长度, 运行时间, nstruct), ...]，nstruct 未记录时为 None"""
+        rows = self.conn.execute(
+            "SELECT protein_length + rna_length AS length, wall_time, nstruct FROM tasks "
+            "WHERE status = ? AND wall_time IS NOT NULL AND protein_length IS NOT NULL", (DONE,)
+        ).fetchall()
+        return [(row["length"], row["wall_time"], row["nstruct"]) for row in rows]
+
+    def pair_ids(self):
+        """返回数据库中所有的 pair_id"""
+        return {row["pair_id"] for row in self.conn.execute("SELECT DISTINCT pair_id FROM tasks")}
+
+    def parts(self, pair_id):
+        """按 part 顺序返回某个 RNP 的所有子任务"""
+        return self.conn.execute("SELECT * FROM tasks WHERE pair_id = ? ORDER BY part", (pair_id,)).fetchall()
+
+    def get(self, task_id):
+        return self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+
+    def tasks(self, status=None):
+        """按 id 顺序返回任务，可按状态过滤"""
+        if status is None:
+            return self.conn.execute("SELECT * FROM tasks ORDER BY id").fetchall()
+        return self.conn.execute("SELECT * FROM tasks WHERE status = ? ORDER BY id", (status,)).fetchall()
+
+    def counts(self):
+        """返回各状态的任务数"""
+        counts = {status: 0 for status in STATUSES}
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return counts
+
+
+class _ImmediateTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,812 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+可续跑的 RNP 对接任务调度器（替代 rna_denovo.sh 和 slurm.sh）
+
+每个 tRNA-aaRS 复合物（RNP）的 rna_denovo 任务记录在 SQLite 任务数据库中（见 docking_db.py），
+包括状态、尝试次数、返回码和运行时间。只有 init 会扫描一次输入目录，
+之后的续跑、失败重试和节流都只依赖数据库。
+
+pending 任务按估计耗时从大到小运行（最长任务优先），估计耗时由 RNP 序列长度和历史运行时间
+拟合的模型给出（见 runtime_model.py），以缩短整个项目的完工时间。
+
+一个 RNP 的 nstruct 个 decoy 可以在 init 时用 --split 拆分为多个子任务，每个子任务使用不同的随机种子、
+在单独的目录中运行；同一 RNP 的子任务全部完成后，各自的 silent 文件合并为该 RNP 的 default.out
+（decoy 标签重新编号，见 silent_files.py）。这样即使剩余的 RNP 很少，也能用满所有核。
+
+后端：
+    local  本地进程池，直接运行 rna_denovo
+    fake   本地进程池，运行本脚本的 fake_rna_denovo 子命令代替 rna_denovo，用于测试
+    slurm  根据数据库生成 Slurm 数组作业脚本，每个数组元素从数据库领取一个任务运行
+
+用法：
+    # 扫描输入目录，建立任务数据库（默认 <input_dir>/tasks.db）
+    docking_scheduler.py init --input_dir work/rosetta/Bm_in_Bm --pdb_dir work/colabfold/Bm_aaRSs_output_pdb
+
+    # 本地运行（中断后重新运行同一命令即可续跑）
+    docking_scheduler.py run --db work/rosetta/Bm_in_Bm/tasks.db --max_workers 32
+
+    # 重试失败的任务
+    docking_scheduler.py run --db work/rosetta/Bm_in_Bm/tasks.db --retry_failed --max_attempts 3
+
+    # 在计算集群上运行：生成并提交数组作业，最多同时运行 200 个任务
+    docking_scheduler.py run --db work/rosetta/Sf_in_Bm/tasks.db --backend slurm --max_workers 200 --submit
+
+    # 每个 RNP 的 20 个 decoy 拆分为 4 个子任务
+    docking_scheduler.py init --input_dir work/rosetta/Bm_in_Bm --pdb_dir work/colabfold/Bm_aaRSs_output_pdb \
+        --nstruct 20 --split 4
+
+    # 查看进度
+    docking_scheduler.py status --db work/rosetta/Sf_in_Bm/tasks.db
+
+    # 运行记录报告：吞吐量、最慢的任务、运行时间模型和建议的资源申请
+    docking_scheduler.py report --db work/rosetta/Sf_in_Bm/tasks.db --top 20
+
+    # 预测不同 worker 数下的完工时间
+    docking_scheduler.py simulate --db work/rosetta/Sf_in_Bm/tasks.db --workers 32 64 128
+"""
+
+import os
+import sys
+import glob
+import time
+import fnmatch
+import json
+import math
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from docking_db import TaskDB, PENDING, RUNNING, DONE, FAILED
+from runtime_model import fit_runtime_model, simulate_makespan, longest_first
+from executor_utils import percentile
+from silent_files import merge_silent_files
+from logger_utils import setup_logger, get_logger
+
+DEFAULT_NSTRUCT = 10
+
+
+def read_rnp_lengths(fasta):
+    """
+    读取 RNP FASTA 中 aaRS（大写）和 tRNA（小写）部分的长度
+
+    Returns:
+        tuple[int, int]: (protein_length, rna_length)
+    """
+    with open(fasta) as f:
+        sequence = "".join(line.strip() for line in f if not line.startswith(">"))
+    rna_length = sum(1 for base in sequence if base.islower())
+    return len(sequence) - rna_length, rna_length
+
+
+def part_seed(pair_id, part):
+    """由 RNP ID 和子任务编号确定性地生成随机种子，重新 init 时种子不变"""
+    digest = hashlib.md5(f"{pair_id}:{part}".encode()).digest()
+    return int.from_bytes(digest[:4], "little") % (2 ** 31 - 1) + 1
+
+
+def split_nstruct(nstruct, split):
+    """把 nstruct 个 decoy 尽量均匀地分给 split 个子任务（子任务数不超过 nstruct）"""
+    split = max(1, min(split, nstruct))
+    return [nstruct // split + (1 if k < nstruct % split else 0) for k in range(split)]
+
+
+def split_task(task, nstruct, split):
+    """把一个 RNP 任务拆分为多个子任务，子任务在 <sample_dir>/parts/partNN 中运行"""
+    sizes = split_nstruct(nstruct, split)
+    width = max(2, len(str(len(sizes))))
+    parts = []
+    for part, part_nstruct in enumerate(sizes, start=1):
+        part_name = f"part{part:0{width}d}"
+        parts.append({
+            **task,
+            "rnp_id": f"{task['pair_id']}.{part_name}",
+            "sample_dir": os.path.join(task["sample_dir"], "parts", part_name),
+            "log_file": os.path.join(os.path.dirname(task["log_file"]), f"{task['pair_id']}.{part_name}.log"),
+            "part": part,
+            "n_parts": len(sizes),
+            "nstruct": part_nstruct,
+            "seed": part_seed(task["pair_id"], part),
+        })
+    return parts
+
+
+def pair_dir(task):
+    """RNP 的结果目录（子任务目录为 <结果目录>/parts/partNN）"""
+    if task["part"] is None:
+        return task["sample_dir"]
+    return os.path.dirname(os.path.dirname(task["sample_dir"]))
+
+
+def discover_tasks(input_dir, pdb_dir, results_dir, mark_existing_done=False, nstruct=None, split=1):
+    """
+    扫描输入目录中的 <rnp_id>.fasta，匹配同名 .txt 结构文件和 <pdb_id>.pdb（pdb_id 为第一个下划线前的部分）
+
+    Args:
+        nstruct (int): 记录到任务数据库中的 decoy 数，None 表示运行时由 --nstruct 决定
+        split (int): 每个 RNP 拆分的子任务数，大于 1 时必须给出 nstruct
+
+    Returns:
+        list[dict]: 可写入任务数据库的任务
+    """
+    logger = get_logger('docking_scheduler')
+    tasks = []
+    for fasta in sorted(glob.glob(os.path.join(input_dir, "*.fasta"))):
+        rnp_id = os.path.basename(fasta)[:-len(".fasta")]
+        pdb_id = rnp_id.split("_")[0]
+        secstruct = os.path.join(input_dir, f"{rnp_id}.txt")
+        pdb = os.path.join(pdb_dir, f"{pdb_id}.pdb")
+
+        missing = [path for path in (secstruct, pdb) if not os.path.exists(path)]
+        if missing:
+            logger.warning(f"跳过 {rnp_id}: 缺少文件 {', '.join(missing)}")
+            continue
+
+        sample_dir = os.path.join(results_dir, rnp_id)
+        existing = mark_existing_done and os.path.exists(os.path.join(sample_dir, "default.out"))
+        protein_length, rna_length = read_rnp_lengths(fasta)
+        task = {
+            "rnp_id": rnp_id,
+            "pair_id": rnp_id,
+            "fasta": os.path.abspath(fasta),
+            "secstruct": os.path.abspath(secstruct),
+            "pdb": os.path.abspath(pdb),
+            "sample_dir": os.path.abspath(sample_dir),
+            "log_file": os.path.abspath(os.path.join(input_dir, "logs", f"{rnp_id}.log")),
+            "protein_length": protein_length,
+            "rna_length": rna_length,
+            "nstruct": nstruct,
+            "status": DONE if existing else PENDING,
+        }
+        tasks.extend(split_task(task, nstruct, split) if split > 1 else [task])
+    return tasks
+
+
+def update_cost_estimates(db, default_nstruct=DEFAULT_NSTRUCT):
+    """
+    用已完成任务的运行时间拟合运行时间模型，并更新未完成任务的估计耗时
+
+    模型按每个 decoy 的运行时间拟合，估计耗时 = 预测值 × 任务的 nstruct，
+    因此拆分后的子任务和未拆分的任务可以放在一起排序。
+
+    Args:
+        db (TaskDB): 任务数据库
+        default_nstruct (int): 数据库中没有记录 nstruct 的任务使用的 decoy 数
+
+    Returns:
+        RuntimeModel: 拟合的模型
+    """
+    missing = {task["id"]: read_rnp_lengths(task["fasta"]) for task in db.tasks()
+               if task["protein_length"] is None and os.path.exists(task["fasta"])}
+    if missing:
+        db.set_lengths(missing)
+
+    model = fit_runtime_model([(length, wall_time / (nstruct or default_nstruct))
+                               for length, wall_time, nstruct in db.history()])
+    db.set_est_costs({
+        task["id"]: task_cost(model, task, default_nstruct)
+        for status in (PENDING, FAILED) for task in db.tasks(status)
+        if task["protein_length"] is not None
+    })
+    return model
+
+
+def task_cost(model, task, default_nstruct=DEFAULT_NSTRUCT):
+    """任务的估计耗时"""
+    return model.predict(task["protein_length"] + task["rna_length"]) * (task["nstruct"] or default_nstruct)
+
+
+def simulate(db, workers_list, include_all=False, default_nstruct=DEFAULT_NSTRUCT):
+    """
+    预测按数据库原始顺序（即文件扫描顺序）和按最长任务优先调度时的完工时间
+
+    Args:
+        db (TaskDB): 任务数据库
+        workers_list (list[int]): 需要模拟的 worker 数
+        include_all (bool): 是否包含已完成的任务（默认只模拟未完成的任务）
+        default_nstruct (int): 数据库中没有记录 nstruct 的任务使用的 decoy 数
+    """
+    logger = get_logger('docking_scheduler')
+    model = update_cost_estimates(db, default_nstruct)
+    logger.info(f"运行时间模型: {model.describe()}")
+
+    tasks = [task for task in db.tasks()
+             if (include_all or task["status"] != DONE) and task["protein_length"] is not None]
+    costs = [task_cost(model, task, default_nstruct) for task in tasks]
+    if not costs:
+        logger.info("没有需要模拟的任务")
+        return
+
+    unit = "秒" if model.fitted else "相对单位"
+    logger.info(f"模拟 {len(costs)} 个任务，总耗时 {sum(costs):.1f} {unit}，最长任务 {max(costs):.1f} {unit}")
+    logger.info(f"{'worker 数':>10}{'扫描顺序':>16}{'最长任务优先':>16}{'理论下界':>16}")
+    for workers in workers_list:
+        lower_bound = max(sum(costs) / workers, max(costs))
+        logger.info(f"{workers:>10}{simulate_makespan(costs, workers):>16.1f}"
+                    f"{simulate_makespan(longest_first(costs), workers):>16.1f}{lower_bound:>16.1f}")
+
+
+# 由历史数据建议资源申请时留出的余量
+TIME_MARGIN = 1.5
+MEM_MARGIN = 1.25
+
+
+def format_hours(seconds):
+    """把秒数格式化为 Slurm 的 HH:MM:SS 时间限制"""
+    seconds = int(math.ceil(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def report(db, top=10, default_nstruct=DEFAULT_NSTRUCT):
+    """
+    根据 runs 表汇报吞吐量、最慢的任务和运行时间模型，并给出 Slurm 资源申请建议
+
+    Returns:
+        dict: 汇总信息（没有运行记录时为 None）
+    """
+    logger = get_logger('docking_scheduler')
+    runs = [dict(run) for run in db.runs()]
+    if not runs:
+        logger.info("还没有运行记录")
+        return None
+    succeeded = [run for run in runs if run["return_code"] == 0 and run["wall_time"] is not None]
+    wall_times = [run["wall_time"] for run in succeeded]
+    cpu_times = [run["user_time"] + run["system_time"] for run in succeeded if run["user_time"] is not None]
+    rss_mb = [run["max_rss_kb"] / 1024 for run in succeeded if run["max_rss_kb"] is not None]
+
+    starts = [t for t in (_parse_time(run["started_at"]) for run in runs) if t]
+    ends = [t for t in (_parse_time(run["finished_at"]) for run in runs) if t]
+    span_hours = (max(ends) - min(starts)).total_seconds() / 3600 if starts and ends else 0
+    decoys = sum(run["nstruct"] or default_nstruct for run in succeeded)
+
+    logger.info(f"运行记录: {len(runs)} 次（成功 {len(succeeded)}，失败 {len(runs) - len(succeeded)}）")
+    logger.info(f"累计运行时间 {sum(wall_times) / 3600:.2f} 小时，累计 CPU 时间 {sum(cpu_times) / 3600:.2f} 小时"
+                + (f"，CPU 利用率 {sum(cpu_times) / sum(wall_times):.0%}" if cpu_times and sum(wall_times) else ""))
+    if span_hours > 0:
+        logger.info(f"吞吐量: {len(succeeded) / span_hours:.1f} 个任务/小时，{decoys / span_hours:.1f} 个 decoy/小时"
+                    f"（{min(starts):%Y-%m-%d %H:%M} 至 {max(ends):%Y-%m-%d %H:%M}）")
+    for name, values, unit in (("运行时间", wall_times, "秒"), ("CPU 时间", cpu_times, "秒"), ("峰值内存", rss_mb, "MB")):
+        if values:
+            logger.info(f"{name} p50/p90/p95/max: " + "/".join(
+                f"{percentile(values, q):.1f}" for q in (50, 90, 95, 100)) + f" {unit}")
+
+    logger.info(f"最慢的 {min(top, len(succeeded))} 个任务:")
+    logger.info(f"{'RNP':<40}{'运行时间(秒)':>14}{'CPU(秒)':>12}{'内存(MB)':>12}{'长度':>8}{'decoy':>8}")
+    for run in sorted(succeeded, key=lambda run: run["wall_time"], reverse=True)[:top]:
+        cpu = run["user_time"] + run["system_time"] if run["user_time"] is not None else float("nan")
+        rss = run["max_rss_kb"] / 1024 if run["max_rss_kb"] is not None else float("nan")
+        length = (run["protein_length"] or 0) + (run["rna_length"] or 0)
+        logger.info(f"{run['rnp_id']:<40}{run['wall_time']:>14.1f}{cpu:>12.1f}{rss:>12.0f}{length:>8}"
+                    f"{run['nstruct'] or default_nstruct:>8}")
+
+    model = fit_runtime_model([((run["protein_length"] or 0) + (run["rna_length"] or 0),
+                                run["wall_time"] / (run["nstruct"] or default_nstruct))
+                               for run in succeeded if run["protein_length"] is not None])
+    logger.info(f"运行时间模型（每个 decoy）: {model.describe()}")
+
+    summary = {
+        "runs": len(runs),
+        "succeeded": len(succeeded),
+        "wall_hours": sum(wall_times) / 3600,
+        "cpu_hours": sum(cpu_times) / 3600,
+        "tasks_per_hour": len(succeeded) / span_hours if span_hours > 0 else None,
+        "model": model,
+    }
+    # 资源建议：最长的历史任务和模型预测的最长剩余任务，加上余量
+    pending = [task for status in (PENDING, FAILED) for task in db.tasks(status) if task["protein_length"] is not None]
+    longest = max(wall_times, default=0)
+    if model.fitted and pending:
+        longest = max(longest, max(task_cost(model, task, default_nstruct) for task in pending))
+    if longest:
+        summary["time_limit"] = format_hours(longest * TIME_MARGIN)
+        logger.info(f"建议每个任务的时间限制: -t {summary['time_limit']}"
+                    f"（最长任务 {longest / 3600:.2f} 小时 × {TIME_MARGIN}）")
+    if rss_mb:
+        summary["mem_gb"] = math.ceil(max(rss_mb) * MEM_MARGIN / 1024)
+        logger.info(f"建议每个任务的内存: --mem={summary['mem_gb']}G（峰值 {max(rss_mb):.0f} MB × {MEM_MARGIN}）")
+    return summary
+
+
+def merge_pair(db, pair_id, allow_partial=False, tag_map=None):
+    """
+    同一 RNP 的子任务全部完成后，把各子任务的 default.out 合并为该 RNP 的 default.out
+
+    多个进程同时合并同一个 RNP 时结果相同（先写临时文件再重命名），不需要额外加锁。
+
+    Args:
+        allow_partial (bool): 只要求数据库中已有的子任务全部完成（自适应对接提前停止的 RNP
+            不会创建全部子任务，见 adaptive_docking.py）
+        tag_map (dict): 给出时填入 {(子任务 part, 子任务中的标签): 合并后 default.out 中的标签}
+
+    Returns:
+        int: 合并后的 decoy 数；还有子任务未完成时返回 None
+    """
+    parts = db.parts(pair_id)
+    if not parts or any(task["status"] != DONE for task in parts):
+        return None
+    if not allow_partial and parts[0]["n_parts"] and len(parts) < parts[0]["n_parts"]:
+        return None
+    if parts[0]["part"] is None:
+        return 0
+    silent_files = [os.path.join(task["sample_dir"], "default.out") for task in parts]
+    file_tags = {} if tag_map is not None else None
+    n_decoys = merge_silent_files(silent_files, os.path.join(pair_dir(parts[0]), "default.out"), file_tags)
+    if tag_map is not None:
+        tag_map.update({(parts[i]["part"], tag): new_tag for (i, tag), new_tag in file_tags.items()})
+    return n_decoys
+
+
+def merge_all(db):
+    """合并所有子任务已全部完成的 RNP，返回 (已合并数, 未完成数)"""
+    logger = get_logger('docking_scheduler')
+    merged = incomplete = 0
+    for pair_id in sorted(db.pair_ids()):
+        n_decoys = merge_pair(db, pair_id)
+        if n_decoys is None:
+            incomplete += 1
+        elif n_decoys:
+            merged += 1
+            logger.debug(f"{pair_id}: 合并 {n_decoys} 个 decoy")
+    return merged, incomplete
+
+
+def move_outputs(work_dir, sample_dir):
+    """把临时运行目录中的输出移到样本目录（覆盖同名文件），然后删除临时目录"""
+    for name in os.listdir(work_dir):
+        target = os.path.join(sample_dir, name)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        shutil.move(os.path.join(work_dir, name), target)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_with_usage(command, cwd, log):
+    """
+    运行命令，并用 os.wait4 获取该子进程（及其已回收的后代进程）的资源使用
+
+    Returns:
+        tuple[int, dict]: (返回码, {user_time, system_time（秒）, max_rss_kb})
+    """
+    process = subprocess.Popen(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _, wait_status, rusage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    # Linux 上 ru_maxrss 的单位为 KB
+    return process.returncode, {"user_time": rusage.ru_utime, "system_time": rusage.ru_stime,
+                                "max_rss_kb": rusage.ru_maxrss}
+
+
+def run_job(task, command, scratch=None):
+    """
+    在样本目录中运行一个任务，输出追加到任务日志
+
+    Args:
+        task (dict): 任务
+        command (list[str]): 命令
+        scratch (str): 节点本地临时目录；给出时在其中运行，结束后把输出移回样本目录，
+            避免大量任务同时读写共享文件系统
+
+    Returns:
+        tuple[int, float, dict]: (返回码, 运行时间（秒）, 资源使用（见 run_with_usage()，启动失败时为 None）)
+    """
+    os.makedirs(task["sample_dir"], exist_ok=True)
+    os.makedirs(os.path.dirname(task["log_file"]), exist_ok=True)
+    start = time.perf_counter()
+    with open(task["log_file"], "a") as log:
+        log.write(f"[{datetime.now()}] === 开始处理 {task['rnp_id']}（第{task['attempts']}次尝试）===\n")
+        log.write(f"[{datetime.now()}] 执行命令: {' '.join(command)}\n")
+        log.flush()
+        work_dir = task["sample_dir"]
+        if scratch:
+            os.makedirs(scratch, exist_ok=True)
+            work_dir = tempfile.mkdtemp(prefix=f"{task['rnp_id']}.", dir=scratch)
+            log.write(f"[{datetime.now()}] 临时运行目录: {work_dir}\n")
+            log.flush()
+        usage = None
+        try:
+            return_code, usage = run_with_usage(command, work_dir, log)
+        except OSError as e:
+            log.write(f"[{datetime.now()}] 命令启动失败: {e}\n")
+            return_code = 127
+        finally:
+            if scratch:
+                move_outputs(work_dir, task["sample_dir"])
+        wall_time = time.perf_counter() - start
+        resources = ""
+        if usage:
+            resources = (f"，CPU 时间: {usage['user_time'] + usage['system_time']:.1f} 秒，"
+                         f"峰值内存: {usage['max_rss_kb'] / 1024:.0f} MB")
+        log.write(f"[{datetime.now()}] === 处理结束，返回码: {return_code}，耗时: {wall_time:.1f} 秒{resources} ===\n")
+    return return_code, wall_time, usage
+
+
+def read_bin(plan_path, bin_index):
+    """读取 slurm_packing.py 分组方案中某一组的任务 id"""
+    with open(plan_path, encoding="utf-8") as f:
+        bins = json.load(f)["bins"]
+    if not 0 <= bin_index < len(bins):
+        raise IndexError(f"分组编号超出范围: {bin_index}（共 {len(bins)} 组）")
+    return bins[bin_index]
+
+
+class LocalBackend:
+    """本地进程池后端：在本机并行运行 rna_denovo"""
+
+    name = "local"
+
+    def __init__(self, nstruct=DEFAULT_NSTRUCT):
+        self.nstruct = nstruct
+
+    def command(self, task):
+        command = ["rna_denovo",
+                   "-fasta", task["fasta"],
+                   "-secstruct_file", task["secstruct"],
+                   "-s", task["pdb"],
+                   "-minimize_rna", "false",
+                   "-nstruct", str(task["nstruct"] or self.nstruct)]
+        if task["seed"] is not None:
+            command += ["-constant_seed", "-jran", str(task["seed"])]
+        return command
+
+    def run(self, db, max_workers, limit=None, delay=0.0, task_ids=None, scratch=None):
+        """
+        领取并运行 pending 任务，直到没有 pending 任务或达到 limit
+
+        Args:
+            db (TaskDB): 任务数据库
+            max_workers (int): 同时运行的任务数
+            limit (int): 本次最多启动的任务数
+            delay (float): 相邻两次启动之间的间隔（秒），避免同时启动大量任务造成 I/O 拥堵
+            task_ids (list[int]): 只运行这些任务（Slurm 打包作业中分给当前数组元素的任务）
+            scratch (str): 节点本地临时目录，见 run_job()
+
+        Returns:
+            dict: 本次运行的 {done, failed} 计数
+        """
+        logger = get_logger('docking_scheduler')
+        results = {DONE: 0, FAILED: 0}
+        running = {}
+        launched = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            try:
+                while True:
+                    while len(running) < max_workers and (limit is None or launched < limit):
+                        claimed = db.claim_next(task_ids=task_ids)
+                        if not claimed:
+                            break
+                        task = dict(claimed[0])
+                        running[pool.submit(run_job, task, self.command(task), scratch)] = task
+                        launched += 1
+                        logger.info(f"启动任务 {task['rnp_id']}（第{task['attempts']}次尝试）")
+                        if delay:
+                            time.sleep(delay)
+                    if not running:
+                        break
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        task = running.pop(future)
+                        try:
+                            return_code, wall_time, usage = future.result()
+                        except Exception as e:
+                            logger.error(f"任务 {task['rnp_id']} 产生异常: {e}")
+                            return_code, wall_time, usage = -1, None, None
+                        status = db.finish(task["id"], return_code, wall_time, usage,
+                                           task["nstruct"] or self.nstruct)
+                        results[status] += 1
+                        if status == DONE:
+                            logger.info(f"任务 {task['rnp_id']} 完成，耗时 {wall_time:.1f} 秒")
+                            if task["part"] is not None:
+                                self._merge(db, task["pair_id"])
+                        else:
+                            logger.warning(f"任务 {task['rnp_id']} 失败，返回码 {return_code}，日志: {task['log_file']}")
+            except KeyboardInterrupt:
+                logger.warning(f"收到中断信号，把 {len(running)} 个运行中的任务放回 pending")
+                db.release([task["id"] for task in running.values()])
+                raise
+        return results
+
+    @staticmethod
+    def _merge(db, pair_id):
+        logger = get_logger('docking_scheduler')
+        try:
+            n_decoys = merge_pair(db, pair_id)
+        except OSError as e:
+            logger.error(f"{pair_id} 的子任务合并失败: {e}，可稍后用 merge 子命令重试")
+            return
+        if n_decoys is not None:
+            logger.info(f"{pair_id} 的子任务已全部完成，合并 {n_decoys} 个 decoy 到 default.out")
+
+
+class FakeBackend(LocalBackend):
+    """测试后端：用本脚本的 fake_rna_denovo 子命令代替 rna_denovo"""
+
+    name = "fake"
+
+    def command(self, task):
+        return [sys.executable, os.path.abspath(__file__), "fake_rna_denovo", *super().command(task)[1:]]
+
+
+SBATCH_TEMPLATE = """#!/bin/bash
+#SBATCH -J {job_name}
+#SBATCH -o {log_dir}/{job_name}_%A_%a.out
+#SBATCH -e {log_dir}/{job_name}_%A_%a.err
+#SBATCH -p {partition}
+#SBATCH -t {time_limit}
+#SBATCH -n 1
+#SBATCH --mem={mem}
+#SBATCH --array=1-{n_tasks}%{max_running}
+
+# 由 docking_scheduler.py 根据任务数据库生成：{db}
+# 每个数组元素从数据库领取一个 pending 任务运行（估计耗时最长的优先），不依赖任务列表文件或偏移量。
+# module load rosetta
+
+cd {work_dir}
+{python} {script} run --db {db} --backend {worker_backend} --nstruct {nstruct} --max_workers 1 --limit 1 --keep_estimates
+"""
+
+
+class SlurmBackend:
+    """Slurm 后端：根据数据库中 pending 任务的数量生成数组作业脚本"""
+
+    name = "slurm"
+
+    def __init__(self, nstruct=DEFAULT_NSTRUCT, partition="comput", time_limit="500:00:00", mem="4G",
+                 job_name="rna_denovo", worker_backend="local", max_array_size=None):
+        self.nstruct = nstruct
+        self.partition = partition
+        self.time_limit = time_limit
+        self.mem = mem
+        self.job_name = job_name
+        self.worker_backend = worker_backend
+        self.max_array_size = max_array_size
+
+    def write_script(self, db, script_path, max_running, limit=None):
+        """
+        生成 sbatch 脚本
+
+        Returns:
+            int: 数组大小（0 表示没有 pending 任务，未生成脚本）
+        """
+        n_tasks = db.counts()[PENDING]
+        for cap in (limit, self.max_array_size):
+            if cap is not None:
+                n_tasks = min(n_tasks, cap)
+        if n_tasks == 0:
+            return 0
+
+        work_dir = os.getcwd()
+        log_dir = os.path.join(work_dir, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+        with open(script_path, "w") as f:
+            f.write(SBATCH_TEMPLATE.format(
+                job_name=self.job_name, log_dir=log_dir, partition=self.partition,
+                time_limit=self.time_limit, mem=self.mem, n_tasks=n_tasks, max_running=max_running,
+                db=os.path.abspath(db.path), work_dir=work_dir, python=sys.executable,
+                script=os.path.abspath(__file__), worker_backend=self.worker_backend, nstruct=self.nstruct,
+            ))
+        return n_tasks
+
+    def run(self, db, max_workers, limit=None, script_path=None, submit=False):
+        """生成 sbatch 脚本并可选直接提交"""
+        logger = get_logger('docking_scheduler')
+        script_path = script_path or os.path.join(os.path.dirname(os.path.abspath(db.path)), "rna_denovo.sbatch")
+        n_tasks = self.write_script(db, script_path, max_workers, limit)
+        if n_tasks == 0:
+            logger.info("没有 pending 任务，无需提交")
+            return
+        logger.info(f"已生成 Slurm 数组作业脚本: {script_path}（{n_tasks} 个数组元素，最多同时运行 {max_workers} 个）")
+        if submit:
+            result = subprocess.run(["sbatch", script_path], capture_output=True, text=True, check=True)
+            logger.info(f"已提交: {result.stdout.strip()}")
+        else:
+            logger.info(f"使用命令 'sbatch {script_path}' 提交作业")
+
+
+BACKENDS = {backend.name: backend for backend in (LocalBackend, FakeBackend, SlurmBackend)}
+
+
+def fake_rna_denovo(argv):
+    """
+    rna_denovo 的替身：在当前目录生成包含 nstruct 个 decoy 的 default.out
+
+    score 由输入文件名和随机种子（-jran）确定性地生成，并与 RNP 序列长度成正比。
+    环境变量：
+        FAKE_RNA_DENOVO_SECONDS  每个 decoy 的模拟耗时（秒），默认 0
+        FAKE_RNA_DENOVO_FAIL     fasta 文件名匹配该通配符时以返回码 1 退出，用于测试失败重试
+    """
+    parser = argparse.ArgumentParser(prog="fake_rna_denovo")
+    parser.add_argument("-fasta", required=True)
+    parser.add_argument("-secstruct_file", required=True)
+    parser.add_argument("-s", required=True)
+    parser.add_argument("-minimize_rna", default="false")
+    parser.add_argument("-nstruct", type=int, default=DEFAULT_NSTRUCT)
+    parser.add_argument("-constant_seed", action="store_true")
+    parser.add_argument("-jran", type=int)
+    args = parser.parse_args(argv)
+
+    fail_pattern = os.environ.get("FAKE_RNA_DENOVO_FAIL")
+    if fail_pattern and fnmatch.fnmatch(os.path.basename(args.fasta), fail_pattern):
+        print(f"fake_rna_denovo: 模拟失败 {args.fasta}", file=sys.stderr)
+        return 1
+
+    with open(args.fasta) as f:
+        sequence = "".join(line.strip() for line in f if not line.startswith(">"))
+    seconds = float(os.environ.get("FAKE_RNA_DENOVO_SECONDS", "0"))
+
+    with open("default.out", "w") as out:
+        out.write(f"SEQUENCE: {sequence}\n")
+        out.write("SCORE:     score total_score    fa_rep    N_WC description\n")
+        for i in range(1, args.nstruct + 1):
+            time.sleep(seconds)
+            tag = f"S_{i:06d}"
+            digest = hashlib.md5(f"{os.path.basename(args.fasta)}:{args.jran}:{i}".encode()).digest()
+            noise = int.from_bytes(digest[:4], "little") / 2 ** 32
+            total = len(sequence) * (noise - 0.5) * 10
+            out.write(f"SCORE: {total:9.3f} {total:11.3f} {abs(total) / 2:9.3f} {int(noise * 20):7d} {tag}\n")
+            out.write(f"REMARK fake_rna_denovo decoy {i} {tag}\n")
+    return 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "fake_rna_denovo":
+        sys.exit(fake_rna_denovo(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description='可续跑的 RNP 对接任务调度器')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = subparsers.add_parser('init', help='扫描输入目录，建立任务数据库')
+    init_parser.add_argument('--input_dir', required=True, help='fasta_file_prepare.py 的输出目录')
+    init_parser.add_argument('--pdb_dir', help='aaRS PDB 文件目录，默认与输入目录相同')
+    init_parser.add_argument('--results_dir', help='结果目录，默认为 <input_dir>/results')
+    init_parser.add_argument('--db', help='任务数据库路径，默认为 <input_dir>/tasks.db')
+    init_parser.add_argument('--mark_existing_done', action='store_true',
+                             help='结果目录中已有 default.out 的任务直接标记为 done')
+    init_parser.add_argument('--nstruct', type=int,
+                             help=f'每个 RNP 的 decoy 数（记录到数据库；使用 --split 时默认 {DEFAULT_NSTRUCT}）')
+    init_parser.add_argument('--split', type=int, default=1,
+                             help='把每个 RNP 的 decoy 拆分为多少个子任务（不同随机种子），完成后合并为一个 default.out')
+
+    run_parser = subparsers.add_parser('run', help='运行 pending 任务')
+    run_parser.add_argument('--db', required=True, help='任务数据库路径')
+    run_parser.add_argument('--backend', choices=list(BACKENDS), default='local', help='运行后端，默认 local')
+    run_parser.add_argument('--max_workers', type=int, default=os.cpu_count(),
+                            help='同时运行的任务数（slurm 后端为数组作业的并发上限），默认为 CPU 核数')
+    run_parser.add_argument('--limit', type=int, help='本次最多运行的任务数')
+    run_parser.add_argument('--delay', type=float, default=0.0, help='相邻两次启动任务之间的间隔（秒）')
+    run_parser.add_argument('--nstruct', type=int, default=DEFAULT_NSTRUCT,
+                            help='数据库中没有记录 nstruct 的任务生成的 decoy 数')
+    run_parser.add_argument('--retry_failed', action='store_true', help='运行前把 failed 任务重置为 pending')
+    run_parser.add_argument('--max_attempts', type=int, help='与 --retry_failed 一起使用：只重试尝试次数小于该值的任务')
+    run_parser.add_argument('--keep_estimates', action='store_true',
+                            help='不重新拟合运行时间模型，直接使用数据库中的估计耗时（Slurm 数组元素使用）')
+    run_parser.add_argument('--bin_plan', help='slurm_packing.py 生成的分组方案，与 --bin 一起使用：只运行其中一组任务')
+    run_parser.add_argument('--bin', type=int, help='分组编号（从 0 开始，通常为 $SLURM_ARRAY_TASK_ID）')
+    run_parser.add_argument('--scratch', help='节点本地临时目录：在其中运行 rna_denovo，结束后把输出移回结果目录')
+    slurm_group = run_parser.add_argument_group('slurm 后端参数')
+    slurm_group.add_argument('--partition', default='comput', help='Slurm 分区')
+    slurm_group.add_argument('--time_limit', default='500:00:00', help='每个数组元素的时间限制')
+    slurm_group.add_argument('--mem', default='4G', help='每个数组元素的内存')
+    slurm_group.add_argument('--max_array_size', type=int, help='集群允许的最大数组大小')
+    slurm_group.add_argument('--worker_backend', choices=['local', 'fake'], default='local',
+                             help='数组元素内部使用的后端')
+    slurm_group.add_argument('--script', help='生成的 sbatch 脚本路径，默认为数据库同目录下的 rna_denovo.sbatch')
+    slurm_group.add_argument('--submit', action='store_true', help='生成后直接用 sbatch 提交')
+
+    status_parser = subparsers.add_parser('status', help='查看任务状态')
+    status_parser.add_argument('--db', required=True, help='任务数据库路径')
+    status_parser.add_argument('--show_failed', action='store_true', help='列出失败的任务')
+
+    reset_parser = subparsers.add_parser('reset', help='把任务重置为 pending')
+    reset_parser.add_argument('--db', required=True, help='任务数据库路径')
+    reset_parser.add_argument('--status', nargs='+', choices=[RUNNING, FAILED, DONE], default=[FAILED],
+                              help='需要重置的状态，默认 failed；节点崩溃后遗留的任务可用 running')
+    reset_parser.add_argument('--max_attempts', type=int, help='只重置尝试次数小于该值的任务')
+
+    simulate_parser = subparsers.add_parser('simulate', help='预测给定 worker 数下的完工时间')
+    simulate_parser.add_argument('--db', required=True, help='任务数据库路径')
+    simulate_parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count()], help='worker 数，可给多个')
+    simulate_parser.add_argument('--all', action='store_true', help='包含已完成的任务（用于回顾整个项目）')
+    simulate_parser.add_argument('--nstruct', type=int, default=DEFAULT_NSTRUCT,
+                                 help='数据库中没有记录 nstruct 的任务的 decoy 数')
+
+    report_parser = subparsers.add_parser('report', help='运行记录报告：吞吐量、最慢的任务和运行时间模型')
+    report_parser.add_argument('--db', required=True, help='任务数据库路径')
+    report_parser.add_argument('--top', type=int, default=10, help='列出最慢的任务数，默认 10')
+    report_parser.add_argument('--nstruct', type=int, default=DEFAULT_NSTRUCT,
+                               help='没有记录 nstruct 的运行的 decoy 数')
+
+    merge_parser = subparsers.add_parser('merge', help='合并子任务已全部完成的 RNP 的 silent 文件')
+    merge_parser.add_argument('--db', required=True, help='任务数据库路径')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+
+    if args.command == 'init':
+        db_path = args.db or os.path.join(args.input_dir, 'tasks.db')
+        nstruct = args.nstruct
+        if args.split > 1 and nstruct is None:
+            nstruct = DEFAULT_NSTRUCT
+        tasks = discover_tasks(args.input_dir, args.pdb_dir or args.input_dir,
+                               args.results_dir or os.path.join(args.input_dir, 'results'),
+                               args.mark_existing_done, nstruct, args.split)
+        db = TaskDB(db_path)
+        # 已在数据库中的 RNP 保持原有的拆分方式
+        existing_pairs = db.pair_ids()
+        added = db.add_tasks([task for task in tasks if task["pair_id"] not in existing_pairs])
+        logger.info(f"扫描到 {len(tasks)} 个任务，新增 {added} 个，任务数据库: {db_path}")
+        logger.info(f"当前状态: {db.counts()}")
+        return
+
+    db = TaskDB(args.db)
+
+    if args.command == 'status':
+        counts = db.counts()
+        logger.info(f"任务总数: {sum(counts.values())}，" + "，".join(f"{k}: {v}" for k, v in counts.items()))
+        if args.show_failed:
+            for task in db.tasks(FAILED):
+                logger.info(f"  失败: {task['rnp_id']}（尝试 {task['attempts']} 次，返回码 {task['return_code']}，"
+                            f"日志: {task['log_file']}）")
+        return
+
+    if args.command == 'reset':
+        n_reset = db.reset(tuple(args.status), args.max_attempts)
+        logger.info(f"已把 {n_reset} 个任务重置为 pending")
+        return
+
+    if args.command == 'simulate':
+        simulate(db, args.workers, args.all, args.nstruct)
+        return
+
+    if args.command == 'report':
+        report(db, args.top, args.nstruct)
+        return
+
+    if args.command == 'merge':
+        merged, incomplete = merge_all(db)
+        logger.info(f"已合并 {merged} 个 RNP，{incomplete} 个 RNP 还有未完成的子任务")
+        return
+
+    if args.retry_failed:
+        n_reset = db.reset((FAILED,), args.max_attempts)
+        logger.info(f"已把 {n_reset} 个失败任务重置为 pending")
+
+    logger.info(f"运行前状态: {db.counts()}")
+    if not args.keep_estimates:
+        model = update_cost_estimates(db, args.nstruct)
+        logger.info(f"按最长任务优先调度，运行时间模型: {model.describe()}")
+    if args.backend == 'slurm':
+        backend = SlurmBackend(args.nstruct, args.partition, args.time_limit, args.mem,
+                               worker_backend=args.worker_backend, max_array_size=args.max_array_size)
+        backend.run(db, args.max_workers, args.limit, args.script, args.submit)
+        return
+
+    task_ids = None
+    if args.bin_plan is not None:
+        if args.bin is None:
+            parser.error('--bin_plan 需要与 --bin 一起使用')
+        task_ids = read_bin(args.bin_plan, args.bin)
+        logger.info(f"运行分组 {args.bin} 中的任务（共 {len(task_ids)} 个）")
+
+    backend = BACKENDS[args.backend](args.nstruct)
+    results = backend.run(db, args.max_workers, args.limit, args.delay, task_ids, args.scratch)
+    logger.info(f"本次运行完成: {results[DONE]} 个成功，{results[FAILED]} 个失败")
+    logger.info(f"运行后状态: {db.counts()}")
+
+
+if __name__ == '__main__':
+    main()
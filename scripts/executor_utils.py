@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+通用并行执行工具模块
+
+为批处理脚本提供可配置的执行器层：
+    - 线程 / 进程两种执行器
+    - 根据可用 CPU 核数和内存推导默认并发数
+    - 单任务超时（由任务函数通过 timeout 参数自行执行）
+    - 基于 rich 的实时进度条，显示吞吐量和预计剩余时间；任务返回的消息由主进程打印在进度条上方
+    - 汇总完成/跳过/失败数量以及耗时分位数，并写出 JSON 报告
+
+使用方法：
+    from executor_utils import default_max_workers, run_tasks, summarize_results, write_summary_json
+
+    def work(item, timeout=None):
+        ...
+        return item, "completed", f"{item} 完成"   # 消息可以为 None
+
+    results = run_tasks(work, items, executor="process", max_workers=default_max_workers(2))
+    summary = summarize_results(results, elapsed)
+    write_summary_json(summary, "summary.json")
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from rich.progress import (
+    Progress, ProgressColumn, SpinnerColumn, TextColumn, BarColumn,
+    MofNCompleteColumn, TimeElapsedColumn, TimeRemainingColumn,
+)
+from rich.text import Text
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+# 任务状态
+STATUS_COMPLETED = "completed"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+
+def available_cpus():
+    """返回当前进程可用的 CPU 核数（考虑 taskset/cgroup 绑核，例如 Slurm 分配）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory_bytes():
+    """返回系统当前可用内存（字节），无法获取时返回 None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_max_workers(mem_per_task_gb=1.0, reserve_cpus=0):
+    """
+    根据可用 CPU 核数和内存推导默认并发数
+
+    Args:
+        mem_per_task_gb (float): 每个任务预计占用的内存（GB）
+        reserve_cpus (int): 为主进程等保留的核数
+
+    Returns:
+        int: 并发数，至少为 1
+    """
+    workers = max(1, available_cpus() - reserve_cpus)
+    mem = available_memory_bytes()
+    if mem is not None and mem_per_task_gb > 0:
+        workers = min(workers, int(mem // (mem_per_task_gb * 1024 ** 3)))
+    return max(1, workers)
+
+
+class ThroughputColumn(ProgressColumn):
+    """显示每秒完成的任务数"""
+
+    def render(self, task):
+        speed = task.finished_speed or task.speed
+        if speed is None:
+            return Text("-- 任务/秒", style="progress.data.speed")
+        return Text(f"{speed:.2f} 任务/秒", style="progress.data.speed")
+
+
+def _timed_call(func, item, timeout):
+    """在工作线程/进程中执行任务并计时，返回 (item, status, message, wall_time)"""
+    start = time.perf_counter()
+    _, status, message = func(item, timeout=timeout)
+    return item, status, message, time.perf_counter() - start
+
+
+def run_tasks(func, items, executor="thread", max_workers=None, timeout=None, description="处理任务"):
+    """
+    使用指定执行器并行运行任务，并显示实时进度
+
+    Args:
+        func: 任务函数，签名为 func(item, timeout=None) -> (item, status, message)；
+              使用进程执行器时必须是模块级函数。任务中不要直接 print（会打乱进度条），
+              需要输出的信息作为 message 返回（无输出时为 None），由主进程打印
+        items (list): 任务列表
+        executor (str): "thread" 或 "process"
+        max_workers (int): 并发数，默认由 default_max_workers() 推导
+        timeout (float): 单任务超时（秒），原样传给 func
+        description (str): 进度条描述
+
+    Returns:
+        list[dict]: 每个任务的 {"item", "status", "wall_time"}
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"未知的执行器类型: {executor}，可选: {', '.join(EXECUTORS)}")
+    if max_workers is None:
+        max_workers = default_max_workers()
+
+    results = []
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        ThroughputColumn(),
+        TimeElapsedColumn(),
+        TextColumn("剩余"),
+        TimeRemainingColumn(),
+    )
+    with progress, EXECUTORS[executor](max_workers=max_workers) as pool:
+        task_id = progress.add_task(description, total=len(items))
+        future_to_item = {pool.submit(_timed_call, func, item, timeout): item for item in items}
+        for future in as_completed(future_to_item):
+            item = future_to_item[future]
+            try:
+                item, status, message, wall_time = future.result()
+                if message:
+                    progress.console.print(message)
+            except Exception as exc:
+                progress.console.print(f"{item} 产生异常: {exc}")
+                status, wall_time = STATUS_FAILED, None
+            results.append({"item": item, "status": status, "wall_time": wall_time})
+            progress.advance(task_id)
+    return results
+
+
+def percentile(values, q):
+    """线性插值计算分位数（q 取 0-100）"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+def _round(value, ndigits=3):
+    return None if value is None else round(value, ndigits)
+
+
+def summarize_results(results, elapsed):
+    """
+    汇总任务结果
+
+    跳过的任务不计入耗时分位数；超时任务同时计入 failed 和 timeout。
+
+    Args:
+        results (list[dict]): run_tasks() 的返回值
+        elapsed (float): 总耗时（秒）
+
+    Returns:
+        dict: 汇总信息
+    """
+    counts = {status: 0 for status in (STATUS_COMPLETED, STATUS_SKIPPED, STATUS_FAILED, STATUS_TIMEOUT)}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    counts[STATUS_FAILED] += counts[STATUS_TIMEOUT]
+
+    wall_times = [r["wall_time"] for r in results
+                  if r["status"] != STATUS_SKIPPED and r["wall_time"] is not None]
+    mean_wall = sum(wall_times) / len(wall_times) if wall_times else None
+    return {
+        "total": len(results),
+        **counts,
+        "failed_items": sorted(str(r["item"]) for r in results
+                               if r["status"] in (STATUS_FAILED, STATUS_TIMEOUT)),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else None,
+        "wall_time_seconds": {
+            "mean": _round(mean_wall),
+            **{f"p{q}": _round(percentile(wall_times, q)) for q in (50, 90, 95, 99)},
+            "max": _round(max(wall_times) if wall_times else None),
+        },
+    }
+
+
+def write_summary_json(summary, path):
+    """将汇总信息写入 JSON 文件"""
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
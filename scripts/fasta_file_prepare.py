@@ -19,15 +19,18 @@
 
 import argparse
 import os
-from Bio import SeqIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fasta_io import read_fasta, fasta_id
 from generate_trna_name_map import parse_trnascan_output
-from logger_utils import setup_logger, get_logger
+from logger_utils import setup_logger, get_logger, lazy, RateLimiter, stage
+from profile_utils import add_profile_arguments, start_profiling
+from shard_utils import add_shard_argument, select_shard, shard_suffix
 
 # 提取 tRNA ID
 def extract_tRNA_id(tRNA_file, tRNA_ids_map):
     logger = get_logger('fasta_file_prepare')
-    logger.info(f"开始提取tRNA ID，输入文件: {tRNA_file}")
-    logger.info(f"映射文件: {tRNA_ids_map}")
+    logger.info("开始提取tRNA ID，输入文件: %s", tRNA_file)
+    logger.info("映射文件: %s", tRNA_ids_map)
     
     tRNA_ids = []
     tRNA_ids_dict = {}
@@ -38,10 +41,10 @@ def extract_tRNA_id(tRNA_file, tRNA_ids_map):
             if line.startswith('tRNA'):
                 tRNA_id = line.split(',')[0]
                 tRNA_ids.append(tRNA_id)
-                logger.debug(f"第{line_num}行找到tRNA ID: {tRNA_id}")
+                logger.debug("第%d行找到tRNA ID: %s", line_num, tRNA_id)
     
-    logger.info(f"从{tRNA_file}中提取到{len(tRNA_ids)}个tRNA ID")
-    logger.info(f"tRNA ID列表: {tRNA_ids}")
+    logger.info("从%s中提取到%d个tRNA ID", tRNA_file, len(tRNA_ids))
+    logger.info("tRNA ID列表: %s", tRNA_ids)
     
     # 读取映射文件并进行匹配
     mapped_count = 0
@@ -59,38 +62,38 @@ def extract_tRNA_id(tRNA_file, tRNA_ids_map):
                     if gtrnadb_id == target_pattern:
                         tRNA_ids_dict[tRNA_id] = trnascan_id
                         mapped_count += 1
-                        logger.info(f"成功映射: {tRNA_id} -> {trnascan_id}")
+                        logger.info("成功映射: %s -> %s", tRNA_id, trnascan_id)
                         break
     
     # 记录映射结果
-    logger.info(f"映射完成: {mapped_count}/{len(tRNA_ids)} 个tRNA ID成功映射")
+    logger.info("映射完成: %d/%d 个tRNA ID成功映射", mapped_count, len(tRNA_ids))
     
     # 记录未映射的tRNA ID
     unmapped_ids = [tid for tid in tRNA_ids if tid not in tRNA_ids_dict]
     if unmapped_ids:
-        logger.warning(f"以下{len(unmapped_ids)}个tRNA ID未能成功映射:")
+        logger.warning("以下%d个tRNA ID未能成功映射:", len(unmapped_ids))
         for uid in unmapped_ids:
-            logger.warning(f"  未映射: {uid} (查找模式: {uid}-1)")
+            logger.warning("  未映射: %s (查找模式: %s-1)", uid, uid)
     
-    logger.info(f"最终映射字典: {tRNA_ids_dict}")
+    logger.info("最终映射字典: %s", tRNA_ids_dict)
     return tRNA_ids_dict
 
 def extract_tRNA_structure(tRNA_ids_dict, tRNA_structure):
     logger = get_logger('fasta_file_prepare')
-    logger.info(f"开始提取tRNA结构，结构文件: {tRNA_structure}")
-    logger.info(f"需要查找{len(tRNA_ids_dict)}个tRNA的结构信息")
+    logger.info("开始提取tRNA结构，结构文件: %s", tRNA_structure)
+    logger.info("需要查找%d个tRNA的结构信息", len(tRNA_ids_dict))
     
     # 解析tRNAscan-SE输出文件
     logger.info("解析tRNAscan-SE输出文件...")
     tRNAs = parse_trnascan_output(tRNA_structure)
-    logger.info(f"从结构文件中解析到{len(tRNAs)}个tRNA条目")
+    logger.info("从结构文件中解析到%d个tRNA条目", len(tRNAs))
     
     tRNA_structures = {}
     found_count = 0
     
     # 为每个映射的tRNA ID查找对应的结构
     for tRNA_id, tRNA_name in tRNA_ids_dict.items():
-        logger.debug(f"查找tRNA {tRNA_id} (对应tRNAscan ID: {tRNA_name})的结构")
+        logger.debug("查找tRNA %s (对应tRNAscan ID: %s)的结构", tRNA_id, tRNA_name)
         
         structure_found = False
         for tRNA in tRNAs:
@@ -98,126 +101,138 @@ def extract_tRNA_structure(tRNA_ids_dict, tRNA_structure):
                 tRNA_structures[tRNA_id] = (tRNA['sequence'], tRNA['structure'])
                 found_count += 1
                 structure_found = True
-                logger.info(f"找到结构: {tRNA_id} -> 序列长度: {len(tRNA['sequence'])}, 结构长度: {len(tRNA['structure'])}")
-                logger.debug(f"  序列: {tRNA['sequence']}")
-                logger.debug(f"  结构: {tRNA['structure']}")
+                logger.info("找到结构: %s -> 序列长度: %d, 结构长度: %d", tRNA_id, len(tRNA['sequence']), len(tRNA['structure']))
+                logger.debug("  序列: %s", tRNA['sequence'])
+                logger.debug("  结构: %s", tRNA['structure'])
                 break
         
         if not structure_found:
-            logger.warning(f"未找到tRNA {tRNA_id} (tRNAscan ID: {tRNA_name})的结构信息")
+            logger.warning("未找到tRNA %s (tRNAscan ID: %s)的结构信息", tRNA_id, tRNA_name)
     
-    logger.info(f"结构提取完成: {found_count}/{len(tRNA_ids_dict)} 个tRNA找到了结构信息")
+    logger.info("结构提取完成: %d/%d 个tRNA找到了结构信息", found_count, len(tRNA_ids_dict))
     
     # 记录未找到结构的tRNA
     missing_structures = [tid for tid in tRNA_ids_dict.keys() if tid not in tRNA_structures]
     if missing_structures:
-        logger.warning(f"以下{len(missing_structures)}个tRNA未找到结构信息:")
+        logger.warning("以下%d个tRNA未找到结构信息:", len(missing_structures))
         for mid in missing_structures:
-            logger.warning(f"  缺失结构: {mid} (tRNAscan ID: {tRNA_ids_dict[mid]})")
+            logger.warning("  缺失结构: %s (tRNAscan ID: %s)", mid, tRNA_ids_dict[mid])
     
     return tRNA_structures
 
+def preview_sequence(seq, width=50):
+    seq = str(seq)
+    return seq[:width] + ('...' if len(seq) > width else '')
+
 def extract_aaRSs(aaRSs_fasta):
     logger = get_logger('fasta_file_prepare')
-    logger.info(f"开始提取aaRS蛋白质序列，FASTA文件: {aaRSs_fasta}")
+    logger.info("开始提取aaRS蛋白质序列，FASTA文件: %s", aaRSs_fasta)
     
     aaRSs = {}
     count = 0
-    for record in SeqIO.parse(aaRSs_fasta, "fasta"):
-        aaRSs[record.id] = record.seq
+    for title, seq in read_fasta(aaRSs_fasta):
+        aaRS_id = fasta_id(title)
+        aaRSs[aaRS_id] = seq
         count += 1
-        logger.info(f"提取aaRS: {record.id}, 序列长度: {len(record.seq)}")
-        logger.debug(f"  序列: {str(record.seq)[:50]}{'...' if len(record.seq) > 50 else ''}")
+        logger.info("提取aaRS: %s, 序列长度: %d", aaRS_id, len(seq))
+        logger.debug("  序列: %s", lazy(preview_sequence, seq))
     
-    logger.info(f"aaRS提取完成，共提取到{count}个蛋白质序列")
-    logger.info(f"aaRS ID列表: {list(aaRSs.keys())}")
+    logger.info("aaRS提取完成，共提取到%d个蛋白质序列", count)
+    logger.info("aaRS ID列表: %s", lazy(list, aaRSs))
     return aaRSs
 
 def pair_tRNA_and_aaRS(tRNA_structures, aaRSs):
     logger = get_logger('fasta_file_prepare')
-    logger.info(f"开始配对tRNA和aaRS")
-    logger.info(f"可用tRNA数量: {len(tRNA_structures)}")
-    logger.info(f"可用aaRS数量: {len(aaRSs)}")
+    logger.info("开始配对tRNA和aaRS")
+    logger.info("可用tRNA数量: %d", len(tRNA_structures))
+    logger.info("可用aaRS数量: %d", len(aaRSs))
     
     pairs = []
     pair_count = 0
     
     for tRNA_id, tRNA_structure in tRNA_structures.items():
-        logger.debug(f"为tRNA {tRNA_id} 配对aaRS...")
+        logger.debug("为tRNA %s 配对aaRS...", tRNA_id)
         for aaRS_id, aaRS_sequence in aaRSs.items():
             pairs.append((tRNA_id, tRNA_structure, aaRS_id, aaRS_sequence))
             pair_count += 1
-            logger.debug(f"  创建配对: {tRNA_id} + {aaRS_id}")
+            logger.debug("  创建配对: %s + %s", tRNA_id, aaRS_id)
     
     expected_pairs = len(tRNA_structures) * len(aaRSs)
-    logger.info(f"配对完成: 创建了{pair_count}个配对 (预期: {expected_pairs})")
+    logger.info("配对完成: 创建了%d个配对 (预期: %s)", pair_count, expected_pairs)
     
     if pair_count != expected_pairs:
-        logger.warning(f"配对数量不匹配! 实际: {pair_count}, 预期: {expected_pairs}")
+        logger.warning("配对数量不匹配! 实际: %d, 预期: %s", pair_count, expected_pairs)
     
     return pairs
 
-def generate_input_files(pairs, output_dir):
+# tRNAscan-SE 结构中的 ">" / "<" 转换为 rna_denovo 使用的 "(" / ")"
+STRUCTURE_TRANSLATION = str.maketrans("<>", ")(")
+RNA_TRANSLATION = str.maketrans("t", "u")
+
+
+def write_atomic(path, text):
+    """先写临时文件再重命名，中断时不会留下写了一半的文件（临时文件不以 .fasta/.txt 结尾，不会被当作输入）"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_rnp_files(output_dir, rnp_id, rnp_sequence, rnp_structure):
+    """写出一个 RNP 的结构文件和 FASTA 文件；FASTA 最后写，出现 FASTA 时结构文件一定已经完整"""
+    write_atomic(os.path.join(output_dir, f"{rnp_id}.txt"), f"{rnp_structure}\n{rnp_sequence}\n")
+    write_atomic(os.path.join(output_dir, f"{rnp_id}.fasta"), f">{rnp_id}\n{rnp_sequence}\n")
+    return rnp_id
+
+
+def generate_input_files(pairs, output_dir, max_workers=None, shard=None):
     logger = get_logger('fasta_file_prepare')
-    logger.info(f"开始生成输入文件，输出目录: {output_dir}")
-    logger.info(f"需要处理{len(pairs)}个配对")
-    
-    rnp_ids = []
+    logger.info("开始生成输入文件，输出目录: %s", output_dir)
+    logger.info("需要处理%d个配对", len(pairs))
+
+    # 每个 aaRS 和每个 tRNA 的序列、结构片段只计算一次
+    aaRS_fragments = {}
+    tRNA_fragments = {}
+    for tRNA_id, tRNA_structure, aaRS_id, aaRS_sequence in pairs:
+        if aaRS_id not in aaRS_fragments:
+            aaRS_sequence = str(aaRS_sequence)
+            aaRS_fragments[aaRS_id] = (aaRS_sequence, '.' * len(aaRS_sequence))
+        if tRNA_id not in tRNA_fragments:
+            tRNA_fragments[tRNA_id] = (tRNA_structure[0].lower().translate(RNA_TRANSLATION),
+                                       tRNA_structure[1].translate(STRUCTURE_TRANSLATION))
+    logger.info("预处理完成: %d个aaRS片段, %d个tRNA片段", len(aaRS_fragments), len(tRNA_fragments))
+
+    rnp_ids = [f"{aaRS_id}_{tRNA_id}" for tRNA_id, _, aaRS_id, _ in pairs]
     generated_count = 0
-    
-    for i, pair in enumerate(pairs, 1):
-        tRNA_id, tRNA_structure, aaRS_id, aaRS_sequence = pair
-        
-        # 处理序列和结构
-        aaRS_structure = '.' * len(aaRS_sequence)
-        tRNA_sequence = tRNA_structure[0].lower().replace("t", "u")
-        tRNA_structure_processed = tRNA_structure[1].replace("<", ")").replace(">", "(")
-        
-        # 生成RNP ID
-        rnp_id = f"{aaRS_id}_{tRNA_id}"
-        rnp_ids.append(rnp_id)
-        
-        # 组合序列和结构
-        rnp_sequence = aaRS_sequence + tRNA_sequence
-        rnp_structure = aaRS_structure + tRNA_structure_processed
-        
-        logger.debug(f"处理配对 {i}/{len(pairs)}: {rnp_id}")
-        logger.debug(f"  aaRS长度: {len(aaRS_sequence)}, tRNA长度: {len(tRNA_sequence)}")
-        logger.debug(f"  总长度: {len(rnp_sequence)}")
-        
-        # 生成FASTA文件
-        fasta_file = os.path.join(output_dir, f"{rnp_id}.fasta")
-        with open(fasta_file, "w") as f:
-            f.write(f">{rnp_id}\n{rnp_sequence}\n")
-        logger.debug(f"  生成FASTA文件: {fasta_file}")
-        
-        # 生成结构文件
-        struct_file = os.path.join(output_dir, f"{rnp_id}.txt")
-        with open(struct_file, "w") as f:
-            f.write(f"{rnp_structure}\n{rnp_sequence}\n")
-        logger.debug(f"  生成结构文件: {struct_file}")
-        
-        generated_count += 1
-        
-        if i % 10 == 0 or i == len(pairs):
-            logger.info(f"已处理 {i}/{len(pairs)} 个配对")
-    
-    # 生成RNP ID列表文件
-    rnp_ids_file = os.path.join(output_dir, "rnp_ids.txt")
-    with open(rnp_ids_file, "w") as f:
-        for rnp_id in rnp_ids:
-            f.write(f"{rnp_id}\n")
-    
-    logger.info(f"文件生成完成!")
-    logger.info(f"  生成了{generated_count}个FASTA文件")
-    logger.info(f"  生成了{generated_count}个结构文件")
-    logger.info(f"  生成了RNP ID列表文件: {rnp_ids_file}")
-    logger.info(f"  所有文件已保存到: {output_dir}")
+    progress = RateLimiter(every_n=1000, min_interval=10)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for rnp_id, (tRNA_id, _, aaRS_id, _) in zip(rnp_ids, pairs):
+            aaRS_sequence, aaRS_structure = aaRS_fragments[aaRS_id]
+            tRNA_sequence, tRNA_structure = tRNA_fragments[tRNA_id]
+            futures.append(pool.submit(write_rnp_files, output_dir, rnp_id,
+                                       aaRS_sequence + tRNA_sequence, aaRS_structure + tRNA_structure))
+        for future in as_completed(futures):
+            rnp_id = future.result()
+            generated_count += 1
+            logger.debug("  生成输入文件: %s.fasta, %s.txt", rnp_id, rnp_id)
+            if progress.ready() or generated_count == len(pairs):
+                logger.info("已处理 %d/%d 个配对", generated_count, len(pairs))
+
+    # 生成RNP ID列表文件（分片运行时为 rnp_ids.shard<k>of<N>.txt，用 shard_utils.py merge rnp_ids 合并）
+    rnp_ids_file = os.path.join(output_dir, f"rnp_ids{shard_suffix(shard)}.txt")
+    write_atomic(rnp_ids_file, "".join(f"{rnp_id}\n" for rnp_id in rnp_ids))
+
+    logger.info("文件生成完成!")
+    logger.info("  生成了%d个FASTA文件", generated_count)
+    logger.info("  生成了%d个结构文件", generated_count)
+    logger.info("  生成了RNP ID列表文件: %s", rnp_ids_file)
+    logger.info("  所有文件已保存到: %s", output_dir)
 
 
 def main():
     # 初始化日志系统
-    logger = setup_logger(__file__)
+    logger = setup_logger(__file__, queue=True)
     
     parser = argparse.ArgumentParser(description='批量生成tRNA和蛋白质复合物结构预测所需的输入文件')
     parser.add_argument('--tRNA_ids', required=True, help='tRNA候选文件')
@@ -225,80 +240,93 @@ def main():
     parser.add_argument('--tRNA_structure', required=True, help='tRNAscan-SE输出的.ss文件')
     parser.add_argument('--aaRSs_fasta', required=True, help='aaRSs FASTA文件')
     parser.add_argument('--output_dir', required=True, help='输出目录')
+    parser.add_argument('--max_workers', type=int, help='写输入文件的线程数，默认由 ThreadPoolExecutor 决定')
+    add_shard_argument(parser, 'RNP ID')
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, __file__)
     
     logger.info("=" * 80)
     logger.info("开始执行fasta_file_prepare.py脚本")
     logger.info("=" * 80)
-    logger.info(f"输入参数:")
-    logger.info(f"  tRNA候选文件: {args.tRNA_ids}")
-    logger.info(f"  tRNA ID映射文件: {args.tRNA_ids_map}")
-    logger.info(f"  tRNA结构文件: {args.tRNA_structure}")
-    logger.info(f"  aaRS FASTA文件: {args.aaRSs_fasta}")
-    logger.info(f"  输出目录: {args.output_dir}")
+    logger.info("输入参数:")
+    logger.info("  tRNA候选文件: %s", args.tRNA_ids)
+    logger.info("  tRNA ID映射文件: %s", args.tRNA_ids_map)
+    logger.info("  tRNA结构文件: %s", args.tRNA_structure)
+    logger.info("  aaRS FASTA文件: %s", args.aaRSs_fasta)
+    logger.info("  输出目录: %s", args.output_dir)
     
     try:
         # 确保输出目录存在
-        logger.info(f"创建输出目录: {args.output_dir}")
+        logger.info("创建输出目录: %s", args.output_dir)
         os.makedirs(args.output_dir, exist_ok=True)
         
         # 步骤1: 提取 tRNA ID
         logger.info("\n" + "="*50)
         logger.info("步骤1: 提取tRNA ID")
         logger.info("="*50)
-        tRNA_ids_dict = extract_tRNA_id(args.tRNA_ids, args.tRNA_ids_map)
-        logger.info(f"步骤1完成: 成功映射{len(tRNA_ids_dict)}个tRNA ID")
+        with stage("步骤1: 提取tRNA ID", logger):
+            tRNA_ids_dict = extract_tRNA_id(args.tRNA_ids, args.tRNA_ids_map)
+        logger.info("步骤1完成: 成功映射%d个tRNA ID", len(tRNA_ids_dict))
         
         # 步骤2: 提取 tRNA 结构
         logger.info("\n" + "="*50)
         logger.info("步骤2: 提取tRNA结构")
         logger.info("="*50)
-        tRNA_structures = extract_tRNA_structure(tRNA_ids_dict, args.tRNA_structure)
-        logger.info(f"步骤2完成: 获得{len(tRNA_structures)}个tRNA的结构信息")
+        with stage("步骤2: 提取tRNA结构", logger):
+            tRNA_structures = extract_tRNA_structure(tRNA_ids_dict, args.tRNA_structure)
+        logger.info("步骤2完成: 获得%d个tRNA的结构信息", len(tRNA_structures))
         
         # 步骤3: 提取蛋白质序列
         logger.info("\n" + "="*50)
         logger.info("步骤3: 提取aaRS蛋白质序列")
         logger.info("="*50)
-        aaRSs = extract_aaRSs(args.aaRSs_fasta)
-        logger.info(f"步骤3完成: 获得{len(aaRSs)}个aaRS蛋白质序列")
+        with stage("步骤3: 提取aaRS蛋白质序列", logger):
+            aaRSs = extract_aaRSs(args.aaRSs_fasta)
+        logger.info("步骤3完成: 获得%d个aaRS蛋白质序列", len(aaRSs))
         
         # 步骤4: 配对 tRNA 和蛋白质
         logger.info("\n" + "="*50)
         logger.info("步骤4: 配对tRNA和aaRS")
         logger.info("="*50)
-        pairs = pair_tRNA_and_aaRS(tRNA_structures, aaRSs)
-        logger.info(f"步骤4完成: 创建了{len(pairs)}个tRNA-aaRS配对")
+        with stage("步骤4: 配对tRNA和aaRS", logger):
+            pairs = pair_tRNA_and_aaRS(tRNA_structures, aaRSs)
+            if args.shard:
+                total = len(pairs)
+                pairs = select_shard(pairs, args.shard, key=lambda pair: f"{pair[2]}_{pair[0]}")
+                logger.info("分片 %d/%d: 处理 %d/%d 个配对", args.shard[0], args.shard[1], len(pairs), total)
+        logger.info("步骤4完成: 创建了%d个tRNA-aaRS配对", len(pairs))
         
         # 步骤5: 生成输入文件
         logger.info("\n" + "="*50)
         logger.info("步骤5: 生成输入文件")
         logger.info("="*50)
-        generate_input_files(pairs, args.output_dir)
+        with stage("步骤5: 生成输入文件", logger):
+            generate_input_files(pairs, args.output_dir, args.max_workers, args.shard)
         logger.info("步骤5完成: 所有输入文件已生成")
         
         # 执行总结
         logger.info("\n" + "="*80)
         logger.info("执行总结")
         logger.info("="*80)
-        logger.info(f"输入tRNA候选数量: 从{args.tRNA_ids}读取")
-        logger.info(f"成功映射的tRNA ID: {len(tRNA_ids_dict)}个")
-        logger.info(f"获得结构信息的tRNA: {len(tRNA_structures)}个")
-        logger.info(f"可用的aaRS蛋白质: {len(aaRSs)}个")
-        logger.info(f"最终生成的配对: {len(pairs)}个")
-        logger.info(f"输出文件保存位置: {args.output_dir}")
+        logger.info("输入tRNA候选数量: 从%s读取", args.tRNA_ids)
+        logger.info("成功映射的tRNA ID: %d个", len(tRNA_ids_dict))
+        logger.info("获得结构信息的tRNA: %d个", len(tRNA_structures))
+        logger.info("可用的aaRS蛋白质: %d个", len(aaRSs))
+        logger.info("最终生成的配对: %d个", len(pairs))
+        logger.info("输出文件保存位置: %s", args.output_dir)
         
         if len(tRNA_structures) < len(tRNA_ids_dict):
             missing_structures = len(tRNA_ids_dict) - len(tRNA_structures)
-            logger.warning(f"注意: 有{missing_structures}个tRNA ID映射成功但未找到结构信息")
+            logger.warning("注意: 有%d个tRNA ID映射成功但未找到结构信息", missing_structures)
         
         logger.info("脚本执行完成!")
         
     except Exception as e:
-        logger.error(f"脚本执行过程中发生错误: {str(e)}")
-        logger.error(f"错误类型: {type(e).__name__}")
+        logger.error("脚本执行过程中发生错误: %s", e)
+        logger.error("错误类型: %s", type(e).__name__)
         import traceback
-        logger.error(f"详细错误信息:\n{traceback.format_exc()}")
+        logger.error("详细错误信息:\n%s", traceback.format_exc())
         raise
 
 if __name__ == '__main__':
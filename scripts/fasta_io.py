@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+轻量的 FASTA 读写和索引
+
+aaRS 序列和突变体库都是简单的 FASTA（突变体库为每条记录两行的 fasta-2line 格式），
+用 Bio.SeqIO 读写时每条记录都要创建 SeqRecord/Seq 对象，记录数达到几十万时很慢。这里直接处理文本：
+    read_fasta      逐条返回 (标题行, 序列) 元组（标题行不含 ">"），序列可以分多行
+    FastaWriter     带缓冲的 2 行 FASTA 写入器，先写临时文件再重命名
+    write_fasta     把 (标题行, 序列) 写成 2 行 FASTA
+    FastaIndex      samtools 兼容的 .fai 索引，按 ID 随机读取序列，不需要读入整个文件
+
+文件名以 .gz 结尾时按 gzip 读写（gzip 文件不支持索引）。
+标题行与 Bio.SeqIO 的约定相同：第一个空白字符前的部分是 ID（record.id），见 fasta_id。
+
+用法：
+    fasta_io.py index library.fasta                     # 生成 library.fasta.fai
+    fasta_io.py fetch library.fasta tRNA-Asn-ATT-1_mutant1 tRNA-Asn-ATT-1_original
+"""
+
+import os
+import sys
+import gzip
+import argparse
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+GZIP_COMPRESSLEVEL = 6
+
+
+def open_text(path, mode="r", buffer_size=DEFAULT_BUFFER_SIZE):
+    """按扩展名打开文本文件，.gz 结尾时用 gzip"""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", compresslevel=GZIP_COMPRESSLEVEL)
+    return open(path, mode, buffering=buffer_size)
+
+
+def fasta_id(title):
+    """标题行中第一个空白字符前的部分（与 Bio.SeqIO 的 record.id 相同）"""
+    return title.split(None, 1)[0] if title else ""
+
+
+def _join_sequence(lines):
+    seq = "".join(lines)
+    return seq.replace(" ", "") if " " in seq else seq
+
+
+def read_fasta(path):
+    """
+    逐条读取 FASTA 记录
+
+    Args:
+        path (str): FASTA 文件路径，.gz 结尾时按 gzip 读取
+
+    Yields:
+        tuple[str, str]: (标题行（不含 ">"）, 序列)
+    """
+    with open_text(path) as f:
+        title = None
+        lines = []
+        for line in f:
+            if line[0] == ">":
+                if title is not None:
+                    yield title, _join_sequence(lines)
+                    lines = []
+                title = line[1:].rstrip()
+            elif title is not None:
+                lines.append(line.rstrip())
+            elif line.strip():
+                raise ValueError(f"{path} 第一条记录之前有非 FASTA 内容: {line.rstrip()[:50]}")
+        if title is not None:
+            yield title, _join_sequence(lines)
+
+
+def read_fasta_dict(path):
+    """读取 FASTA，返回 {ID: 序列}（ID 重复时保留最后一条）"""
+    return {fasta_id(title): seq for title, seq in read_fasta(path)}
+
+
+class FastaWriter:
+    """
+    2 行 FASTA 写入器：写入临时文件，正常关闭时重命名为目标文件，出错时删除临时文件
+
+    用法：
+        with FastaWriter(out_file) as writer:
+            writer.write("tRNA-Asn-ATT-1_original aa:Asn", seq)
+    """
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.path = str(path)
+        suffix = ".gz" if self.path.endswith(".gz") else ""
+        # 临时文件保留 .gz 后缀以按相同方式压缩
+        self.tmp_path = f"{self.path}.tmp{os.getpid()}{suffix}"
+        self.count = 0
+        self._file = open_text(self.tmp_path, "w", buffer_size)
+
+    def write(self, title, seq):
+        self._file.write(f">{title}\n{seq}\n")
+        self.count += 1
+
+    def write_records(self, records):
+        """写入 (标题行, 序列) 的可迭代对象，返回写入的记录数"""
+        before = self.count
+        for title, seq in records:
+            self.write(title, seq)
+        return self.count - before
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_fasta(path, records, buffer_size=DEFAULT_BUFFER_SIZE):
+    """把 (标题行, 序列) 写成 2 行 FASTA，返回写入的记录数"""
+    with FastaWriter(path, buffer_size) as writer:
+        return writer.write_records(records)
+
+
+def index_path(path):
+    return f"{path}.fai"
+
+
+def build_index(path):
+    """
+    扫描 FASTA 生成 .fai 索引（samtools faidx 格式：ID、长度、序列起始字节、每行碱基数、每行字节数）
+
+    Returns:
+        dict[str, tuple[int, int, int, int]]: {ID: (长度, 偏移, 每行碱基数, 每行字节数)}
+    """
+    if str(path).endswith(".gz"):
+        raise ValueError(f"gzip 压缩的 FASTA 不支持索引: {path}")
+    entries = {}
+    order = []
+
+    def finish(name, length, offset, line_bases, line_width, widths):
+        # 记录末尾的空行不影响偏移；其余各行除最后一行外长度必须相同，才能按行宽计算任意位置的字节偏移
+        while widths and widths[-1][0] == 0:
+            widths.pop()
+        if len(set(widths[:-1])) > 1 or (len(widths) > 1 and widths[-1][0] > widths[0][0]):
+            raise ValueError(f"{path} 中 {name} 的序列行长度不一致，无法建立索引")
+        if name in entries:
+            raise ValueError(f"{path} 中 ID 重复: {name}")
+        entries[name] = (length, offset, line_bases, line_width)
+        order.append(name)
+
+    with open(path, "rb") as f:
+        position = 0
+        current = None
+        for line in f:
+            if line.startswith(b">"):
+                if current is not None:
+                    finish(*current)
+                name = fasta_id(line[1:].decode().rstrip())
+                offset = position + len(line)
+                current = [name, 0, offset, 0, 0, []]
+            elif current is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if not current[5]:
+                    current[3], current[4] = bases, len(line)
+                current[1] += bases
+                current[5].append((bases, len(line)))
+            position += len(line)
+        if current is not None:
+            finish(*current)
+
+    tmp_path = f"{index_path(path)}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        for name in order:
+            length, offset, line_bases, line_width = entries[name]
+            f.write(f"{name}\t{length}\t{offset}\t{line_bases}\t{line_width}\n")
+    os.replace(tmp_path, index_path(path))
+    return entries
+
+
+def load_index(path):
+    """读取 .fai 索引；索引不存在或比 FASTA 旧时重新生成"""
+    fai = index_path(path)
+    if not os.path.exists(fai) or os.path.getmtime(fai) < os.path.getmtime(path):
+        return build_index(path)
+    entries = {}
+    with open(fai) as f:
+        for line in f:
+            name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+            entries[name] = (int(length), int(offset), int(line_bases), int(line_width))
+    return entries
+
+
+class FastaIndex:
+    """
+    按 ID 随机读取 FASTA 序列
+
+    用法：
+        with FastaIndex("library.fasta") as index:
+            seq = index["tRNA-Asn-ATT-1_mutant1"]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = load_index(path)
+        self._file = open(path, "rb")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def __getitem__(self, name):
+        length, offset, line_bases, line_width = self.entries[name]
+        if length == 0:
+            return ""
+        # 最后一个碱基所在的字节位置 + 1
+        n_bytes = (length - 1) // line_bases * line_width + (length - 1) % line_bases + 1
+        self._file.seek(offset)
+        data = self._file.read(n_bytes)
+        return data.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def get(self, name, default=None):
+        return self[name] if name in self.entries else default
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FASTA 索引和按 ID 读取序列')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help='生成 samtools 兼容的 .fai 索引')
+    index_parser.add_argument('fasta', help='FASTA 文件（不支持 gzip）')
+
+    fetch_parser = subparsers.add_parser('fetch', help='按 ID 读取序列，输出 2 行 FASTA')
+    fetch_parser.add_argument('fasta', help='FASTA 文件（不支持 gzip），索引不存在时自动生成')
+    fetch_parser.add_argument('ids', nargs='+', help='序列 ID')
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        entries = build_index(args.fasta)
+        print(f"索引了 {len(entries)} 条序列: {index_path(args.fasta)}")
+    elif args.command == 'fetch':
+        with FastaIndex(args.fasta) as index:
+            missing = [name for name in args.ids if name not in index]
+            for name in args.ids:
+                if name in index:
+                    sys.stdout.write(f">{name}\n{index[name]}\n")
+        if missing:
+            print(f"未找到的 ID: {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ tRNA名称映射文件生成器
 import re
 import argparse
 from collections import defaultdict
+from profile_utils import add_profile_arguments, start_profiling
 
 def parse_trnascan_output(input_file):
     """
@@ -141,7 +142,9 @@ def main():
     parser.add_argument('-i', '--input', required=True, help='tRNAscan-SE输出的.ss文件')
     parser.add_argument('-o', '--output', required=True, help='输出映射文件路径')
 
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, __file__)
 
     # 解析tRNAscan-SE输出
     trnas = parse_trnascan_output(args.input)
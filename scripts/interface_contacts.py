@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+tRNA-aaRS 界面接触分析
+
+对每个 decoy 的 PDB 计算界面特征，补充 Rosetta 能量项之外的排序依据：
+    contact_pairs                 蛋白-RNA 重原子距离不超过 cutoff 的原子对数
+    protein_interface_residues    与 RNA 接触的蛋白残基数
+    rna_interface_residues        与蛋白接触的 RNA 残基数
+    anticodon_contact_pairs       反密码子 3 个碱基与蛋白的接触原子对数
+    anticodon_residues_contacted  与蛋白接触的反密码子碱基数（0-3）
+    buried_atoms                  在 buried_cutoff 内有对方原子的重原子数（包埋表面积的近似）
+
+Rosetta 输出的 PDB 中蛋白和 RNA 通常没有不同的链 ID，因此按残基名区分（A/C/G/U 等为 RNA）。
+PDB 用定长列切片一次性读入 NumPy 数组；接触用空间网格哈希计算：RNA 原子按 cutoff 大小的格子排序，
+每个蛋白原子只与相邻 27 个格子中的原子比较距离，全部为数组运算。
+
+反密码子位置由 fasta_file_prepare.py 生成的结构文件（<RNP>.txt）和 tRNA ID 中的反密码子确定（见 trna_structure.py）。
+
+用法：
+    interface_contacts.py --results_dir work/rosetta/Sf_in_Bm/results --input_dir work/rosetta/Sf_in_Bm \\
+        --scores_file work/rosetta/Sf_in_Bm/results/scores.csv --out_file work/rosetta/Sf_in_Bm/results/scores_contacts.csv
+"""
+
+import os
+import glob
+import argparse
+import itertools
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from executor_utils import default_max_workers
+from trna_structure import find_anticodon, anticodon_from_trna_id
+from score_matrix import split_sample_ids
+from logger_utils import setup_logger, get_logger
+
+RNA_RESIDUES = {"A", "C", "G", "U", "RA", "RC", "RG", "RU", "ADE", "CYT", "GUA", "URA"}
+DEFAULT_CUTOFF = 4.0
+DEFAULT_BURIED_CUTOFF = 5.0
+FEATURE_COLUMNS = [
+    "contact_pairs", "protein_interface_residues", "rna_interface_residues",
+    "anticodon_contact_pairs", "anticodon_residues_contacted", "buried_atoms",
+]
+
+# PDB ATOM/HETATM 记录的定长列（从 0 开始，不含终点）
+LINE_WIDTH = 80
+
+
+@dataclass
+class PdbAtoms:
+    coords: np.ndarray      # (n, 3) float64
+    atom_names: np.ndarray  # (n,) str
+    res_names: np.ndarray   # (n,) str
+    chain_ids: np.ndarray   # (n,) str
+    res_seq: np.ndarray     # (n,) int
+    elements: np.ndarray    # (n,) str
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def residue_index(self):
+        """每个原子所属残基的序号（按残基在文件中出现的顺序，从 0 开始）"""
+        key = np.char.add(self.chain_ids, self.res_seq.astype(str))
+        changed = np.ones(len(key), dtype=bool)
+        changed[1:] = key[1:] != key[:-1]
+        return np.cumsum(changed) - 1
+
+    @property
+    def is_rna(self):
+        return np.isin(self.res_names, list(RNA_RESIDUES))
+
+    def subset(self, mask):
+        return PdbAtoms(self.coords[mask], self.atom_names[mask], self.res_names[mask],
+                        self.chain_ids[mask], self.res_seq[mask], self.elements[mask])
+
+
+def _column(block, start, end):
+    """取出定长列并去掉两侧空格"""
+    return np.char.strip(np.ascontiguousarray(block[:, start:end]).view(f"S{end - start}").ravel().astype(str))
+
+
+def load_pdb(path, heavy_only=True):
+    """
+    读取 PDB 的 ATOM/HETATM 记录（只读第一个 MODEL）为 NumPy 数组
+
+    Args:
+        path (str): PDB 文件路径
+        heavy_only (bool): 是否去掉氢原子
+    """
+    lines = []
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith((b"ATOM", b"HETATM")):
+                lines.append(line.rstrip(b"\r\n")[:LINE_WIDTH].ljust(LINE_WIDTH))
+            elif line.startswith(b"ENDMDL"):
+                break
+    block = np.frombuffer(b"".join(lines), dtype="S1").reshape(-1, LINE_WIDTH)
+
+    coords = np.column_stack([
+        np.ascontiguousarray(block[:, start:start + 8]).view("S8").ravel().astype(float)
+        for start in (30, 38, 46)
+    ]) if len(block) else np.empty((0, 3))
+    atom_names = _column(block, 12, 16)
+    elements = _column(block, 76, 78)
+    # 没有元素列的 PDB 用原子名的第一个字母代替
+    elements = np.where(elements == "", np.char.lstrip(atom_names, "0123456789").astype("U1"), elements)
+    atoms = PdbAtoms(coords, atom_names, _column(block, 17, 20), _column(block, 21, 22),
+                     _column(block, 22, 26).astype(int) if len(block) else np.empty(0, dtype=int), elements)
+    if heavy_only:
+        atoms = atoms.subset(atoms.elements != "H")
+    return atoms
+
+
+def grid_contacts(a, b, cutoff):
+    """
+    用空间网格哈希找出 a、b 两组坐标中距离不超过 cutoff 的所有原子对
+
+    Args:
+        a (np.ndarray): (n, 3) 坐标
+        b (np.ndarray): (m, 3) 坐标
+        cutoff (float): 距离阈值（Å）
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: (a 中的索引, b 中的索引, 距离)
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+    if len(a) == 0 or len(b) == 0:
+        return empty
+
+    origin = np.minimum(a.min(axis=0), b.min(axis=0))
+    # 外围留一圈空格子，邻居格子的编号不会越界
+    cell_a = np.floor((a - origin) / cutoff).astype(np.int64) + 1
+    cell_b = np.floor((b - origin) / cutoff).astype(np.int64) + 1
+    dims = np.maximum(cell_a.max(axis=0), cell_b.max(axis=0)) + 2
+
+    def cell_key(cells):
+        return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    key_b = cell_key(cell_b)
+    order = np.argsort(key_b, kind="stable")
+    sorted_keys = key_b[order]
+
+    found_a, found_b, found_d = [], [], []
+    for offset in itertools.product((-1, 0, 1), repeat=3):
+        keys = cell_key(cell_a + np.array(offset))
+        lo = np.searchsorted(sorted_keys, keys, side="left")
+        counts = np.searchsorted(sorted_keys, keys, side="right") - lo
+        total = counts.sum()
+        if total == 0:
+            continue
+        # 把每个 a 原子对应的 [lo, hi) 区间展开为候选原子对
+        idx_a = np.repeat(np.arange(len(a)), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        idx_b = order[np.repeat(lo, counts) + within]
+        dist = np.sqrt(((a[idx_a] - b[idx_b]) ** 2).sum(axis=1))
+        keep = dist <= cutoff
+        found_a.append(idx_a[keep])
+        found_b.append(idx_b[keep])
+        found_d.append(dist[keep])
+    if not found_a:
+        return empty
+    return np.concatenate(found_a), np.concatenate(found_b), np.concatenate(found_d)
+
+
+def interface_features(atoms, anticodon_start=None, cutoff=DEFAULT_CUTOFF, buried_cutoff=DEFAULT_BURIED_CUTOFF):
+    """
+    计算一个 decoy 的界面特征
+
+    Args:
+        atoms (PdbAtoms): load_pdb() 的返回值
+        anticodon_start (int): 反密码子第一个碱基在 RNA 残基中的序号（从 0 开始），None 表示未知
+        cutoff (float): 接触距离阈值（Å）
+        buried_cutoff (float): 包埋原子的距离阈值（Å）
+
+    Returns:
+        dict: FEATURE_COLUMNS 中的各项特征
+    """
+    is_rna = atoms.is_rna
+    residue = atoms.residue_index
+    protein_idx, rna_idx = np.flatnonzero(~is_rna), np.flatnonzero(is_rna)
+    i, j, dist = grid_contacts(atoms.coords[protein_idx], atoms.coords[rna_idx], max(cutoff, buried_cutoff))
+
+    contact = dist <= cutoff
+    protein_atoms, rna_atoms = protein_idx[i], rna_idx[j]
+    # RNA 残基在 RNA 中的序号
+    rna_residue_order = np.full(residue.max() + 1 if len(residue) else 0, -1)
+    rna_residues = np.unique(residue[rna_idx])
+    rna_residue_order[rna_residues] = np.arange(len(rna_residues))
+
+    features = {
+        "contact_pairs": int(contact.sum()),
+        "protein_interface_residues": len(np.unique(residue[protein_atoms[contact]])),
+        "rna_interface_residues": len(np.unique(residue[rna_atoms[contact]])),
+        "buried_atoms": len(np.unique(protein_atoms)) + len(np.unique(rna_atoms)),
+        "anticodon_contact_pairs": None,
+        "anticodon_residues_contacted": None,
+    }
+    if anticodon_start is not None:
+        order = rna_residue_order[residue[rna_atoms[contact]]]
+        in_anticodon = (order >= anticodon_start) & (order < anticodon_start + 3)
+        features["anticodon_contact_pairs"] = int(in_anticodon.sum())
+        features["anticodon_residues_contacted"] = len(np.unique(order[in_anticodon]))
+    return features
+
+
+def rna_anticodon_start(struct_file, tRNA_id):
+    """
+    由 fasta_file_prepare.py 生成的结构文件（第一行结构，第二行序列，RNA 为小写）定位反密码子
+
+    Returns:
+        int | None: 反密码子第一个碱基在 RNA 中的位置（从 0 开始）
+    """
+    if not os.path.exists(struct_file):
+        return None
+    with open(struct_file) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if len(lines) < 2:
+        return None
+    structure, sequence = lines[0], lines[1]
+    rna_length = sum(1 for c in sequence if c.islower())
+    return find_anticodon(sequence[-rna_length:], structure[-rna_length:], anticodon_from_trna_id(tRNA_id))
+
+
+def decoy_features(job):
+    """进程池任务：计算一个 decoy 的界面特征"""
+    sample_id, decoy, pdb, anticodon_start, cutoff, buried_cutoff = job
+    row = {"sample_id": sample_id, "decoy": decoy}
+    try:
+        row.update(interface_features(load_pdb(pdb), anticodon_start, cutoff, buried_cutoff))
+    except (OSError, ValueError) as e:
+        row["error"] = str(e)
+    return row
+
+
+def find_decoy_pdbs(results_dir):
+    """列出结果目录中每个 RNP 已提取的 decoy PDB：[(sample_id, decoy, pdb_path), ...]"""
+    decoys = []
+    for pdb in sorted(glob.glob(os.path.join(results_dir, "*", "*.pdb"))):
+        sample_id = os.path.basename(os.path.dirname(pdb))
+        decoys.append((sample_id, os.path.basename(pdb)[:-len(".pdb")], pdb))
+    return decoys
+
+
+def compute_contacts(results_dir, input_dir=None, cutoff=DEFAULT_CUTOFF, buried_cutoff=DEFAULT_BURIED_CUTOFF,
+                     max_workers=None):
+    """
+    用进程池计算结果目录中所有 decoy 的界面特征
+
+    Returns:
+        pd.DataFrame: sample_id, decoy 和 FEATURE_COLUMNS
+    """
+    logger = get_logger('interface_contacts')
+    decoys = find_decoy_pdbs(results_dir)
+    logger.info(f"找到 {len(decoys)} 个 decoy PDB")
+    if not decoys:
+        return pd.DataFrame(columns=["sample_id", "decoy", *FEATURE_COLUMNS])
+
+    sample_ids = sorted({sample_id for sample_id, _, _ in decoys})
+    anticodons = {}
+    if input_dir:
+        tRNA_ids = split_sample_ids(pd.Series(sample_ids))["tRNA_id"].astype(str)
+        for sample_id, tRNA_id in zip(sample_ids, tRNA_ids):
+            anticodons[sample_id] = rna_anticodon_start(os.path.join(input_dir, f"{sample_id}.txt"), tRNA_id)
+        missing = [sample_id for sample_id, start in anticodons.items() if start is None]
+        if missing:
+            logger.warning(f"{len(missing)} 个 RNP 无法定位反密码子，反密码子特征留空，例如: {missing[0]}")
+
+    jobs = [(sample_id, decoy, pdb, anticodons.get(sample_id), cutoff, buried_cutoff)
+            for sample_id, decoy, pdb in decoys]
+    max_workers = max_workers or default_max_workers()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        rows = list(pool.map(decoy_features, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+
+    contacts = pd.DataFrame(rows)
+    if "error" in contacts.columns:
+        failed = contacts[contacts["error"].notna()]
+        for _, row in failed.iterrows():
+            logger.error(f"{row['sample_id']}/{row['decoy']} 处理失败: {row['error']}")
+        contacts = contacts[contacts["error"].isna()].drop(columns=["error"])
+    return contacts
+
+
+def merge_with_scores(scores, contacts):
+    """
+    把界面特征追加到 collect_scores.py 的 scores 表
+
+    decoy 名（PDB 文件名）与 description 列一致时按 (sample_id, description) 匹配；
+    否则，只提取了一个 PDB 的 RNP（例如 default.out.1.pdb）按 sample_id 匹配。
+    """
+    contacts = contacts.copy()
+    contacts["sample_id"] = contacts["sample_id"].astype(str)
+    scores = scores.copy()
+    scores["_sample_id"] = scores["sample_id"].astype(str)
+
+    features = contacts.set_index(["sample_id", "decoy"])[FEATURE_COLUMNS]
+    matched = pd.DataFrame(index=scores.index, columns=FEATURE_COLUMNS, dtype=float)
+    if "description" in scores.columns:
+        keys = pd.MultiIndex.from_arrays([scores["_sample_id"], scores["description"].astype(str)])
+        matched[:] = features.reindex(keys).to_numpy(dtype=float)
+
+    single = contacts.groupby("sample_id").filter(lambda group: len(group) == 1).set_index("sample_id")[FEATURE_COLUMNS]
+    fallback = single.reindex(scores["_sample_id"]).to_numpy(dtype=float)
+    unmatched = matched.isna().all(axis=1).to_numpy()
+    matched.loc[unmatched] = fallback[unmatched]
+    return pd.concat([scores.drop(columns=["_sample_id"]), matched], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tRNA-aaRS 界面接触分析')
+    parser.add_argument('--results_dir', required=True, help='结果目录（每个 RNP 一个子目录，包含提取的 decoy PDB）')
+    parser.add_argument('--input_dir', help='fasta_file_prepare.py 的输出目录，用于定位反密码子')
+    parser.add_argument('--scores_file', help='collect_scores.py 输出的 scores CSV，给出时把特征追加到该表')
+    parser.add_argument('--out_file', required=True, help='输出 CSV 文件')
+    parser.add_argument('--cutoff', type=float, default=DEFAULT_CUTOFF, help=f'接触距离阈值（Å），默认 {DEFAULT_CUTOFF}')
+    parser.add_argument('--buried_cutoff', type=float, default=DEFAULT_BURIED_CUTOFF,
+                        help=f'包埋原子的距离阈值（Å），默认 {DEFAULT_BURIED_CUTOFF}')
+    parser.add_argument('--max_workers', type=int, help='进程数，默认根据可用 CPU 核数和内存自动推导')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+    contacts = compute_contacts(args.results_dir, args.input_dir, args.cutoff, args.buried_cutoff, args.max_workers)
+    result = contacts
+    if args.scores_file:
+        result = merge_with_scores(pd.read_csv(args.scores_file), contacts)
+        logger.info(f"{int(result[FEATURE_COLUMNS[0]].notna().sum())}/{len(result)} 行 score 匹配到界面特征")
+
+    out_dir = os.path.dirname(args.out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    result.to_csv(args.out_file, index=False)
+    logger.info(f"结果已保存到: {args.out_file}")
+
+
+if __name__ == '__main__':
+    main()
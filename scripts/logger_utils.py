@@ -17,15 +17,66 @@
     logger.info("这是一条信息")
     logger.warning("这是一条警告")
     logger.error("这是一条错误")
+
+    # 后台线程模式：格式化和写文件在后台线程中进行，适合循环中大量输出日志的脚本
+    logger = setup_logger(__file__, queue=True)
+
+    # 循环中的日志使用 % 参数（级别未启用时不格式化），开销大的参数用 lazy 包装
+    logger.debug("序列: %s", lazy(format_sequence, sequence))
+
+    # 限制循环中进度日志的频率
+    progress = RateLimiter(every_n=1000, min_interval=5)
+    for i, item in enumerate(items, 1):
+        if progress.ready():
+            logger.info("已处理 %d 个", i)
+
+    # 阶段计时：耗时和内存写入日志及 logs/<脚本名>/日期时间.stages.jsonl
+    with stage("步骤1: 读取输入", logger):
+        ...
 """
 
 import os
+import json
+import time
+import queue as _queue_module
+import atexit
 import logging
+import logging.handlers
+import functools
+import threading
+import resource
 from datetime import datetime
 from pathlib import Path
 
 
-def setup_logger(script_path, log_level=logging.INFO, console_output=True):
+# 后台线程模式下各日志器的 QueueListener
+_listeners = {}
+# 各脚本的阶段计时报告路径（与日志文件同名，扩展名为 .stages.jsonl）
+_stage_reports = {}
+_stage_lock = threading.Lock()
+_stage_stack = threading.local()
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在调用线程中格式化日志的 QueueHandler
+
+    标准 QueueHandler 在入队前就格式化消息；这里把原始记录直接放入队列，
+    消息格式化（包括 lazy 参数求值）和写文件都在后台线程中进行。
+    因此日志参数在记录之后不应再被修改。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _stop_listener(name):
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+
+def setup_logger(script_path, log_level=logging.INFO, console_output=True, queue=False):
     """
     设置日志配置，为指定脚本创建专用的日志系统
     
@@ -33,6 +84,8 @@ def setup_logger(script_path, log_level=logging.INFO, console_output=True):
         script_path (str): 脚本文件路径，通常传入 __file__
         log_level (int): 日志级别，默认为 logging.INFO
         console_output (bool): 是否同时输出到控制台，默认为 True
+        queue (bool): 是否使用后台线程模式（QueueHandler/QueueListener），
+            日志器只把记录放入队列，格式化和文件/控制台输出由后台线程完成；程序退出时自动清空队列
     
     Returns:
         logging.Logger: 配置好的日志器对象
@@ -47,11 +100,13 @@ def setup_logger(script_path, log_level=logging.INFO, console_output=True):
     # 生成日志文件名
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     log_file = os.path.join(log_dir, f'{timestamp}.log')
+    _stage_reports[script_name] = os.path.join(log_dir, f'{timestamp}.stages.jsonl')
     
     # 创建日志器
     logger = logging.getLogger(script_name)
     
     # 清除已有的处理器（避免重复配置）
+    _stop_listener(script_name)
     if logger.handlers:
         logger.handlers.clear()
     
@@ -68,14 +123,25 @@ def setup_logger(script_path, log_level=logging.INFO, console_output=True):
     file_handler = logging.FileHandler(log_file, encoding='utf-8')
     file_handler.setLevel(log_level)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers = [file_handler]
     
     # 创建控制台处理器（可选）
     if console_output:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(log_level)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
+    
+    if queue:
+        # 后台线程模式：日志器只挂一个入队的处理器，真正的处理器由 QueueListener 调用
+        log_queue = _queue_module.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[script_name] = listener
+        logger.addHandler(_DeferredQueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
     
     # 防止日志传播到根日志器
     logger.propagate = False
@@ -85,6 +151,8 @@ def setup_logger(script_path, log_level=logging.INFO, console_output=True):
     logger.info(f"日志文件: {log_file}")
     logger.info(f"日志级别: {logging.getLevelName(log_level)}")
     logger.info(f"控制台输出: {'启用' if console_output else '禁用'}")
+    if queue:
+        logger.info("后台线程模式: 启用")
     
     return logger
 
@@ -102,6 +170,190 @@ def get_logger(script_name):
     return logging.getLogger(script_name)
 
 
+def shutdown_logger(logger):
+    """
+    停止后台线程模式的 QueueListener，等待队列中的日志全部写出（程序退出时会自动调用）
+    
+    Args:
+        logger (logging.Logger): 日志器对象
+    """
+    _stop_listener(logger.name)
+
+
+@atexit.register
+def _stop_all_listeners():
+    for name in list(_listeners):
+        _stop_listener(name)
+
+
+def _handlers(logger):
+    """日志器实际使用的处理器（后台线程模式下为 QueueListener 中的处理器）"""
+    listener = _listeners.get(logger.name)
+    return list(listener.handlers) if listener is not None else list(logger.handlers)
+
+
+class lazy:
+    """
+    延迟求值的日志参数：只有日志真正输出时才调用 func(*args, **kwargs)，且最多调用一次
+
+    用法：
+        logger.debug("结构: %s", lazy(format_structure, record))
+    """
+
+    __slots__ = ("func", "args", "kwargs", "_text")
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._text = None
+
+    def __str__(self):
+        # 文件和控制台处理器各格式化一次，结果缓存后只求值一次
+        if self._text is None:
+            self._text = str(self.func(*self.args, **self.kwargs))
+        return self._text
+
+
+class RateLimiter:
+    """
+    循环中日志的限频/采样：每 every_n 次或距上次输出超过 min_interval 秒时 ready() 返回 True
+
+    两个条件都给出时满足任一条件即输出；都不给出时每次都输出。
+    第一次调用总是返回 True，suppressed 记录上次输出以来被跳过的次数。
+
+    用法：
+        progress = RateLimiter(every_n=100, min_interval=5)
+        for i, pair in enumerate(pairs, 1):
+            if progress.ready() or i == len(pairs):
+                logger.info("已处理 %d/%d 个配对", i, len(pairs))
+    """
+
+    def __init__(self, every_n=None, min_interval=None):
+        self.every_n = every_n
+        self.min_interval = min_interval
+        self.count = 0
+        self.suppressed = 0
+        self._last_time = None
+
+    def ready(self):
+        self.count += 1
+        now = time.monotonic()
+        due = (
+            self._last_time is None
+            or (self.every_n is None and self.min_interval is None)
+            or (self.every_n is not None and self.count % self.every_n == 0)
+            or (self.min_interval is not None and now - self._last_time >= self.min_interval)
+        )
+        if due:
+            self._last_time = now
+            self.suppressed = 0
+        else:
+            self.suppressed += 1
+        return due
+
+
+def stage_report_path(script_name):
+    """
+    阶段计时报告路径：logs/<脚本名>/<日期时间>.stages.jsonl
+
+    调用过 setup_logger 的脚本与日志文件同名；否则在第一次使用时按当前时间生成。
+    """
+    if script_name not in _stage_reports:
+        log_dir = os.path.join(os.getcwd(), 'logs', script_name)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        _stage_reports[script_name] = os.path.join(log_dir, f'{timestamp}.stages.jsonl')
+    return _stage_reports[script_name]
+
+
+def _max_rss_kb(who):
+    # Linux 上 ru_maxrss 的单位为 KB
+    return resource.getrusage(who).ru_maxrss
+
+
+def _cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class stage:
+    """
+    阶段计时：记录墙钟时间、CPU 时间（本进程和子进程）和峰值内存（RSS）的增量
+
+    可以作为上下文管理器或装饰器使用，可以嵌套；结束时写一条日志，
+    并向 logs/<脚本名>/ 下的 .stages.jsonl 报告追加一行 JSON。
+    峰值 RSS 只增不减，max_rss_delta_kb 为该阶段使峰值增加的量（阶段内没有超过之前的峰值时为 0）。
+
+    Args:
+        name (str): 阶段名称
+        logger (logging.Logger | str): 日志器或脚本名，决定日志输出和报告路径
+
+    用法：
+        with stage("步骤1: 提取tRNA ID", logger):
+            ...
+
+        @stage("汇总 score", "collect_scores")
+        def sum_scores(...):
+            ...
+    """
+
+    def __init__(self, name, logger):
+        self.name = name
+        self.logger = get_logger(logger) if isinstance(logger, str) else logger
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 每次调用使用新的实例，递归和多线程调用互不影响
+            with stage(self.name, self.logger):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        stack = _stage_stack.__dict__.setdefault('stack', [])
+        self.path = "/".join([s.name for s in stack] + [self.name])
+        self.depth = len(stack)
+        stack.append(self)
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._rss = _max_rss_kb(resource.RUSAGE_SELF)
+        self._cpu = _cpu_seconds(resource.RUSAGE_SELF)
+        self._children_cpu = _cpu_seconds(resource.RUSAGE_CHILDREN)
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        max_rss = _max_rss_kb(resource.RUSAGE_SELF)
+        record = {
+            "script": self.logger.name,
+            "stage": self.name,
+            "path": self.path,
+            "depth": self.depth,
+            "started_at": self.started_at,
+            "status": "ok" if exc_type is None else exc_type.__name__,
+            "wall_time": round(wall, 6),
+            "cpu_time": round(_cpu_seconds(resource.RUSAGE_SELF) - self._cpu, 6),
+            "children_cpu_time": round(_cpu_seconds(resource.RUSAGE_CHILDREN) - self._children_cpu, 6),
+            "max_rss_kb": max_rss,
+            "max_rss_delta_kb": max_rss - self._rss,
+            "pid": os.getpid(),
+        }
+        _stage_stack.stack.pop()
+
+        self.logger.info(
+            "阶段 %s %s: 墙钟 %.2f 秒, CPU %.2f 秒（子进程 %.2f 秒）, 峰值内存 %.1f MB（+%.1f MB）",
+            self.path, "完成" if exc_type is None else "出错", wall, record["cpu_time"],
+            record["children_cpu_time"], max_rss / 1024, record["max_rss_delta_kb"] / 1024,
+            stacklevel=2,
+        )
+        report = stage_report_path(self.logger.name)
+        with _stage_lock:
+            os.makedirs(os.path.dirname(report), exist_ok=True)
+            with open(report, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return False
+
+
 def set_log_level(logger, level):
     """
     动态设置日志级别
@@ -111,7 +363,7 @@ def set_log_level(logger, level):
         level (int): 新的日志级别
     """
     logger.setLevel(level)
-    for handler in logger.handlers:
+    for handler in logger.handlers + _handlers(logger):
         handler.setLevel(level)
     logger.info(f"日志级别已更改为: {logging.getLevelName(level)}")
 
@@ -133,7 +385,11 @@ def add_file_handler(logger, log_file, level=logging.INFO):
     file_handler = logging.FileHandler(log_file, encoding='utf-8')
     file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    listener = _listeners.get(logger.name)
+    if listener is not None:
+        listener.handlers = listener.handlers + (file_handler,)
+    else:
+        logger.addHandler(file_handler)
     
     logger.info(f"已添加额外日志文件: {log_file}")
 
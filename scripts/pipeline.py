@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+正交 tRNA 分析流程的 DAG 运行器（按内容哈希缓存）
+
+documents/ 中的流程（名称映射 → 正交得分 → RNP 输入文件 → 对接 → 收集 score → 筛选候选 tRNA → 突变体库）
+原本需要逐条手动输入命令。这里用一个 JSON 文件描述各阶段的命令、输入和输出，运行器：
+    - 按输入/输出路径自动推导依赖关系（某阶段的输入位于另一阶段的输出之下即依赖该阶段）
+    - 为每个阶段计算哈希：命令、命令中用到的脚本内容、所有输入文件的内容；
+      哈希与上次成功运行时一致且输出都存在的阶段直接跳过
+    - 互不依赖的阶段（例如 Sf_in_Bm 和 Bm_in_Sf 两个方向）并行运行
+    - --dry_run 只列出需要重新运行的阶段及原因
+
+流程文件格式（见 documents/pipeline.json）：
+    {
+      "vars": {"work": "work", "results": "results"},
+      "stages": [
+        {
+          "name": "collect_scores_{dir}",
+          "matrix": [{"dir": "Sf_in_Bm"}, {"dir": "Bm_in_Sf"}],
+          "command": "{python} {scripts}/collect_scores.py --input_dir {work}/rosetta/{dir}/results --out_file ...",
+          "inputs": ["{work}/rosetta/{dir}/results"],
+          "outputs": ["{work}/rosetta/{dir}/results/scores.csv"]
+        }
+      ]
+    }
+    command 可以是一条命令或命令列表（依次执行）；matrix 中的每组变量展开为一个阶段；
+    {python} 和 {scripts} 默认为 python 和本脚本所在目录。
+    输入为目录时按目录中所有文件计算哈希；after 可以显式指定依赖的阶段。
+    optional_inputs 中的输入可以不存在（如 block_list.txt），不存在时记为 "absent"，之后出现或消失才需要重新运行；
+    inputs 中的输入在运行时仍不存在则该阶段失败（下游跳过），不会运行命令。
+
+各阶段的哈希保存在流程文件同目录的 .<流程文件名>.state.json 中，每个阶段的输出保存在 logs/pipeline/<阶段名>.log。
+
+用法：
+    pipeline.py run --spec documents/pipeline.json --dry_run
+    pipeline.py run --spec documents/pipeline.json --max_workers 2
+    pipeline.py run --spec documents/pipeline.json --stages filter_Sf_in_Bm   # 只运行该阶段及其上游
+    pipeline.py run --spec documents/pipeline.json --force collect_scores_Sf_in_Bm
+"""
+
+import os
+import sys
+import json
+import shlex
+import hashlib
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from logger_utils import setup_logger, get_logger
+
+# 阶段状态
+UP_TO_DATE = "up_to_date"
+STALE = "stale"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+HASH_CHUNK = 1 << 20
+# 不存在的可选输入的哈希
+ABSENT = "absent"
+
+
+@dataclass
+class Stage:
+    name: str
+    commands: list[str]
+    inputs: list[str]
+    outputs: list[str]
+    optional_inputs: list[str] = field(default_factory=list)
+    after: list[str] = field(default_factory=list)
+    deps: set[str] = field(default_factory=set)
+
+
+def _format(value, variables):
+    if isinstance(value, list):
+        return [_format(item, variables) for item in value]
+    return value.format_map(variables)
+
+
+def load_pipeline(spec_path):
+    """
+    读取流程文件，展开 matrix 并推导依赖关系
+
+    Returns:
+        dict[str, Stage]: 按流程文件中的顺序排列的阶段
+    """
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    base_vars = {"python": "python", "scripts": SCRIPTS_DIR, **spec.get("vars", {})}
+
+    stages = {}
+    for entry in spec["stages"]:
+        for matrix_vars in entry.get("matrix", [{}]):
+            variables = {**base_vars, **matrix_vars}
+            name = _format(entry["name"], variables)
+            if name in stages:
+                raise ValueError(f"阶段名重复: {name}")
+            commands = entry["command"] if isinstance(entry["command"], list) else [entry["command"]]
+            stages[name] = Stage(
+                name=name,
+                commands=_format(commands, variables),
+                inputs=[os.path.normpath(path) for path in _format(entry.get("inputs", []), variables)],
+                outputs=[os.path.normpath(path) for path in _format(entry.get("outputs", []), variables)],
+                optional_inputs=[os.path.normpath(path) for path in _format(entry.get("optional_inputs", []), variables)],
+                after=_format(entry.get("after", []), variables),
+            )
+
+    producers = [(output, stage.name) for stage in stages.values() for output in stage.outputs]
+    for stage in stages.values():
+        for name in stage.after:
+            if name not in stages:
+                raise ValueError(f"阶段 {stage.name} 的 after 中有不存在的阶段: {name}")
+            stage.deps.add(name)
+        for path in stage.inputs + stage.optional_inputs:
+            for output, producer in producers:
+                if producer != stage.name and (path == output or path.startswith(output + os.sep)):
+                    stage.deps.add(producer)
+    topological_order(stages)
+    return stages
+
+
+def topological_order(stages):
+    """按依赖关系排序（同层保持流程文件中的顺序），有环时报错"""
+    order, visiting, visited = [], set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"阶段依赖存在环: {name}")
+        visiting.add(name)
+        for dep in sorted(stages[name].deps, key=list(stages).index):
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+        order.append(name)
+
+    for name in stages:
+        visit(name)
+    return order
+
+
+def select_stages(stages, targets):
+    """targets 及其所有上游阶段"""
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in stages:
+            raise ValueError(f"阶段不存在: {name}")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(stages[name].deps)
+    return selected
+
+
+class HashCache:
+    """文件内容哈希，按 (路径, 大小, 修改时间) 缓存，未修改的大文件不重复读取"""
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        key = f"{stat.st_size}:{stat.st_mtime_ns}"
+        cached = self.entries.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        self.entries[path] = (key, digest.hexdigest())
+        return digest.hexdigest()
+
+    def path_digest(self, path):
+        """文件取内容哈希，目录取其中所有文件（相对路径 + 内容哈希）的哈希，不存在时返回 None"""
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self.file_digest(file_path).encode())
+        return digest.hexdigest()
+
+
+def command_scripts(command):
+    """命令中引用的本地脚本（以 .py / .sh 结尾且存在的参数）"""
+    return [arg for arg in shlex.split(command) if arg.endswith((".py", ".sh")) and os.path.isfile(arg)]
+
+
+def stage_fingerprint(stage, cache):
+    """
+    阶段的指纹：命令（含脚本内容）的哈希和各输入的哈希
+
+    Returns:
+        dict: {"command": 哈希, "inputs": {路径: 哈希}}，缺少的输入为 None，缺少的可选输入为 ABSENT
+    """
+    digest = hashlib.sha256()
+    for command in stage.commands:
+        digest.update(command.encode())
+        for script in command_scripts(command):
+            digest.update(cache.file_digest(script).encode())
+    inputs = {path: cache.path_digest(path) for path in stage.inputs}
+    for path in stage.optional_inputs:
+        inputs[path] = cache.path_digest(path) or ABSENT
+    return {"command": digest.hexdigest(), "inputs": inputs}
+
+
+def missing_inputs(fingerprint):
+    """指纹中不存在的（非可选）输入"""
+    return [path for path, digest in fingerprint["inputs"].items() if digest is None]
+
+
+def stale_reason(stage, fingerprint, previous):
+    """与上次成功运行比较，返回需要重新运行的原因；已是最新时返回 None"""
+    missing = missing_inputs(fingerprint)
+    if missing:
+        return f"输入不存在: {', '.join(missing)}"
+    if previous is None:
+        return "从未运行"
+    if previous["command"] != fingerprint["command"]:
+        return "命令或脚本已修改"
+    changed = [path for path, digest in fingerprint["inputs"].items() if previous["inputs"].get(path) != digest]
+    if changed:
+        return f"输入已修改: {', '.join(changed)}"
+    missing_outputs = [path for path in stage.outputs if not os.path.exists(path)]
+    if missing_outputs:
+        return f"输出不存在: {', '.join(missing_outputs)}"
+    return None
+
+
+class PipelineState:
+    """各阶段上次成功运行时的指纹，保存为 JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {"stages": {}, "hash_cache": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+        self.cache = HashCache({path: tuple(entry) for path, entry in self.data.get("hash_cache", {}).items()})
+
+    def get(self, name):
+        return self.data["stages"].get(name)
+
+    def set(self, name, fingerprint):
+        self.data["stages"][name] = fingerprint
+
+    def save(self):
+        self.data["hash_cache"] = self.cache.entries
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def default_state_path(spec_path):
+    directory, name = os.path.split(os.path.abspath(spec_path))
+    return os.path.join(directory, f".{os.path.splitext(name)[0]}.state.json")
+
+
+def plan(stages, state, selected=None, force=()):
+    """
+    按拓扑顺序判断各阶段是否需要运行（dry-run 用）：上游需要运行时下游也需要运行
+
+    Returns:
+        list[tuple[str, str, str | None]]: [(阶段名, 状态, 原因), ...]
+    """
+    rows = []
+    statuses = {}
+    for name in topological_order(stages):
+        if selected is not None and name not in selected:
+            continue
+        stage = stages[name]
+        stale_deps = [dep for dep in sorted(stage.deps) if statuses.get(dep) == STALE]
+        if name in force:
+            reason = "--force"
+        elif stale_deps:
+            reason = f"上游需要重新运行: {', '.join(stale_deps)}"
+        else:
+            reason = stale_reason(stage, stage_fingerprint(stage, state.cache), state.get(name))
+        statuses[name] = STALE if reason else UP_TO_DATE
+        rows.append((name, statuses[name], reason))
+    return rows
+
+
+def run_stage(stage, log_dir):
+    """依次执行阶段的命令（先创建输出所在的目录），输出写入 logs/pipeline/<阶段名>.log，返回退出码"""
+    log_path = os.path.join(log_dir, f"{stage.name}.log")
+    # 部分脚本不会自动创建输出文件所在的目录
+    for output in stage.outputs:
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        for command in stage.commands:
+            log.write(f"$ {command}\n")
+            log.flush()
+            returncode = subprocess.run(command, shell=True, stdout=log, stderr=subprocess.STDOUT).returncode
+            if returncode != 0:
+                return returncode
+    return 0
+
+
+def run_pipeline(stages, state, selected=None, force=(), max_workers=None, log_dir=None):
+    """
+    运行流程：依赖都完成的阶段提交到线程池，运行前按指纹判断是否可以跳过
+
+    Returns:
+        dict[str, str]: 各阶段的最终状态（UP_TO_DATE / DONE / FAILED / SKIPPED）
+    """
+    logger = get_logger('pipeline')
+    log_dir = log_dir or os.path.join(os.getcwd(), "logs", "pipeline")
+    os.makedirs(log_dir, exist_ok=True)
+    names = [name for name in topological_order(stages) if selected is None or name in selected]
+    results = {}
+    rerun = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(results) < len(names):
+            for name in names:
+                if name in results or name in running.values():
+                    continue
+                deps = [dep for dep in stages[name].deps if selected is None or dep in selected]
+                if any(results.get(dep) in (FAILED, SKIPPED) for dep in deps):
+                    results[name] = SKIPPED
+                    logger.warning(f"跳过 {name}: 上游阶段失败")
+                    continue
+                if not all(dep in results for dep in deps):
+                    continue
+
+                stage = stages[name]
+                fingerprint = stage_fingerprint(stage, state.cache)
+                reason = "--force" if name in force else stale_reason(stage, fingerprint, state.get(name))
+                if reason is None and not rerun.intersection(deps):
+                    results[name] = UP_TO_DATE
+                    logger.info(f"{name}: 已是最新，跳过")
+                    continue
+                # 上游都已完成后输入仍不存在，运行命令也无意义，直接记为失败
+                missing = missing_inputs(fingerprint)
+                if missing:
+                    results[name] = FAILED
+                    logger.error(f"{name}: 输入不存在，未运行: {', '.join(missing)}")
+                    continue
+                logger.info(f"{name}: 开始运行（{reason or '上游已重新运行'}）")
+                future = pool.submit(run_stage, stage, log_dir)
+                running[future] = name
+
+            if not running:
+                if len(results) < len(names):
+                    raise RuntimeError("存在无法满足依赖的阶段")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                returncode = future.result()
+                missing = [path for path in stages[name].outputs if not os.path.exists(path)]
+                if returncode == 0 and missing:
+                    results[name] = FAILED
+                    logger.error(f"{name}: 命令成功但输出不存在: {', '.join(missing)}")
+                elif returncode == 0:
+                    # 运行后重新计算指纹（命令可能修改了输入目录中的文件）
+                    state.set(name, stage_fingerprint(stages[name], state.cache))
+                    state.save()
+                    results[name] = DONE
+                    rerun.add(name)
+                    logger.info(f"{name}: 完成")
+                else:
+                    results[name] = FAILED
+                    logger.error(f"{name}: 失败（退出码 {returncode}），日志: {os.path.join(log_dir, name + '.log')}")
+    state.save()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='正交 tRNA 分析流程的 DAG 运行器（按内容哈希缓存）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行流程，跳过已是最新的阶段')
+    run_parser.add_argument('--spec', required=True, help='流程文件（JSON）')
+    run_parser.add_argument('--state', help='状态文件，默认为流程文件同目录的 .<流程文件名>.state.json')
+    run_parser.add_argument('--stages', nargs='+', help='只运行这些阶段及其上游')
+    run_parser.add_argument('--force', nargs='+', default=[], help='强制重新运行这些阶段（下游随之重新运行）')
+    run_parser.add_argument('--max_workers', type=int, help='同时运行的阶段数上限')
+    run_parser.add_argument('--dry_run', action='store_true', help='只列出需要重新运行的阶段及原因')
+
+    graph_parser = subparsers.add_parser('graph', help='打印阶段及其依赖')
+    graph_parser.add_argument('--spec', required=True, help='流程文件（JSON）')
+    args = parser.parse_args()
+
+    stages = load_pipeline(args.spec)
+    if args.command == 'graph':
+        for name in topological_order(stages):
+            deps = ", ".join(sorted(stages[name].deps)) or "-"
+            print(f"{name}  <-  {deps}")
+        return
+
+    state = PipelineState(args.state or default_state_path(args.spec))
+    selected = select_stages(stages, args.stages) if args.stages else None
+    force = set(args.force)
+    unknown = force - set(stages)
+    if unknown:
+        parser.error(f"阶段不存在: {', '.join(sorted(unknown))}")
+
+    if args.dry_run:
+        rows = plan(stages, state, selected, force)
+        width = max(len(name) for name, _, _ in rows)
+        for name, status, reason in rows:
+            print(f"{name:<{width}}  {'需要运行' if status == STALE else '已是最新'}  {reason or ''}")
+        print(f"共 {len(rows)} 个阶段，{sum(status == STALE for _, status, _ in rows)} 个需要运行")
+        return
+
+    logger = setup_logger(__file__)
+    results = run_pipeline(stages, state, selected, force, args.max_workers)
+    counts = {status: list(results.values()).count(status) for status in (DONE, UP_TO_DATE, FAILED, SKIPPED)}
+    logger.info(f"运行完成: {counts[DONE]} 个已运行, {counts[UP_TO_DATE]} 个已是最新, "
+                f"{counts[FAILED]} 个失败, {counts[SKIPPED]} 个因上游失败跳过")
+    if counts[FAILED] or counts[SKIPPED]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,88 +4,421 @@
 """
 绘制 Rosetta RNA-蛋白质复合物结构预测的 score 散点图
 
+行数不超过 --max_points 时每个样本画一个点（sns.relplot）；
+超过时（或 --mode density）改为 hexbin / 二维直方图密度图，密度层以位图嵌入 PDF，
+文件大小和打开速度与行数无关。给出 --candidates_file（candidate_tRNAs_filter.py 的输出）时，
+排名前 --top_k 的候选 tRNA 的样本单独画点并在图例中标注 tRNA ID。
+只读取绘图需要的列。
+
+--batch 从 JSON 文件（示例见 documents/plots.json）读取多张图的定义，在一个进程中绘制：
+每个 score 文件和候选文件只读取一次（只读取所有图需要的列的并集），
+--workers 大于 1 时用 fork 的进程池（Agg 后端）并行绘制，子进程直接共享已读入的表。
+JSON 的格式与 pipeline.py 的流程文件相同：vars 中的变量可在字符串中以 {变量名} 引用，
+matrix 把一个条目展开为多张图；defaults 为所有图的默认参数；
+每张图的参数与命令行参数同名，另外 filter 为 pandas query 表达式，只绘制满足条件的行。
+
 用法：
     plot_scores.py --scores_file scores.csv --out_file scatter.pdf
+    plot_scores.py --scores_file scores.csv --out_file density.pdf --mode density \
+        --candidates_file results/Sf_in_Bm/tRNAs_score.csv --top_k 10
+    plot_scores.py --batch documents/plots.json --workers 4
 """
 
-import seaborn as sns
-import matplotlib.pyplot as plt
-import pandas as pd
 import argparse
 import os
+import re
+import json
+import time
+import dataclasses
+from dataclasses import dataclass
+from profile_utils import add_profile_arguments, start_profiling
 
+MODES = ("auto", "scatter", "density")
+DENSITY_KINDS = ("hexbin", "hist2d")
+DEFAULT_MAX_POINTS = 20000
+DEFAULT_GRIDSIZE = 100
+DEFAULT_TOP_K = 10
 
-def main():
-    parser = argparse.ArgumentParser(description='绘制 Rosetta RNA-蛋白质复合物结构预测的 score 散点图')
-    parser.add_argument('--scores_file', type=str, required=True, help='score 文件')
-    parser.add_argument('--out_file', type=str, required=True, help='输出文件')
-    parser.add_argument('--x_col', type=str, default='total_score', help='X轴列名')
-    parser.add_argument('--y_col', type=str, default='fa_rep', help='Y轴列名')
-    parser.add_argument('--hue_col', type=str, default='N_WC', help='颜色映射列名')
-    parser.add_argument('--size_col', type=str, default='hbond_sc', help='大小映射列名')
-    parser.add_argument('--log_scale', action='store_true', help='使用对数坐标轴')
-    args = parser.parse_args()
 
-    # 检查文件是否存在
-    if not os.path.exists(args.scores_file):
-        print(f"错误: 文件 {args.scores_file} 不存在")
-        return
+@dataclass
+class PlotSpec:
+    """一张图的绘图参数"""
+    out_file: str
+    x_col: str = 'total_score'
+    y_col: str = 'fa_rep'
+    hue_col: str = 'N_WC'
+    size_col: str = 'hbond_sc'
+    log_scale: bool = False
+    mode: str = 'auto'
+    max_points: int = DEFAULT_MAX_POINTS
+    density: str = 'hexbin'
+    gridsize: int = DEFAULT_GRIDSIZE
+    top_k: int = DEFAULT_TOP_K
+    scores_file: str = None
+    candidates_file: str = None
+    filter: str = None
 
-    # 创建输出目录（如果不存在）
-    os.makedirs(os.path.dirname(args.out_file), exist_ok=True)
+    def use_density(self, n_rows):
+        return self.mode == 'density' or (self.mode == 'auto' and n_rows > self.max_points)
 
-    # 读取数据
-    try:
-        scores = pd.read_csv(args.scores_file)
-    except Exception as e:
-        print(f"读取文件时出错: {e}")
-        return
+    def columns(self, density):
+        """绘图需要的列；密度图不使用颜色和大小映射"""
+        return [self.x_col, self.y_col] if density else [self.x_col, self.y_col, self.hue_col, self.size_col]
+
+
+def count_rows(scores_file):
+    """不解析内容，只数数据行数"""
+    with open(scores_file, 'rb') as f:
+        return max(sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1, 0)
+
+
+def load_scores(scores_file, columns, candidate_ids=False):
+    """
+    只读取需要的列
+
+    Args:
+        scores_file (str): collect_scores.py 输出的 CSV
+        columns (list[str]): 需要的数值列
+        candidate_ids (bool): 是否同时读取用于匹配候选 tRNA 的 ID 列（tRNA_id，没有时由 sample_id 拆分）
 
-    # 检查列是否存在
-    required_cols = [args.x_col, args.y_col, args.hue_col, args.size_col]
-    missing_cols = [col for col in required_cols if col not in scores.columns]
+    Returns:
+        pd.DataFrame | None: 缺少列时打印可用列并返回 None
+    """
+    import pandas as pd
+    from candidate_tRNAs_filter import ID_DTYPES
+
+    header = pd.read_csv(scores_file, nrows=0).columns
+    missing_cols = [col for col in dict.fromkeys(columns) if col not in header]
     if missing_cols:
         print(f"错误: 缺少以下列: {', '.join(missing_cols)}")
-        print(f"可用列: {', '.join(scores.columns)}")
-        return
+        print(f"可用列: {', '.join(header)}")
+        return None
+
+    usecols = list(dict.fromkeys(columns))
+    if candidate_ids:
+        id_col = 'tRNA_id' if 'tRNA_id' in header else 'sample_id'
+        if id_col not in header:
+            print("错误: score 文件中没有 tRNA_id 或 sample_id 列，无法标注候选 tRNA")
+            return None
+        usecols.append(id_col)
+    scores = pd.read_csv(scores_file, usecols=usecols,
+                         dtype={col: dtype for col, dtype in ID_DTYPES.items() if col in usecols})
+    if candidate_ids and 'tRNA_id' not in scores.columns:
+        from score_matrix import split_sample_ids
+        scores['tRNA_id'] = split_sample_ids(scores['sample_id'])['tRNA_id']
+    return scores
+
+
+def top_candidates(candidates_file, top_k):
+    """candidate_tRNAs_filter.py 输出中排名前 top_k 的 tRNA ID（文件已按 Pareto 前沿 / 平均 score 排序）"""
+    import pandas as pd
+    candidates = pd.read_csv(candidates_file, usecols=['trna_id'])
+    return candidates['trna_id'].astype(str).head(top_k).tolist()
+
+
+def plot_scatter(scores, spec):
+    """每个样本画一个点"""
+    import seaborn as sns
 
     # 设置绘图风格
     sns.set_theme(style="whitegrid", font_scale=1.2)
-    plt.figure(figsize=(10, 8))
 
     # 创建散点图
     cmap = sns.cubehelix_palette(reverse=True, as_cmap=True)
     g = sns.relplot(
         data=scores,
-        x=args.x_col, y=args.y_col,
-        hue=args.size_col, size=args.hue_col,
-        palette=cmap, sizes=(20, 200),legend = "auto",
+        x=spec.x_col, y=spec.y_col,
+        hue=spec.size_col, size=spec.hue_col,
+        palette=cmap, sizes=(20, 200), legend="auto",
         alpha=1, height=7, aspect=1.2
     )
 
     # 设置坐标轴
-    if args.log_scale:
+    if spec.log_scale:
         g.set(xscale="log", yscale="log")
     g.ax.xaxis.grid(True, "minor", linewidth=.25)
     g.ax.yaxis.grid(True, "minor", linewidth=.25)
 
     # 添加标题和标签
-    # g.fig.suptitle(f"RNA-蛋白质复合物结构预测 Score 分布", fontsize=16)
-    g.set_xlabels(args.x_col, fontsize=14)
-    g.set_ylabels(args.y_col, fontsize=14)
+    g.set_xlabels(spec.x_col, fontsize=14)
+    g.set_ylabels(spec.y_col, fontsize=14)
+    return g.figure, g.ax
+
+
+def plot_density(scores, spec):
+    """hexbin 或二维直方图密度图，密度层栅格化"""
+    import numpy as np
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
 
-    # 调整图例
-    # g._legend.set_title("参数")
+    sns.set_theme(style="whitegrid", font_scale=1.2)
+    fig, ax = plt.subplots(figsize=(8.4, 7))
+    data = scores[[spec.x_col, spec.y_col]].dropna()
+    x = data[spec.x_col].to_numpy(dtype=float)
+    y = data[spec.y_col].to_numpy(dtype=float)
+    cmap = sns.cubehelix_palette(reverse=True, as_cmap=True)
+
+    # 对数坐标轴只能使用同时为正的值
+    log_scale = spec.log_scale
+    if log_scale:
+        positive = (x > 0) & (y > 0)
+        if positive.any():
+            x, y = x[positive], y[positive]
+        else:
+            print(f"警告: {spec.x_col} / {spec.y_col} 没有同时为正的值，不使用对数坐标轴")
+            log_scale = False
+
+    if spec.density == 'hexbin':
+        scale = 'log' if log_scale else 'linear'
+        artist = ax.hexbin(x, y, gridsize=spec.gridsize, bins='log', mincnt=1, cmap=cmap,
+                           xscale=scale, yscale=scale, linewidths=0)
+    else:
+        if log_scale:
+            bins = [np.geomspace(x.min(), x.max(), spec.gridsize + 1),
+                    np.geomspace(y.min(), y.max(), spec.gridsize + 1)]
+            ax.set_xscale('log')
+            ax.set_yscale('log')
+        else:
+            bins = spec.gridsize
+        *_, artist = ax.hist2d(x, y, bins=bins, cmin=1, norm=LogNorm(), cmap=cmap)
+    # 密度层以位图嵌入，矢量 PDF 中只保留坐标轴、文字和候选点
+    artist.set_rasterized(True)
+    fig.colorbar(artist, ax=ax, label='count')
+
+    ax.set_xlabel(spec.x_col, fontsize=14)
+    ax.set_ylabel(spec.y_col, fontsize=14)
+    ax.set_title(f"n = {len(x)}", fontsize=12)
+    return fig, ax
+
+
+def overlay_candidates(ax, scores, spec, candidate_ids):
+    """候选 tRNA 的样本单独画点，图例中标注排名和 tRNA ID"""
+    import seaborn as sns
+
+    palette = sns.color_palette("tab10", len(candidate_ids))
+    tRNA_ids = scores['tRNA_id'].astype(str)
+    for rank, (tRNA_id, color) in enumerate(zip(candidate_ids, palette), 1):
+        points = scores[tRNA_ids == tRNA_id]
+        if points.empty:
+            continue
+        ax.scatter(points[spec.x_col], points[spec.y_col], s=36, color=color, edgecolor='black',
+                   linewidth=0.5, zorder=3, label=f"{rank}. {tRNA_id}")
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(title=f"top {len(candidate_ids)} candidate tRNAs", fontsize=9, title_fontsize=10,
+                  loc='upper left', bbox_to_anchor=(1.25, 1), borderaxespad=0)
+
+
+def render(scores, spec, candidate_ids=None):
+    """按 spec 绘制一张图并保存"""
+    import matplotlib.pyplot as plt
+
+    density = spec.use_density(len(scores))
+    fig, ax = plot_density(scores, spec) if density else plot_scatter(scores, spec)
+    if candidate_ids:
+        overlay_candidates(ax, scores, spec, candidate_ids)
 
     # 保存图像
+    saved = False
     try:
-        g.savefig(args.out_file, dpi=300, bbox_inches='tight')
-        print(f"图像已保存至 {args.out_file}")
+        fig.savefig(spec.out_file, dpi=300, bbox_inches='tight')
+        print(f"图像已保存至 {spec.out_file}（{'密度图' if density else '散点图'}，{len(scores)} 行）")
+        saved = True
     except Exception as e:
         print(f"保存图像时出错: {e}")
 
-    plt.close()
+    plt.close(fig)
+    return saved
+
+
+def load_batch(spec_path):
+    """
+    读取批量绘图的 JSON 文件，展开 matrix
+
+    Returns:
+        list[PlotSpec]: 按文件中的顺序排列的绘图参数
+    """
+    with open(spec_path, encoding="utf-8") as f:
+        spec = json.load(f)
+    variables = spec.get("vars", {})
+    defaults = spec.get("defaults", {})
+    fields = {field.name for field in dataclasses.fields(PlotSpec)}
+
+    plots = []
+    for entry in spec["plots"]:
+        for matrix_vars in entry.get("matrix", [{}]):
+            values = {**defaults, **{key: value for key, value in entry.items() if key != "matrix"}}
+            unknown = sorted(set(values) - fields)
+            if unknown:
+                raise ValueError(f"未知的绘图参数: {', '.join(unknown)}")
+            context = {**variables, **matrix_vars}
+            values = {key: value.format_map(context) if isinstance(value, str) else value
+                      for key, value in values.items()}
+            if not values.get("scores_file") or not values.get("out_file"):
+                raise ValueError(f"绘图定义缺少 scores_file 或 out_file: {entry}")
+            plots.append(PlotSpec(**values))
+
+    out_files = [plot.out_file for plot in plots]
+    duplicated = sorted({path for path in out_files if out_files.count(path) > 1})
+    if duplicated:
+        raise ValueError(f"输出文件重复: {', '.join(duplicated)}")
+    return plots
+
+
+def filter_columns(expression, header):
+    """pandas query 表达式中引用的列"""
+    return [name for name in dict.fromkeys(re.findall(r"[A-Za-z_]\w*", expression or "")) if name in header]
+
+
+def plot_columns(spec, header, n_rows):
+    """一张图需要读取的列：只有确定画密度图时才省略颜色和大小映射列"""
+    density = spec.mode == 'density' or (spec.mode == 'auto' and n_rows > spec.max_points and not spec.filter)
+    return spec.columns(density) + filter_columns(spec.filter, header)
+
+
+# 批量绘图时已读入的表；fork 出的子进程直接继承，不需要序列化
+_BATCH = {}
+
+
+def render_batch_plot(index):
+    """绘制批量定义中的第 index 张图（在主进程或 fork 出的子进程中运行）"""
+    spec = _BATCH["plots"][index]
+    scores = _BATCH["tables"][spec.scores_file]
+    if spec.filter:
+        scores = scores.query(spec.filter)
+    out_dir = os.path.dirname(spec.out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    candidate_ids = _BATCH["candidates"].get(spec.candidates_file)
+    return render(scores, spec, candidate_ids[:spec.top_k] if candidate_ids else None)
+
+
+def run_batch(spec_path, workers=1):
+    """按 JSON 文件批量绘图，返回成功保存的图数"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import pandas as pd
+
+    start = time.perf_counter()
+    plots = load_batch(spec_path)
+    print(f"读取到 {len(plots)} 张图的定义")
+
+    # 检查每张图需要的列，缺少文件或列的图跳过
+    valid = []
+    columns = {}
+    for spec in plots:
+        for path in (spec.scores_file, spec.candidates_file):
+            if path and not os.path.exists(path):
+                print(f"错误: 文件 {path} 不存在，跳过 {spec.out_file}")
+                break
+        else:
+            if spec.scores_file not in columns:
+                header = pd.read_csv(spec.scores_file, nrows=0).columns
+                columns[spec.scores_file] = (header, count_rows(spec.scores_file), [], False)
+            header, n_rows, needed, with_ids = columns[spec.scores_file]
+            required = plot_columns(spec, header, n_rows)
+            missing_cols = [col for col in dict.fromkeys(required) if col not in header]
+            if missing_cols:
+                print(f"错误: {spec.scores_file} 缺少列 {', '.join(missing_cols)}，跳过 {spec.out_file}")
+                continue
+            needed.extend(required)
+            columns[spec.scores_file] = (header, n_rows, needed, with_ids or bool(spec.candidates_file))
+            valid.append(spec)
+
+    # 每个 score 文件和候选文件只读取一次
+    tables = {}
+    for scores_file, (_, n_rows, needed, with_ids) in columns.items():
+        if not needed:
+            continue
+        table = load_scores(scores_file, needed, candidate_ids=with_ids)
+        if table is None:
+            valid = [spec for spec in valid if spec.scores_file != scores_file]
+            continue
+        tables[scores_file] = table
+        print(f"读取 {scores_file}: {n_rows} 行, {len(tables[scores_file].columns)} 列")
+    candidates = {}
+    for spec in valid:
+        if spec.candidates_file and spec.candidates_file not in candidates:
+            candidates[spec.candidates_file] = top_candidates(
+                spec.candidates_file, max(p.top_k for p in valid if p.candidates_file == spec.candidates_file))
+    _BATCH.update(plots=valid, tables=tables, candidates=candidates)
+    print(f"数据读取完成，耗时 {time.perf_counter() - start:.1f} 秒")
+
+    if workers > 1 and len(valid) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            results = list(pool.map(render_batch_plot, range(len(valid))))
+    else:
+        results = [render_batch_plot(index) for index in range(len(valid))]
+
+    saved = sum(results)
+    print(f"批量绘图完成: 保存 {saved}/{len(plots)} 张图，总耗时 {time.perf_counter() - start:.1f} 秒")
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='绘制 Rosetta RNA-蛋白质复合物结构预测的 score 散点图')
+    parser.add_argument('--scores_file', type=str, help='score 文件')
+    parser.add_argument('--out_file', type=str, help='输出文件')
+    parser.add_argument('--x_col', type=str, default='total_score', help='X轴列名')
+    parser.add_argument('--y_col', type=str, default='fa_rep', help='Y轴列名')
+    parser.add_argument('--hue_col', type=str, default='N_WC', help='颜色映射列名')
+    parser.add_argument('--size_col', type=str, default='hbond_sc', help='大小映射列名')
+    parser.add_argument('--log_scale', action='store_true', help='使用对数坐标轴')
+    parser.add_argument('--mode', choices=MODES, default='auto',
+                        help='auto: 行数超过 --max_points 时画密度图；scatter: 总是画散点图；density: 总是画密度图。默认 auto')
+    parser.add_argument('--max_points', type=int, default=DEFAULT_MAX_POINTS,
+                        help=f'auto 模式下画散点图的最大行数，默认 {DEFAULT_MAX_POINTS}')
+    parser.add_argument('--density', choices=DENSITY_KINDS, default='hexbin', help='密度图类型，默认 hexbin')
+    parser.add_argument('--gridsize', type=int, default=DEFAULT_GRIDSIZE,
+                        help=f'密度图每个方向的格子数，默认 {DEFAULT_GRIDSIZE}')
+    parser.add_argument('--candidates_file', type=str, help='candidate_tRNAs_filter.py 的输出，标注排名靠前的候选 tRNA')
+    parser.add_argument('--top_k', type=int, default=DEFAULT_TOP_K, help=f'标注的候选 tRNA 数，默认 {DEFAULT_TOP_K}')
+    parser.add_argument('--batch', type=str, help='批量绘图的 JSON 文件（此时忽略上面的单图参数）')
+    parser.add_argument('--workers', type=int, default=1, help='批量绘图的进程数，默认 1')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if not args.batch and not (args.scores_file and args.out_file):
+        parser.error("需要 --scores_file 和 --out_file，或 --batch")
+    start_profiling(args, __file__)
+
+    if args.batch:
+        if not os.path.exists(args.batch):
+            print(f"错误: 文件 {args.batch} 不存在")
+            return
+        run_batch(args.batch, args.workers)
+        return
+
+    # 检查文件是否存在
+    for path in (args.scores_file, args.candidates_file):
+        if path and not os.path.exists(path):
+            print(f"错误: 文件 {path} 不存在")
+            return
+
+    # 创建输出目录（如果不存在）
+    out_dir = os.path.dirname(args.out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    spec = PlotSpec(args.out_file, args.x_col, args.y_col, args.hue_col, args.size_col, args.log_scale,
+                    args.mode, args.max_points, args.density, args.gridsize, args.top_k,
+                    args.scores_file, args.candidates_file)
+
+    # 读取数据：先数行数决定绘图方式，再只读取需要的列
+    # （pandas 和绘图库较重，在函数内导入，--help 不需要加载）
+    try:
+        density = spec.use_density(count_rows(args.scores_file))
+        scores = load_scores(args.scores_file, spec.columns(density), candidate_ids=bool(args.candidates_file))
+    except Exception as e:
+        print(f"读取文件时出错: {e}")
+        return
+    if scores is None:
+        return
+
+    candidate_ids = top_candidates(args.candidates_file, args.top_k) if args.candidates_file else None
+    render(scores, spec, candidate_ids)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+脚本性能分析工具
+
+为各脚本的 main() 提供统一的 --profile / --profile_memory 参数，不需要手动修改脚本加 cProfile：
+    --profile               用 cProfile 分析整个运行过程，保存 pstats 文件
+    --profile_memory        用 tracemalloc 记录内存分配，按固定间隔采样快照，
+                            保存采样到的内存峰值时刻和结束时刻分配最多的代码位置
+    --profile_interval      内存快照的采样间隔（秒），默认 1
+    --profile_top           文本报告中列出的条目数，默认 30
+
+结果保存在 logs/<脚本名>/ 下，与日志文件同目录（文件名带进程号，同时启动的多个 --shard 任务不会互相覆盖）：
+    <日期时间>_<pid>.prof              cProfile 的 pstats 文件
+    <日期时间>_<pid>.prof.txt          按累计时间排序的前 N 个函数
+    <日期时间>_<pid>.tracemalloc.txt   内存分配最多的前 N 个代码位置
+
+cProfile 只记录主线程：线程池 / 进程池中执行的任务（collect_scores.py 调用 score_jd2 的线程、
+fasta_file_prepare.py 写输入文件的线程、plot_scores.py --workers 大于 1 时的绘图子进程）不计入 .prof，
+主线程中只能看到等待结果的时间。plot_scores.py 用 --workers 1 时在主进程中绘图，可以完整分析。
+tracemalloc 记录本进程所有线程的分配，但不包括子进程。
+
+使用方法：
+    from profile_utils import add_profile_arguments, start_profiling
+
+    parser = argparse.ArgumentParser(...)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profiling(args, __file__)    # 程序退出时自动停止并保存结果
+
+查看多个 pstats 文件合并后的热点函数：
+    profile_utils.py top logs/collect_scores/*.prof -n 20 --sort tottime
+"""
+
+import os
+import io
+import sys
+import atexit
+import pstats
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_TOP = 30
+DEFAULT_INTERVAL = 1.0
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+
+def add_profile_arguments(parser):
+    """为脚本的参数解析器添加性能分析参数"""
+    group = parser.add_argument_group('性能分析')
+    group.add_argument('--profile', action='store_true', help='用 cProfile 分析运行过程，结果保存到 logs/<脚本名>/')
+    group.add_argument('--profile_memory', action='store_true', help='用 tracemalloc 记录内存分配最多的代码位置')
+    group.add_argument('--profile_interval', type=float, default=DEFAULT_INTERVAL,
+                       help=f'内存快照的采样间隔（秒），默认 {DEFAULT_INTERVAL}')
+    group.add_argument('--profile_top', type=int, default=DEFAULT_TOP, help=f'报告中列出的条目数，默认 {DEFAULT_TOP}')
+    return parser
+
+
+def profile_dir(script_path):
+    """性能分析结果目录：logs/<脚本名>/"""
+    return os.path.join(os.getcwd(), 'logs', Path(script_path).stem)
+
+
+class MemorySampler:
+    """
+    后台线程按固定间隔采样 tracemalloc 的已分配内存，保留采样到的内存最高时刻的快照
+
+    tracemalloc 只能给出当前的分配情况，结束时的快照看不到中途释放的大数组；
+    定期采样可以找到峰值附近分配内存的代码位置。
+    """
+
+    def __init__(self, interval, nframes=1):
+        self.interval = interval
+        self.nframes = nframes
+        self.peak_size = 0
+        self.peak_snapshot = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MemorySampler', daemon=True)
+
+    def start(self):
+        tracemalloc.start(self.nframes)
+        self._thread.start()
+
+    def _sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.peak_size:
+            self.peak_size = current
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        """停止采样，返回 (峰值快照, 结束时快照, 峰值内存字节数)"""
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        final = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return self.peak_snapshot or final, final, peak
+
+
+def format_snapshot(snapshot, title, top):
+    """快照中分配内存最多的前 top 个代码位置"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    stats = snapshot.statistics('lineno')
+    lines = [title, f"{'大小 (KB)':>12}{'块数':>10}  位置"]
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:>12.1f}{stat.count:>10}  {frame.filename}:{frame.lineno}")
+    lines.append(f"合计 {sum(stat.size for stat in stats) / 1024 / 1024:.1f} MB")
+    return "\n".join(lines)
+
+
+def format_stats(stats, sort="cumulative", top=DEFAULT_TOP):
+    """pstats 中排在前 top 的函数"""
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(top)
+    return out.getvalue()
+
+
+def start_profiling(args, script_path):
+    """
+    按命令行参数开始性能分析，程序退出时自动停止并保存结果
+
+    Args:
+        args (argparse.Namespace): 包含 add_profile_arguments 添加的参数
+        script_path (str): 脚本路径，通常传入 __file__
+
+    Returns:
+        str | None: 结果文件的前缀（不含扩展名），未开启分析时为 None
+    """
+    if not (getattr(args, 'profile', False) or getattr(args, 'profile_memory', False)):
+        return None
+
+    out_dir = profile_dir(script_path)
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = os.path.join(out_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+    top = args.profile_top
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+    sampler = None
+    if args.profile_memory:
+        sampler = MemorySampler(args.profile_interval)
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+
+    def finish():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(f"{prefix}.prof")
+            with open(f"{prefix}.prof.txt", "w", encoding="utf-8") as f:
+                f.write(format_stats(pstats.Stats(profiler), "cumulative", top))
+            print(f"cProfile 结果已保存到: {prefix}.prof", file=sys.stderr)
+        if sampler is not None:
+            peak_snapshot, final_snapshot, peak = sampler.stop()
+            with open(f"{prefix}.tracemalloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"tracemalloc 记录的内存峰值: {peak / 1024 / 1024:.1f} MB\n\n")
+                f.write(format_snapshot(peak_snapshot, f"采样峰值时刻（{sampler.peak_size / 1024 / 1024:.1f} MB）", top))
+                f.write("\n\n")
+                f.write(format_snapshot(final_snapshot, "结束时刻", top))
+                f.write("\n")
+            print(f"tracemalloc 结果已保存到: {prefix}.tracemalloc.txt", file=sys.stderr)
+
+    atexit.register(finish)
+    return prefix
+
+
+def top_functions(paths, sort="cumulative", top=DEFAULT_TOP):
+    """合并多个 pstats 文件，返回排在前 top 的函数的报告"""
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    return format_stats(stats, sort, top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看脚本的性能分析结果')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    top_parser = subparsers.add_parser('top', help='合并多个 pstats 文件，打印最耗时的函数')
+    top_parser.add_argument('profiles', nargs='+', help='--profile 保存的 .prof 文件')
+    top_parser.add_argument('-n', '--top', type=int, default=DEFAULT_TOP, help=f'打印的函数数，默认 {DEFAULT_TOP}')
+    top_parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative', help='排序方式，默认 cumulative')
+    args = parser.parse_args()
+
+    if args.command == 'top':
+        missing = [path for path in args.profiles if not os.path.exists(path)]
+        if missing:
+            parser.error(f"文件不存在: {', '.join(missing)}")
+        print(f"合并 {len(args.profiles)} 个 profile")
+        print(top_functions(args.profiles, args.sort, args.top))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+rna_denovo 运行时间模型
+
+rna_denovo 每个 decoy 的运行时间主要取决于 RNP 序列（aaRS + tRNA）的总长度。
+这里用幂律模型 wall_time = a * length^b 描述，参数由历史运行时间在对数坐标下最小二乘拟合；
+历史数据不足时使用默认指数，此时估计值只用于排序（相对大小）。
+
+另外提供按给定顺序 / 最长任务优先（LPT）分配到 N 个 worker 的完工时间（makespan）模拟。
+"""
+
+import math
+import heapq
+from dataclasses import dataclass
+
+# 历史数据不足时使用的默认指数
+DEFAULT_EXPONENT = 2.0
+# 拟合所需的最少历史任务数
+MIN_HISTORY = 3
+
+
+@dataclass
+class RuntimeModel:
+    coefficient: float
+    exponent: float
+    n_samples: int = 0
+    r_squared: float | None = None
+
+    def predict(self, length):
+        """预测每个 decoy 的运行时间（秒；未拟合时为相对值）"""
+        return self.coefficient * max(length, 1) ** self.exponent
+
+    @property
+    def fitted(self):
+        return self.n_samples >= MIN_HISTORY and self.r_squared is not None
+
+    def describe(self):
+        if not self.fitted:
+            return f"wall_time ∝ length^{self.exponent:g}（历史数据不足以拟合，仅用于排序）"
+        return (f"wall_time = {self.coefficient:.3g} × length^{self.exponent:.3f}"
+                f"（{self.n_samples} 个历史任务，R² = {self.r_squared:.3f}）")
+
+
+def fit_runtime_model(history):
+    """
+    由历史任务拟合运行时间模型
+
+    Args:
+        history (list[tuple[float, float]]): [(序列长度, 每个 decoy 的运行时间), ...]
+
+    Returns:
+        RuntimeModel
+    """
+    points = [(math.log(length), math.log(wall)) for length, wall in history if length > 0 and wall and wall > 0]
+    # 历史任务不足或序列长度全部相同时无法拟合指数，退回默认模型
+    if len(points) < MIN_HISTORY or len({x for x, _ in points}) < 2:
+        return RuntimeModel(1.0, DEFAULT_EXPONENT)
+
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    exponent = sxy / sxx
+    intercept = mean_y - exponent * mean_x
+
+    ss_tot = sum((y - mean_y) ** 2 for _, y in points)
+    ss_res = sum((y - (intercept + exponent * x)) ** 2 for x, y in points)
+    r_squared = 1 - ss_res / ss_tot if ss_tot > 0 else 1.0
+    return RuntimeModel(math.exp(intercept), exponent, n, r_squared)
+
+
+def simulate_makespan(costs, workers):
+    """
+    按给定顺序把任务依次分配给最先空闲的 worker，返回完工时间
+
+    Args:
+        costs (list[float]): 按调度顺序排列的任务耗时
+        workers (int): worker 数
+    """
+    finish_times = [0.0] * max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heapreplace(finish_times, finish_times[0] + cost)
+    return max(finish_times) if costs else 0.0
+
+
+def longest_first(costs):
+    """最长任务优先顺序"""
+    return sorted(costs, reverse=True)
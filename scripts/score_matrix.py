@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+aaRS × tRNA score 矩阵存储
+
+把 collect_scores.py 汇总的长表（每行一个 sample_id = <aaRS_ID>_<tRNA_ID>）编码为稠密矩阵
+values[aaRS 索引, tRNA 索引, score 项]，aaRS / tRNA ID 和 score 项名称单独保存。
+之后的按 tRNA 统计、block_list 排除（行掩码）、透视表以及不同方向之间的比较都只是数组运算，
+不再需要逐行拆分字符串。
+
+bundle 目录结构：
+    values.npy    float64 数组，形状 (n_aaRS, n_tRNA, n_terms)，缺失的配对为 NaN
+    meta.json     {"aaRS_ids": [...], "tRNA_ids": [...], "terms": [...]}
+
+values.npy 以 mmap 方式加载，大型项目也只需毫秒级即可打开。
+
+用法：
+    score_matrix.py build --scores_file scores.csv --out_dir scores_matrix
+    score_matrix.py stats --matrix_dir scores_matrix --out_file tRNAs_score.csv --block_list block_list.txt
+    score_matrix.py compare --matrix_dir Sf_in_Bm/scores_matrix --other_dir Sf_in_Sf/scores_matrix --out_file compare.csv
+"""
+
+import os
+import json
+import argparse
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+VALUES_FILE = "values.npy"
+META_FILE = "meta.json"
+
+# 不作为 score 项编码的列
+NON_TERM_COLUMNS = {"sample_id", "description", "aaRS_id", "tRNA_id", "trna_id", "protein_id"}
+
+
+def split_sample_ids(sample_ids):
+    """
+    向量化拆分 sample_id（<aaRS_ID>_<tRNA_ID>）为分类类型的 aaRS_id / tRNA_id 两列
+
+    只对去重后的 sample_id 做一次字符串拆分，再通过编码映射回每一行；
+    没有下划线的 sample_id 整体同时作为 aaRS_id 和 tRNA_id（与原先逐行拆分的结果一致）。
+
+    Args:
+        sample_ids (pd.Series): sample_id 列
+
+    Returns:
+        pd.DataFrame: 与输入索引一致的 aaRS_id、tRNA_id 两列（category 类型）
+    """
+    codes, uniques = pd.factorize(sample_ids)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.partition("_")
+    tRNA_ids = parts[2].where(parts[1] != "", parts[0])
+
+    columns = {}
+    for name, values in (("aaRS_id", parts[0]), ("tRNA_id", tRNA_ids)):
+        value_codes, categories = pd.factorize(values, sort=True)
+        row_codes = np.full(len(codes), -1, dtype=value_codes.dtype)
+        row_codes[codes >= 0] = value_codes[codes[codes >= 0]]
+        columns[name] = pd.Categorical.from_codes(row_codes, categories=categories)
+    return pd.DataFrame(columns, index=sample_ids.index)
+
+
+def best_pair_rows(scores, aaRS_codes, tRNA_codes, n_tRNA):
+    """
+    每个 (aaRS, tRNA) 配对保留一行的行号：没有重复时为全部行，否则取 total_score 最低的行（NaN 视为最差）
+
+    Raises:
+        ValueError: 有重复配对但没有 total_score 列
+    """
+    pair = aaRS_codes.astype(np.int64) * n_tRNA + tRNA_codes
+    if len(np.unique(pair)) == len(pair):
+        return np.arange(len(pair))
+    if "total_score" not in scores.columns:
+        raise ValueError("同一 aaRS-tRNA 配对有多行，但没有 total_score 列，无法选择保留的行")
+    total = pd.to_numeric(scores["total_score"], errors="coerce").to_numpy(dtype=float)
+    order = np.lexsort((np.where(np.isnan(total), np.inf, total), pair))
+    first = np.r_[True, pair[order][1:] != pair[order][:-1]]
+    return order[first]
+
+
+@dataclass
+class ScoreMatrix:
+    aaRS_ids: list[str]
+    tRNA_ids: list[str]
+    terms: list[str]
+    values: np.ndarray
+
+    @classmethod
+    def from_scores(cls, scores, terms=None):
+        """
+        由 collect_scores.py 输出的长表构建矩阵
+
+        同一 (aaRS, tRNA) 配对有多行时（例如汇总了全部 decoy 的表）只保留 total_score 最低的一行，
+        与 collect_scores.py 选择最优 decoy 的方式一致；没有 total_score 列时报错。
+
+        Args:
+            scores (pd.DataFrame): 含 sample_id 和各 score 项的表
+            terms (list[str]): 需要编码的 score 项，默认除 ID 列外所有能转换为数值的列
+        """
+        # object 类型的数值列（例如逐行拼接的表）按数值转换，不能转换的值为 NaN；完全不是数值的列不作为 score 项
+        candidates = [col for col in scores.columns if col not in NON_TERM_COLUMNS] if terms is None else list(terms)
+        numeric = {col: pd.to_numeric(scores[col], errors="coerce") for col in candidates}
+        if terms is None:
+            terms = [col for col in candidates if numeric[col].notna().any()]
+        # sample_id 只在这里拆分一次：第一个下划线前为 aaRS ID，其余为 tRNA ID
+        ids = split_sample_ids(scores["sample_id"])
+        aaRS_id, tRNA_id = ids["aaRS_id"].cat, ids["tRNA_id"].cat
+
+        aaRS_codes, tRNA_codes = aaRS_id.codes.to_numpy(), tRNA_id.codes.to_numpy()
+        rows = best_pair_rows(scores, aaRS_codes, tRNA_codes, len(tRNA_id.categories))
+
+        values = np.full((len(aaRS_id.categories), len(tRNA_id.categories), len(terms)), np.nan)
+        values[aaRS_codes[rows], tRNA_codes[rows], :] = np.column_stack(
+            [numeric[term].to_numpy(dtype=float)[rows] for term in terms]) if terms else np.empty((len(rows), 0))
+        return cls(list(aaRS_id.categories), list(tRNA_id.categories), list(terms), values)
+
+    @classmethod
+    def load(cls, matrix_dir, mmap_mode="r"):
+        """加载 bundle，默认以只读 mmap 方式打开 values.npy"""
+        with open(os.path.join(matrix_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(matrix_dir, VALUES_FILE), mmap_mode=mmap_mode)
+        return cls(meta["aaRS_ids"], meta["tRNA_ids"], meta["terms"], values)
+
+    def save(self, matrix_dir):
+        """保存为 bundle 目录"""
+        os.makedirs(matrix_dir, exist_ok=True)
+        np.save(os.path.join(matrix_dir, VALUES_FILE), np.ascontiguousarray(self.values))
+        with open(os.path.join(matrix_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"aaRS_ids": self.aaRS_ids, "tRNA_ids": self.tRNA_ids, "terms": self.terms},
+                      f, ensure_ascii=False)
+
+    @property
+    def aaRS_index(self):
+        return {aaRS_id: i for i, aaRS_id in enumerate(self.aaRS_ids)}
+
+    @property
+    def tRNA_index(self):
+        return {tRNA_id: i for i, tRNA_id in enumerate(self.tRNA_ids)}
+
+    def term(self, name):
+        """返回某个 score 项的 (n_aaRS, n_tRNA) 视图"""
+        if name not in self.terms:
+            raise KeyError(f"score 项不存在: {name}，可用: {', '.join(self.terms)}")
+        return self.values[:, :, self.terms.index(name)]
+
+    def aaRS_mask(self, blocked_aaRSs=None):
+        """返回需要保留的 aaRS 行掩码（排除 block_list 中的蛋白）"""
+        blocked = set(blocked_aaRSs or ())
+        return np.array([aaRS_id not in blocked for aaRS_id in self.aaRS_ids], dtype=bool)
+
+    def trna_stats(self, term="total_score", blocked_aaRSs=None):
+        """
+        计算每个 tRNA 在所有（未排除的）aaRS 上的统计量
+
+        输出列与 candidate_tRNAs_filter.filter_candidate_trnas 一致，按平均 score 升序排列。
+        """
+        data = np.asarray(self.term(term)[self.aaRS_mask(blocked_aaRSs)])
+        present = ~np.isnan(data)
+        count = present.sum(axis=0)
+        keep = count > 0
+        data, present, count = data[:, keep], present[:, keep], count[keep]
+
+        total = np.where(present, data, 0.0).sum(axis=0)
+        mean = total / count
+        sq_dev = np.where(present, (data - mean) ** 2, 0.0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.where(count > 1, np.sqrt(sq_dev / (count - 1)), np.nan)
+
+        trna_stats = pd.DataFrame({
+            "trna_id": np.asarray(self.tRNA_ids, dtype=object)[keep],
+            "mean_score": mean,
+            "std_score": std,
+            "count": count,
+            "min_score": np.where(present, data, np.inf).min(axis=0),
+            "max_score": np.where(present, data, -np.inf).max(axis=0),
+        }).round(3)
+        return trna_stats.sort_values("mean_score")
+
+    def pivot(self, term="total_score"):
+        """返回 aaRS × tRNA 的透视表"""
+        return pd.DataFrame(np.asarray(self.term(term)), index=pd.Index(self.aaRS_ids, name="aaRS_id"),
+                            columns=pd.Index(self.tRNA_ids, name="tRNA_id"))
+
+    def compare(self, other, term="total_score", blocked_aaRSs=None, other_blocked_aaRSs=None):
+        """
+        比较两个方向（例如 Sf_in_Bm 与 Sf_in_Sf）中共同 tRNA 的平均 score
+
+        Returns:
+            pd.DataFrame: tRNA_id, mean_score, other_mean_score, delta（= mean_score - other_mean_score）
+        """
+        other_index = other.tRNA_index
+        common = [(i, other_index[tRNA_id]) for i, tRNA_id in enumerate(self.tRNA_ids) if tRNA_id in other_index]
+        if not common:
+            return pd.DataFrame(columns=["tRNA_id", "mean_score", "other_mean_score", "delta"])
+        self_idx, other_idx = (np.array(idx) for idx in zip(*common))
+
+        with np.errstate(invalid="ignore"):
+            self_mean = np.nanmean(np.asarray(self.term(term)[self.aaRS_mask(blocked_aaRSs)]), axis=0)
+            other_mean = np.nanmean(np.asarray(other.term(term)[other.aaRS_mask(other_blocked_aaRSs)]), axis=0)
+        comparison = pd.DataFrame({
+            "tRNA_id": np.asarray(self.tRNA_ids, dtype=object)[self_idx],
+            "mean_score": self_mean[self_idx],
+            "other_mean_score": other_mean[other_idx],
+        })
+        comparison["delta"] = comparison["mean_score"] - comparison["other_mean_score"]
+        return comparison.round(3).sort_values("delta")
+
+
+def read_block_list(block_list):
+    """读取 block_list 文件中的蛋白 ID"""
+    with open(block_list, "r", encoding="utf-8") as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="aaRS × tRNA score 矩阵存储")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="由 scores CSV 构建矩阵 bundle")
+    build_parser.add_argument("--scores_file", required=True, help="collect_scores.py 输出的 scores CSV 文件")
+    build_parser.add_argument("--out_dir", required=True, help="输出 bundle 目录")
+
+    stats_parser = subparsers.add_parser("stats", help="计算每个 tRNA 的统计量")
+    stats_parser.add_argument("--matrix_dir", required=True, help="矩阵 bundle 目录")
+    stats_parser.add_argument("--out_file", required=True, help="输出 CSV 文件")
+    stats_parser.add_argument("--term", default="total_score", help="score 项，默认 total_score")
+    stats_parser.add_argument("--block_list", help="包含需要排除的蛋白 ID 的文件路径")
+
+    compare_parser = subparsers.add_parser("compare", help="比较两个方向中共同 tRNA 的平均 score")
+    compare_parser.add_argument("--matrix_dir", required=True, help="矩阵 bundle 目录")
+    compare_parser.add_argument("--other_dir", required=True, help="用于比较的另一个矩阵 bundle 目录")
+    compare_parser.add_argument("--out_file", required=True, help="输出 CSV 文件")
+    compare_parser.add_argument("--term", default="total_score", help="score 项，默认 total_score")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        matrix = ScoreMatrix.from_scores(pd.read_csv(args.scores_file))
+        matrix.save(args.out_dir)
+        print(f"矩阵已保存到 {args.out_dir}: {len(matrix.aaRS_ids)} 个 aaRS × "
+              f"{len(matrix.tRNA_ids)} 个 tRNA × {len(matrix.terms)} 个 score 项")
+        return
+
+    matrix = ScoreMatrix.load(args.matrix_dir)
+    if args.command == "stats":
+        blocked = read_block_list(args.block_list) if args.block_list else None
+        result = matrix.trna_stats(args.term, blocked)
+    else:
+        result = matrix.compare(ScoreMatrix.load(args.other_dir), args.term)
+
+    out_dir = os.path.dirname(args.out_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    result.to_csv(args.out_file, index=False)
+    print(f"结果已保存到: {args.out_file}")
+
+
+if __name__ == "__main__":
+    main()
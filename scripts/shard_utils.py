@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按 ID 的稳定哈希把批量任务确定性地分配到多个节点
+
+各脚本的 --shard k/N 参数（k 从 1 开始）只处理哈希到第 k 个分片的项目：
+    collect_scores.py           按 sample_id（即 RNP ID）分片，输出 <out_file 主名>.shard{k}of{N}.csv
+    fasta_file_prepare.py       按 RNP ID（<aaRS_ID>_<tRNA_ID>）分片，RNP 列表写入 rnp_ids.shard{k}of{N}.txt
+    design_mutant_library.py    按 tRNA ID 分片，输出 <out_file 主名>.shard{k}of{N}.fasta
+
+分片由 ID 的 SHA-1 决定，与 Python 的 hash() 不同，不随进程和机器变化；
+同一个 RNP 在 fasta_file_prepare.py 和 collect_scores.py 中分到同一个分片。
+
+merge 子命令合并各分片的输出，并检查每个项目恰好出现一次：
+分片文件 1..N 齐全、项目没有重复、每个项目确实属于所在的分片；
+给出 --expected（每行一个 ID 的文件，或每个项目一个子目录的目录）时还检查没有遗漏或多余的项目。
+
+用法：
+    collect_scores.py --input_dir results --out_file scores.csv --shard 2/4
+    shard_utils.py merge scores --out scores.csv --expected results scores.shard*of4.csv
+    shard_utils.py merge rnp_ids --out work/rosetta/rnp_ids.txt work/rosetta/rnp_ids.shard*of4.txt
+    shard_utils.py merge library --out mutants.fasta mutants.shard*of4.fasta
+"""
+
+import os
+import re
+import sys
+import hashlib
+import argparse
+from collections import defaultdict
+
+SHARD_PATTERN = re.compile(r"\.shard(\d+)of(\d+)(?=\.|$)")
+
+
+def parse_shard(text):
+    """解析 "k/N"（1 <= k <= N），用作 argparse 的 type"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"分片格式应为 k/N，例如 1/4: {text}")
+    k, n = int(match.group(1)), int(match.group(2))
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError(f"分片编号应满足 1 <= k <= N: {text}")
+    return k, n
+
+
+def add_shard_argument(parser, item="项目"):
+    """为脚本的参数解析器添加 --shard 参数"""
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='k/N',
+                        help=f'只处理第 k 个分片（共 N 个，k 从 1 开始），按{item}的稳定哈希分配')
+    return parser
+
+
+def shard_of(item_id, n):
+    """项目所属的分片编号（1..n）"""
+    digest = hashlib.sha1(str(item_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n + 1
+
+
+def in_shard(item_id, shard):
+    """shard 为 None（不分片）时总是 True"""
+    return shard is None or shard_of(item_id, shard[1]) == shard[0]
+
+
+def select_shard(items, shard, key=None):
+    """保留属于 shard 的项目（保持原顺序）；key 从项目中取出 ID，默认为项目本身"""
+    if shard is None:
+        return list(items)
+    key = key or (lambda item: item)
+    return [item for item in items if in_shard(key(item), shard)]
+
+
+def shard_suffix(shard):
+    return f".shard{shard[0]}of{shard[1]}" if shard else ""
+
+
+def shard_path(path, shard):
+    """在扩展名前插入分片后缀：scores.csv -> scores.shard2of4.csv；不分片时原样返回"""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}{shard_suffix(shard)}{ext}"
+
+
+def parse_shard_path(path):
+    """从文件名中解析分片 (k, N)，没有分片后缀时返回 None"""
+    matches = SHARD_PATTERN.findall(os.path.basename(path))
+    return (int(matches[-1][0]), int(matches[-1][1])) if matches else None
+
+
+def read_expected_ids(path):
+    """--expected：每行一个 ID 的文件，或每个项目一个子目录的目录（如 collect_scores.py 的输入目录）"""
+    if os.path.isdir(path):
+        return {entry.split(".")[0] for entry in os.listdir(path) if os.path.isdir(os.path.join(path, entry))}
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def read_id_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def library_trna_id(record_id):
+    """突变体库记录 ID 中的 tRNA ID：<tRNA_ID>_original / <tRNA_ID>_mutant<i>"""
+    return record_id.rsplit("_", 1)[0]
+
+
+def check_coverage(shard_items, n, expected=None, unique_within_shard=True, allow_missing=False):
+    """
+    检查各分片的项目是否恰好覆盖一次
+
+    Args:
+        shard_items (dict[int, list[str]]): {分片编号: 该分片输出中的项目 ID}
+        n (int): 分片总数
+        expected (set[str] | None): 应覆盖的全部项目
+        unique_within_shard (bool): 同一分片内是否也不允许重复（scores 的 all_decoys 模式每个 sample 有多行）
+        allow_missing (bool): expected 中的项目没有输出时只作为警告
+
+    Returns:
+        tuple[list[str], list[str]]: (问题, 警告)，问题为空表示检查通过
+    """
+    problems = []
+    warnings = []
+    missing_shards = sorted(set(range(1, n + 1)) - set(shard_items))
+    if missing_shards:
+        problems.append(f"缺少分片: {', '.join(map(str, missing_shards))}（共 {n} 个）")
+
+    owners = defaultdict(list)
+    for k, items in shard_items.items():
+        ids = items if unique_within_shard else dict.fromkeys(items)
+        for item in ids:
+            owners[item].append(k)
+    duplicated = {item: ks for item, ks in owners.items() if len(ks) > 1}
+    if duplicated:
+        examples = ", ".join(f"{item}（分片 {'/'.join(map(str, ks))}）" for item, ks in list(duplicated.items())[:5])
+        problems.append(f"{len(duplicated)} 个项目重复出现: {examples}")
+
+    misplaced = [(item, ks[0]) for item, ks in owners.items() if shard_of(item, n) not in ks]
+    if misplaced:
+        examples = ", ".join(f"{item}（在分片 {k}，应在 {shard_of(item, n)}）" for item, k in misplaced[:5])
+        problems.append(f"{len(misplaced)} 个项目不属于所在分片: {examples}")
+
+    if expected is not None:
+        missing = sorted(expected - set(owners))
+        extra = sorted(set(owners) - expected)
+        if missing:
+            (warnings if allow_missing else problems).append(f"{len(missing)} 个项目没有输出: {', '.join(missing[:5])}")
+        if extra:
+            problems.append(f"{len(extra)} 个项目不在 --expected 中: {', '.join(extra[:5])}")
+    return problems, warnings
+
+
+def group_shard_files(paths):
+    """按文件名中的分片后缀整理输入文件，返回 ({k: path}, N)"""
+    by_shard = {}
+    totals = set()
+    for path in paths:
+        shard = parse_shard_path(path)
+        if shard is None:
+            raise ValueError(f"文件名中没有分片后缀 .shard<k>of<N>: {path}")
+        k, n = shard
+        if k in by_shard:
+            raise ValueError(f"分片 {k} 有多个文件: {by_shard[k]}, {path}")
+        by_shard[k] = path
+        totals.add(n)
+    if len(totals) != 1:
+        raise ValueError(f"输入文件的分片总数不一致: {', '.join(map(str, sorted(totals)))}")
+    return dict(sorted(by_shard.items())), totals.pop()
+
+
+def read_scores(by_shard):
+    import pandas as pd
+
+    def read(path):
+        # 没有任何 score 的分片输出是空文件
+        try:
+            return pd.read_csv(path)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+
+    tables = {k: read(path) for k, path in by_shard.items()}
+    items = {k: table["sample_id"].astype(str).tolist() if "sample_id" in table.columns else []
+             for k, table in tables.items()}
+    non_empty = [table for table in tables.values() if not table.empty]
+    merged = pd.concat(non_empty, ignore_index=True) if non_empty else pd.DataFrame()
+    return items, merged
+
+
+def read_library(by_shard):
+    from fasta_io import read_fasta
+    return {k: list(read_fasta(path)) for k, path in by_shard.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合并各分片的输出，并检查每个项目恰好出现一次')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    merge_parser = subparsers.add_parser('merge', help='合并分片输出')
+    merge_parser.add_argument('kind', choices=('scores', 'rnp_ids', 'library'),
+                              help='scores: collect_scores.py 的 CSV；rnp_ids: fasta_file_prepare.py 的 RNP 列表；'
+                                   'library: design_mutant_library.py 的 FASTA')
+    merge_parser.add_argument('inputs', nargs='+', help='各分片的输出文件（文件名带 .shard<k>of<N>）')
+    merge_parser.add_argument('--out', required=True, help='合并后的输出文件')
+    merge_parser.add_argument('--expected', help='应覆盖的全部 ID：每行一个 ID 的文件，或每个项目一个子目录的目录')
+    merge_parser.add_argument('--allow_missing', action='store_true',
+                              help='--expected 中的项目没有输出时只警告（例如 score_jd2 失败的样本）')
+    merge_parser.add_argument('--matrix_dir', help='scores：同时保存 aaRS × tRNA score 矩阵 bundle 的目录')
+    args = parser.parse_args()
+
+    try:
+        by_shard, n = group_shard_files(args.inputs)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"合并 {len(by_shard)} 个分片（共 {n} 个）")
+
+    merged = None
+    if args.kind == 'scores':
+        items, merged = read_scores(by_shard)
+        # --all_decoys 模式下同一个 sample 在分片内有多行
+        unique_within_shard = False
+    elif args.kind == 'rnp_ids':
+        items = {k: read_id_lines(path) for k, path in by_shard.items()}
+        unique_within_shard = True
+    else:
+        from fasta_io import fasta_id
+        records = read_library(by_shard)
+        record_ids = [fasta_id(title) for shard_records in records.values() for title, _ in shard_records]
+        if len(set(record_ids)) != len(record_ids):
+            print("错误: 突变体库中有重复的记录 ID", file=sys.stderr)
+            sys.exit(1)
+        items = {k: [library_trna_id(fasta_id(title)) for title, _ in shard_records]
+                 for k, shard_records in records.items()}
+        unique_within_shard = False
+
+    expected = read_expected_ids(args.expected) if args.expected else None
+    problems, warnings = check_coverage(items, n, expected, unique_within_shard, args.allow_missing)
+    for warning in warnings:
+        print(f"警告: {warning}", file=sys.stderr)
+    if problems:
+        for problem in problems:
+            print(f"错误: {problem}", file=sys.stderr)
+        print("分片覆盖检查未通过，没有写出合并结果", file=sys.stderr)
+        sys.exit(1)
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    n_items = len({item for shard_items in items.values() for item in shard_items})
+    if args.kind == 'scores':
+        merged.to_csv(args.out, index=False)
+        if args.matrix_dir and not merged.empty:
+            from score_matrix import ScoreMatrix, split_sample_ids
+            merged[['aaRS_id', 'tRNA_id']] = split_sample_ids(merged['sample_id'])
+            ScoreMatrix.from_scores(merged).save(args.matrix_dir)
+            print(f"score 矩阵已保存到: {args.matrix_dir}")
+    elif args.kind == 'rnp_ids':
+        tmp_path = f"{args.out}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{item}\n" for shard_items in items.values() for item in shard_items)
+        os.replace(tmp_path, args.out)
+    else:
+        from fasta_io import write_fasta
+        write_fasta(args.out, (record for shard_records in records.values() for record in shard_records))
+    print(f"覆盖检查通过: {n_items} 个项目，已保存到: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Rosetta silent 文件合并工具
+
+把同一个 RNP 的多个子任务（各自使用不同随机种子运行 rna_denovo）产生的 silent 文件
+合并为一个 default.out，结果与一次性串行运行 nstruct 个 decoy 的输出格式一致：
+
+    - 文件头（SEQUENCE 行、SCORE 表头行等第一个 decoy 之前的行）只保留第一个文件的
+    - 每个 decoy 的所有行（SCORE 行、坐标行、REMARK 行等）以 decoy 标签结尾，
+      合并时按顺序重新编号为 S_000001, S_000002, ...，避免不同子任务的标签重复
+
+使用方法：
+    from silent_files import merge_silent_files
+
+    n_decoys = merge_silent_files(["parts/part01/default.out", "parts/part02/default.out"], "default.out")
+
+extract_lowscore_decoys.py 把 silent 文件中 score 第 N 低的 decoy 提取为 <silent 文件>.N.pdb（如 default.out.1.pdb），
+PDB 中不记录 decoy 标签。extracted_pdb_tags 按 PDB 末尾的 score 项与 silent 文件的 SCORE 行匹配找回标签，
+只有 score 项不足以区分时才按排名确定：
+
+    tags = extracted_pdb_tags("results/<RNP>")  # {PDB 路径: 标签}，无法确定时为 None
+"""
+
+import os
+import re
+import math
+import glob
+
+TAG_FORMAT = "S_{:06d}"
+# extract_lowscore_decoys.py 的输出文件名：<silent 文件>.<排名>.pdb
+EXTRACTED_PDB = re.compile(r"^(?P<silent>.+)\.(?P<rank>\d+)\.pdb$")
+# extract_lowscore_decoys.py 默认按 score 排序
+RANK_TERMS = ("score", "total_score")
+
+
+def _is_score_header(fields):
+    """SCORE 表头行：第二列为列名（score）而不是数值"""
+    try:
+        float(fields[1])
+    except (IndexError, ValueError):
+        return True
+    return False
+
+
+def iter_decoys(path):
+    """
+    读取 silent 文件
+
+    Yields:
+        tuple[list[str], str, list[str]]: 第一次产出 (文件头行, None, [])，
+            之后每个 decoy 产出 ([], 标签, decoy 的所有行)
+    """
+    header, tag, lines = [], None, []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if fields and fields[0] == "SCORE:" and not _is_score_header(fields):
+                if tag is None:
+                    yield header, None, []
+                else:
+                    yield [], tag, lines
+                tag, lines = fields[-1], []
+            if tag is None:
+                header.append(line)
+            else:
+                lines.append(line)
+    if tag is None:
+        yield header, None, []
+    else:
+        yield [], tag, lines
+
+
+def _retag(line, old_tag, new_tag):
+    """替换行尾的 decoy 标签，保留原有的对齐和换行"""
+    stripped = line.rstrip("\n")
+    if not stripped.endswith(old_tag):
+        return line
+    return stripped[:-len(old_tag)] + new_tag + line[len(stripped):]
+
+
+def merge_silent_files(paths, out_file, tag_map=None):
+    """
+    合并多个 silent 文件，decoy 标签按顺序重新编号
+
+    先写入临时文件再重命名，中断或多个进程同时合并时不会留下不完整的 default.out。
+
+    Args:
+        paths (list[str]): 按子任务顺序排列的 silent 文件
+        out_file (str): 输出文件
+        tag_map (dict): 给出时填入 {(文件在 paths 中的序号, 原标签): 合并后的标签}
+
+    Returns:
+        int: 合并后的 decoy 数
+    """
+    tmp_file = f"{out_file}.tmp{os.getpid()}"
+    n_decoys = 0
+    with open(tmp_file, "w") as out:
+        for i, path in enumerate(paths):
+            for header, tag, lines in iter_decoys(path):
+                if tag is None:
+                    if i == 0:
+                        out.writelines(header)
+                    continue
+                n_decoys += 1
+                new_tag = TAG_FORMAT.format(n_decoys)
+                if tag_map is not None:
+                    tag_map[(i, tag)] = new_tag
+                out.writelines(_retag(line, tag, new_tag) for line in lines)
+    os.replace(tmp_file, out_file)
+    return n_decoys
+
+
+def read_silent_scores(path):
+    """
+    读取 silent 文件的 SCORE 行
+
+    Returns:
+        dict[str, dict[str, float]]: {decoy 标签: {score 项: 值}}，按文件中的顺序排列
+    """
+    columns, scores = None, {}
+    with open(path) as f:
+        for line in f:
+            if not line.startswith("SCORE:"):
+                continue
+            fields = line.split()
+            if _is_score_header(fields):
+                columns = fields[1:-1]
+                continue
+            values = {}
+            for name, value in zip(columns or (), fields[1:-1]):
+                try:
+                    values[name] = float(value)
+                except ValueError:
+                    pass
+            scores[fields[-1]] = values
+    return scores
+
+
+def read_pdb_score_terms(path):
+    """Rosetta 输出的 PDB 末尾每行一个的 "score 项 值"，没有时返回空字典"""
+    terms = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 2 or line.startswith(("ATOM", "HETATM", "REMARK")):
+                continue
+            try:
+                terms[fields[0]] = float(fields[1])
+            except ValueError:
+                pass
+    return terms
+
+
+def _same_scores(pdb_terms, decoy_scores):
+    shared = [name for name in decoy_scores if name in pdb_terms]
+    return bool(shared) and all(math.isclose(pdb_terms[name], decoy_scores[name], rel_tol=1e-6, abs_tol=2e-3)
+                                for name in shared)
+
+
+def match_extracted_pdb(pdb, rank, scores):
+    """
+    确定 extract_lowscore_decoys.py 提取的 PDB 对应的 decoy 标签
+
+    Args:
+        pdb (str): PDB 路径
+        rank (int): 文件名中的排名（从 1 开始）
+        scores (dict): read_silent_scores 的结果
+
+    Returns:
+        str | None: 标签；score 项和排名都无法唯一确定时返回 None
+    """
+    pdb_terms = read_pdb_score_terms(pdb)
+    candidates = [tag for tag, values in scores.items() if _same_scores(pdb_terms, values)]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    # score 项相同的 decoy 不止一个（或 PDB 中没有 score 项）：排名处的 score 唯一时按排名确定
+    term = next((name for name in RANK_TERMS if all(name in values for values in scores.values())), None)
+    if term is None or not 1 <= rank <= len(scores):
+        return None
+    ranked = sorted(scores, key=lambda tag: scores[tag][term])
+    tag = ranked[rank - 1]
+    ties = sum(1 for values in scores.values() if values[term] == scores[tag][term])
+    if ties == 1 and (not pdb_terms or tag in candidates):
+        return tag
+    return None
+
+
+def extracted_pdb_tags(sample_dir, silent_name="default.out"):
+    """
+    样本目录中已提取的 PDB 对应的 decoy 标签
+
+    <silent 文件>.N.pdb 按 match_extracted_pdb 匹配；文件名本身就是标签的 <tag>.pdb 直接对应。
+
+    Returns:
+        dict[str, str | None]: {PDB 路径: 标签}，无法确定时为 None
+    """
+    silent_file = os.path.join(sample_dir, silent_name)
+    scores = read_silent_scores(silent_file) if os.path.exists(silent_file) else {}
+    tags = {}
+    for pdb in sorted(glob.glob(os.path.join(sample_dir, "*.pdb"))):
+        name = os.path.basename(pdb)
+        extracted = EXTRACTED_PDB.match(name)
+        if name[:-len(".pdb")] in scores:
+            tags[pdb] = name[:-len(".pdb")]
+        elif extracted and extracted.group("silent") == silent_name:
+            tags[pdb] = match_extracted_pdb(pdb, int(extracted.group("rank")), scores)
+    return tags
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Slurm 任务打包：每个数组元素运行一组 RNP 任务
+
+slurm.sh 每个数组元素只运行一个 RNP，任务多时会大量占用调度器并超出数组大小限制（因此需要手动维护 OFFSET）。
+这里把任务数据库中的 pending 任务按估计耗时（见 runtime_model.py）分成若干组（bin），
+每组是一个数组元素：在一个节点上申请 tasks_per_node 个核，用本地进程池并行运行组内任务，
+rna_denovo 在节点本地临时目录中运行，结束后把输出移回结果目录。
+
+分组使用最长任务优先的贪心算法：任务按估计耗时从大到小依次放入当前负载最小的组，
+各组的估计完工时间（组内 tasks_per_node 个 worker 并行）尽量接近。
+
+分组方案保存为 JSON（bins 为任务 id 列表），数组元素只领取分给自己的 pending 任务，
+已被其他进程完成的任务会自动跳过，因此重新打包和重复提交都是安全的。
+
+用法：
+    # 只打印分组方案，不写文件（可离线测试）
+    slurm_packing.py --db work/rosetta/Sf_in_Bm/tasks.db --tasks_per_node 32 --dry_run
+
+    # 生成分组方案和 sbatch 脚本，并直接提交
+    slurm_packing.py --db work/rosetta/Sf_in_Bm/tasks.db --tasks_per_node 32 --bins 20 --submit
+"""
+
+import os
+import sys
+import json
+import math
+import heapq
+import argparse
+import subprocess
+from docking_db import TaskDB, PENDING
+from docking_scheduler import DEFAULT_NSTRUCT, update_cost_estimates, task_cost
+from runtime_model import simulate_makespan, longest_first
+from logger_utils import setup_logger
+
+# 未指定组数时，每组大约运行 tasks_per_node × DEFAULT_WAVES 个任务
+DEFAULT_WAVES = 4
+
+PACKED_SBATCH_TEMPLATE = """#!/bin/bash
+#SBATCH -J {job_name}
+#SBATCH -o {log_dir}/{job_name}_%A_%a.out
+#SBATCH -e {log_dir}/{job_name}_%A_%a.err
+#SBATCH -p {partition}
+#SBATCH -t {time_limit}
+#SBATCH -N 1
+#SBATCH -n 1
+#SBATCH -c {tasks_per_node}
+#SBATCH --mem={mem}
+#SBATCH --array=0-{last_bin}%{max_running}
+
+# 由 slurm_packing.py 根据任务数据库生成：{db}
+# 分组方案: {plan}
+# 每个数组元素在本节点上用 {tasks_per_node} 个 worker 并行运行分给它的任务，
+# rna_denovo 在节点本地临时目录中运行，结束后把输出移回结果目录。
+# module load rosetta
+
+SCRATCH="${{TMPDIR:-/tmp}}/{job_name}_${{SLURM_ARRAY_JOB_ID}}_${{SLURM_ARRAY_TASK_ID}}"
+mkdir -p "$SCRATCH"
+trap 'rm -rf "$SCRATCH"' EXIT
+
+cd {work_dir}
+{python} {script} run --db {db} --backend {worker_backend} --nstruct {nstruct} \\
+    --max_workers {tasks_per_node} --bin_plan {plan} --bin "$SLURM_ARRAY_TASK_ID" --scratch "$SCRATCH" \\
+    --keep_estimates
+"""
+
+
+def pack_tasks(costs, n_bins, tasks_per_node):
+    """
+    最长任务优先地把任务分到 n_bins 个组中，使各组的估计完工时间尽量接近
+
+    Args:
+        costs (dict): {task_id: 估计耗时}
+        n_bins (int): 组数
+        tasks_per_node (int): 每组内并行的 worker 数
+
+    Returns:
+        list[list[int]]: 每组的任务 id（组内按估计耗时从大到小排列）
+    """
+    n_bins = max(1, min(n_bins, len(costs)))
+    bins = [[] for _ in range(n_bins)]
+    # 每组内有 tasks_per_node 个 worker，按组的总耗时 / worker 数（不低于组内最长任务）比较负载
+    loads = [(0.0, 0.0, i) for i in range(n_bins)]
+    for task_id, cost in sorted(costs.items(), key=lambda item: (-item[1], item[0])):
+        _, total, i = heapq.heappop(loads)
+        bins[i].append(task_id)
+        total += cost
+        heapq.heappush(loads, (max(total / tasks_per_node, costs[bins[i][0]]), total, i))
+    return bins
+
+
+def describe_plan(bins, costs, tasks_per_node):
+    """
+    估计每组的完工时间
+
+    Returns:
+        list[dict]: 每组的 {bin, n_tasks, total_cost, makespan}
+    """
+    rows = []
+    for i, task_ids in enumerate(bins):
+        bin_costs = [costs[task_id] for task_id in task_ids]
+        rows.append({
+            "bin": i,
+            "n_tasks": len(task_ids),
+            "total_cost": sum(bin_costs),
+            "makespan": simulate_makespan(longest_first(bin_costs), tasks_per_node),
+        })
+    return rows
+
+
+def plan_bins(db, tasks_per_node, n_bins=None, max_array_size=None, default_nstruct=DEFAULT_NSTRUCT):
+    """
+    为数据库中的 pending 任务生成分组方案
+
+    Returns:
+        tuple[list[list[int]], dict, RuntimeModel]: (分组, {task_id: 估计耗时}, 运行时间模型)
+    """
+    model = update_cost_estimates(db, default_nstruct)
+    costs = {task["id"]: task["est_cost"] if task["est_cost"] is not None else task_cost(model, task, default_nstruct)
+             for task in db.tasks(PENDING)}
+    if not costs:
+        return [], costs, model
+    if n_bins is None:
+        n_bins = math.ceil(len(costs) / (tasks_per_node * DEFAULT_WAVES))
+    if max_array_size is not None:
+        n_bins = min(n_bins, max_array_size)
+    return pack_tasks(costs, n_bins, tasks_per_node), costs, model
+
+
+def write_plan(plan_path, db, bins, tasks_per_node):
+    """保存分组方案（数组元素用 docking_scheduler.read_bin 读取）"""
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump({"db": os.path.abspath(db.path), "tasks_per_node": tasks_per_node, "bins": bins}, f)
+
+
+def write_sbatch(script_path, db, plan_path, n_bins, tasks_per_node, max_running, nstruct=DEFAULT_NSTRUCT,
+                 partition="comput", time_limit="500:00:00", mem="32G", job_name="rna_denovo_packed",
+                 worker_backend="local"):
+    """生成打包作业的 sbatch 脚本"""
+    work_dir = os.getcwd()
+    log_dir = os.path.join(work_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    scheduler = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docking_scheduler.py")
+    with open(script_path, "w") as f:
+        f.write(PACKED_SBATCH_TEMPLATE.format(
+            job_name=job_name, log_dir=log_dir, partition=partition, time_limit=time_limit,
+            tasks_per_node=tasks_per_node, mem=mem, last_bin=n_bins - 1, max_running=max_running,
+            db=os.path.abspath(db.path), plan=os.path.abspath(plan_path), work_dir=work_dir,
+            python=sys.executable, script=scheduler, worker_backend=worker_backend, nstruct=nstruct,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slurm 任务打包：每个数组元素运行一组 RNP 任务')
+    parser.add_argument('--db', required=True, help='任务数据库路径')
+    parser.add_argument('--tasks_per_node', type=int, required=True, help='每个数组元素申请的核数（组内并行 worker 数）')
+    parser.add_argument('--bins', type=int,
+                        help=f'组数（数组大小），默认使每组约运行 tasks_per_node × {DEFAULT_WAVES} 个任务')
+    parser.add_argument('--max_array_size', type=int, help='集群允许的最大数组大小')
+    parser.add_argument('--max_running', type=int, default=20, help='同时运行的数组元素数上限，默认 20')
+    parser.add_argument('--nstruct', type=int, default=DEFAULT_NSTRUCT,
+                        help='数据库中没有记录 nstruct 的任务生成的 decoy 数')
+    parser.add_argument('--plan', help='分组方案 JSON 路径，默认为数据库同目录下的 pack_plan.json')
+    parser.add_argument('--script', help='sbatch 脚本路径，默认为数据库同目录下的 rna_denovo_packed.sbatch')
+    parser.add_argument('--partition', default='comput', help='Slurm 分区')
+    parser.add_argument('--time_limit', default='500:00:00', help='每个数组元素的时间限制')
+    parser.add_argument('--mem', default='32G', help='每个数组元素的内存')
+    parser.add_argument('--worker_backend', choices=['local', 'fake'], default='local', help='数组元素内部使用的后端')
+    parser.add_argument('--dry_run', action='store_true', help='只打印分组方案，不生成分组方案和 sbatch 脚本')
+    parser.add_argument('--submit', action='store_true', help='生成后直接用 sbatch 提交')
+    args = parser.parse_args()
+
+    logger = setup_logger(__file__)
+    db = TaskDB(args.db)
+    bins, costs, model = plan_bins(db, args.tasks_per_node, args.bins, args.max_array_size, args.nstruct)
+    if not bins:
+        logger.info("没有 pending 任务，无需打包")
+        return
+
+    unit = "秒" if model.fitted else "相对单位"
+    rows = describe_plan(bins, costs, args.tasks_per_node)
+    makespans = [row["makespan"] for row in rows]
+    logger.info(f"运行时间模型: {model.describe()}")
+    logger.info(f"{len(costs)} 个任务分为 {len(bins)} 组，每组 {args.tasks_per_node} 个 worker")
+    logger.info(f"{'组':>6}{'任务数':>8}{'总耗时':>16}{'估计完工时间':>16}")
+    for row in rows:
+        logger.info(f"{row['bin']:>6}{row['n_tasks']:>8}{row['total_cost']:>16.1f}{row['makespan']:>16.1f}")
+    logger.info(f"估计完工时间（{unit}）: 最长 {max(makespans):.1f}，最短 {min(makespans):.1f}，"
+                f"不均衡度 {max(makespans) / (sum(makespans) / len(makespans)) - 1:.1%}")
+    if args.dry_run:
+        return
+
+    db_dir = os.path.dirname(os.path.abspath(args.db))
+    plan_path = args.plan or os.path.join(db_dir, "pack_plan.json")
+    script_path = args.script or os.path.join(db_dir, "rna_denovo_packed.sbatch")
+    write_plan(plan_path, db, bins, args.tasks_per_node)
+    write_sbatch(script_path, db, plan_path, len(bins), args.tasks_per_node, args.max_running, args.nstruct,
+                 args.partition, args.time_limit, args.mem, worker_backend=args.worker_backend)
+    logger.info(f"分组方案: {plan_path}")
+    logger.info(f"已生成 Slurm 数组作业脚本: {script_path}（{len(bins)} 个数组元素）")
+    if args.submit:
+        result = subprocess.run(["sbatch", script_path], capture_output=True, text=True, check=True)
+        logger.info(f"已提交: {result.stdout.strip()}")
+    else:
+        logger.info(f"使用命令 'sbatch {script_path}' 提交作业")
+
+
+if __name__ == '__main__':
+    main()
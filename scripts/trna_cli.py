@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+统一命令行入口：trna <子命令> [参数]
+
+每个子命令对应 scripts/ 下的一个脚本，参数与直接运行该脚本完全相同（包括 --help）。
+脚本模块只在执行对应子命令时才导入，因此 trna --help 和轻量子命令（例如 name-map、pipeline）
+不会加载 pandas、numpy、Biopython、seaborn/matplotlib 等重型库。
+启动时间可以用 benchmarks.py startup 检查。
+
+用法：
+    pixi run trna --help
+    pixi run trna collect-scores --input_dir work/rosetta/Sf_in_Bm/results --out_file scores.csv
+    python scripts/trna_cli.py name-map -i bmo-tRNAs.ss -o bmo-tRNAs-name_map.txt
+"""
+
+import sys
+import importlib
+import typer
+
+# 子命令 -> (模块名, 说明)；模块在执行子命令时才导入
+COMMANDS = {
+    "name-map": ("generate_trna_name_map", "生成 tRNA 名称映射文件"),
+    "orthogonal-score": ("trna_orthogonal_score", "计算 tRNA 的正交得分"),
+    "prepare-inputs": ("fasta_file_prepare", "生成 tRNA-aaRS 复合物结构预测的输入文件"),
+    "docking": ("docking_scheduler", "可续跑的 rna_denovo 任务调度器"),
+    "pack": ("slurm_packing", "Slurm 任务打包"),
+    "adaptive": ("adaptive_docking", "自适应 RNP 对接"),
+    "collect-scores": ("collect_scores", "收集结构预测的 score"),
+    "compact": ("compact_results", "对接结果压缩归档"),
+    "score-matrix": ("score_matrix", "aaRS × tRNA score 矩阵存储"),
+    "filter-candidates": ("candidate_tRNAs_filter", "筛选候选 tRNA"),
+    "contacts": ("interface_contacts", "tRNA-aaRS 界面接触分析"),
+    "clusters": ("decoy_clusters", "按 RMSD 对 decoy 聚类"),
+    "plot-scores": ("plot_scores", "绘制 score 散点图"),
+    "mutant-library": ("design_mutant_library", "设计 tRNA 反密码子突变体库"),
+    "fasta": ("fasta_io", "FASTA 索引和按 ID 读取序列"),
+    "shard": ("shard_utils", "合并分片输出并检查覆盖"),
+    "pipeline": ("pipeline", "按内容哈希缓存的流程运行器"),
+    "profile": ("profile_utils", "查看性能分析结果"),
+    "benchmarks": ("benchmarks", "性能基准测试"),
+}
+
+# 参数原样交给脚本的 argparse 处理（包括 --help）
+PASSTHROUGH = {"allow_extra_args": True, "ignore_unknown_options": True, "help_option_names": []}
+
+app = typer.Typer(
+    name="trna",
+    help="正交 tRNA 分析流程的命令行工具，`trna <子命令> --help` 查看各子命令的参数",
+    no_args_is_help=True,
+    add_completion=False,
+)
+
+
+def run_script(name, module_name, args):
+    """导入脚本模块并以 args 作为命令行参数运行其 main()"""
+    sys.argv = [f"trna {name}", *args]
+    importlib.import_module(module_name).main()
+
+
+def _make_command(name, module_name):
+    def command(ctx: typer.Context):
+        run_script(name, module_name, ctx.args)
+    return command
+
+
+for _name, (_module, _help) in COMMANDS.items():
+    app.command(name=_name, help=_help, context_settings=PASSTHROUGH, add_help_option=False)(
+        _make_command(_name, _module)
+    )
+
+
+if __name__ == '__main__':
+    app(prog_name="trna")
@@ -4,6 +4,8 @@ import argparse
 import pandas as pd
 import numpy as np
 import os
+from logger_utils import stage
+from profile_utils import add_profile_arguments, start_profiling
 
 @dataclass
 class tRNARecord:
@@ -136,7 +138,9 @@ def main():
     parser.add_argument("-t", "--target", required=True, help="目标物种的tRNA的Stockholm文件路径")
     parser.add_argument("-o", "--output", required=True, help="输出文件路径")
     parser.add_argument("-e", "--identity_elements", required=True, help="identity_elements.txt文件路径")
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling(args, __file__)
 
     query_stk_file = args.query
     target_stk_file = args.target
@@ -147,27 +151,31 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     # 读取identity_elements.txt文件
-    identity_elements = phase_identity_elements(identity_elements_file)
+    with stage("读取输入", "trna_orthogonal_score"):
+        identity_elements = phase_identity_elements(identity_elements_file)
 
-    # 读取Stockholm文件
-    query_alignments = Align.parse(query_stk_file, "stockholm")
-    target_alignments = Align.parse(target_stk_file, "stockholm")
-    query_alignment = next(query_alignments)
-    target_alignment = next(target_alignments)
+        # 读取Stockholm文件
+        query_alignments = Align.parse(query_stk_file, "stockholm")
+        target_alignments = Align.parse(target_stk_file, "stockholm")
+        query_alignment = next(query_alignments)
+        target_alignment = next(target_alignments)
 
     # 解析alignment
-    query_tRNARecords = parse_alignment(query_alignment, identity_elements)
-    target_tRNARecords = parse_alignment(target_alignment, identity_elements)
+    with stage("解析 alignment", "trna_orthogonal_score"):
+        query_tRNARecords = parse_alignment(query_alignment, identity_elements)
+        target_tRNARecords = parse_alignment(target_alignment, identity_elements)
 
     # 计算正交得分
-    orthogonal_scores = calculate_orthogonal_score(query_tRNARecords, target_tRNARecords)
-    orthogonal_scores_wide = orthogonal_scores.pivot(index='query_id', columns='target_amino_acid_type', values='orthogonal_score')
+    with stage("计算正交得分", "trna_orthogonal_score"):
+        orthogonal_scores = calculate_orthogonal_score(query_tRNARecords, target_tRNARecords)
+        orthogonal_scores_wide = orthogonal_scores.pivot(index='query_id', columns='target_amino_acid_type', values='orthogonal_score')
 
     # 输出正交得分
     orthogonal_scores_wide.to_csv(output_dir + "/orthogonal_scores.csv")
 
     # 筛选候选tRNA - 筛选出tRNA所属氨基酸类型的正交得分小于0的tRNA。
-    candidate_tRNAs = filter_orthogonal_scores(orthogonal_scores_wide)
+    with stage("筛选候选 tRNA", "trna_orthogonal_score"):
+        candidate_tRNAs = filter_orthogonal_scores(orthogonal_scores_wide)
 
     # 输出结果
     candidate_tRNAs.to_csv(output_dir + "/candidate_tRNAs.csv")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+tRNA 二级结构工具
+
+根据点括号结构定位发夹环和反密码子。tRNAscan-SE 的 Str: 行使用 ">" / "<" 表示配对，
+fasta_file_prepare.py 生成的 rna_denovo 结构文件使用 "(" / ")"，这里两种写法都支持。
+
+使用方法：
+    from trna_structure import find_anticodon
+
+    start = find_anticodon(sequence, structure, "ATT")  # 反密码子第一个碱基的位置（从 0 开始）
+"""
+
+# 反密码子位于 7 nt 反密码子环的第 3-5 位
+ANTICODON_OFFSET = 2
+ANTICODON_LOOP_LENGTH = 7
+
+
+def normalize_structure(structure):
+    """把 tRNAscan-SE 的 ">" / "<" 写法转换为 "(" / ")"，其余字符视为不配对"""
+    return "".join("(" if c in "(>" else ")" if c in ")<" else "." for c in structure)
+
+
+def hairpin_loops(structure):
+    """
+    返回所有发夹环（两侧分别为 "(" 和 ")" 的连续不配对区域）
+
+    Returns:
+        list[tuple[int, int]]: [(环起点, 环终点（不含）), ...]，按位置排列
+    """
+    structure = normalize_structure(structure)
+    loops = []
+    start = None
+    for i, c in enumerate(structure):
+        if c == ".":
+            if start is None:
+                start = i
+            continue
+        if start is not None and c == ")" and start > 0 and structure[start - 1] == "(":
+            loops.append((start, i))
+        start = None
+    return loops
+
+
+def _rna(sequence):
+    return sequence.upper().replace("T", "U")
+
+
+def find_anticodon(sequence, structure, anticodon=None):
+    """
+    定位反密码子
+
+    优先选择第 3-5 位与给定反密码子一致的发夹环；没有给出反密码子或找不到一致的环时，
+    有三个以上发夹环的取第二个（三叶草结构的反密码子臂），否则返回 None。
+
+    Args:
+        sequence (str): tRNA 序列（DNA 或 RNA 字母，大小写均可）
+        structure (str): 与序列等长的点括号结构
+        anticodon (str): 反密码子序列，例如 tRNA ID 中的 "ATT"
+
+    Returns:
+        int | None: 反密码子第一个碱基的位置（从 0 开始）
+    """
+    if len(sequence) != len(structure):
+        return None
+    loops = [(start, end) for start, end in hairpin_loops(structure) if end - start >= ANTICODON_OFFSET + 3]
+    if anticodon:
+        target = _rna(anticodon)
+        rna = _rna(sequence)
+        # (不是 7 nt 的环, 起点)：7 nt 的环优先
+        candidates = [(end - start != ANTICODON_LOOP_LENGTH, start) for start, end in loops
+                      if rna[start + ANTICODON_OFFSET:start + ANTICODON_OFFSET + 3] == target]
+        if candidates:
+            return min(candidates)[1] + ANTICODON_OFFSET
+    if len(loops) >= 3:
+        return loops[1][0] + ANTICODON_OFFSET
+    return None
+
+
+def anticodon_from_trna_id(tRNA_id):
+    """从 tRNA ID（例如 tRNA-Asn-ATT-1）中取出反密码子，格式不符时返回 None"""
+    parts = tRNA_id.split("-")
+    if len(parts) >= 3 and len(parts[2]) == 3 and set(parts[2].upper()) <= set("ACGTU"):
+        return parts[2]
+    return None